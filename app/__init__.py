@@ -26,11 +26,6 @@ def create_app(config_class=BaseConfig):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
-    # 确保上传目录存在
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    os.makedirs(app.config['AVATAR_FOLDER'], exist_ok=True)
-    os.makedirs(app.config['ADMIN_KEY_FOLDER'], exist_ok=True)
-    
     # 初始化扩展
     db.init_app(app)
     login_manager.init_app(app)
@@ -53,9 +48,30 @@ def create_app(config_class=BaseConfig):
     from app.routes.users import users as users_bp
     app.register_blueprint(users_bp, url_prefix='/user')
     
+    # 注册同步客户端蓝图
+    from app.routes.sync import sync as sync_bp
+    app.register_blueprint(sync_bp, url_prefix='/sync')
+    
+    # 注册分享链接蓝图
+    from app.routes.share import share as share_bp
+    app.register_blueprint(share_bp, url_prefix='/share')
+    
+    # 注册带指纹的静态资源蓝图，并构建/加载资源清单
+    from app.routes.assets import assets as assets_bp
+    app.register_blueprint(assets_bp, url_prefix='/assets')
+    from app.assets import init_app as init_assets
+    init_assets(app)
+    
+    # 读取管理员密钥文件的摘要（只在启动时读取一次）
+    from app.adminauth import init_app as init_admin_auth
+    init_admin_auth(app)
+    
+    # 注册命令行工具
+    from app.commands import register_commands
+    register_commands(app)
     
-    # 创建数据库表
-    with app.app_context():
-        db.create_all()
+    # 检查数据库结构版本（只查询 schema_version，建表和升级由 initdb.py / flask db-upgrade 完成）
+    from app.migrations import init_app as init_migrations
+    init_migrations(app)
     
     return app
\ No newline at end of file
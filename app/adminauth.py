@@ -0,0 +1,154 @@
+import os
+import hmac
+import time
+import uuid
+import hashlib
+import threading
+from datetime import datetime
+from flask import current_app, session, g
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from app import db
+from app.models import AdminSession
+from app.config import BaseConfig as Config
+
+# 管理员会话
+#
+# 通过密钥文件验证后签发一个带时间戳的签名令牌，保存在登录会话（cookie）中：
+#   u: 用户ID  sid: 会话ID（admin_session 表的主键）  k: 签发时密钥的指纹
+# 之后的管理页面只在内存中校验签名、有效期（ADMIN_SESSION_DURATION）、用户、密钥指纹和撤销列表，
+# 不写数据库，也不读取密钥文件。只有签发、退出和撤销会写 admin_session 表。
+# 撤销列表按 ADMIN_SESSION_REVOCATION_TTL 定期从表中刷新：本进程中的撤销立即生效，其他进程最迟一个周期后生效。
+# 密钥文件的 SHA-256 摘要在启动时读取一次（文件还不存在时，在下一次验证密钥时再读取），
+# 与上传文件的摘要做常数时间比较；更换密钥文件后重新加载服务，旧密钥签发的会话随指纹变化全部失效。
+
+
+SESSION_KEY = 'admin_session'
+
+_key = {'digest': None}
+_key_lock = threading.Lock()
+
+
+def _load_key():
+    with _key_lock:
+        if _key['digest'] is not None:
+            return
+        path = os.path.join(Config.ADMIN_KEY_FOLDER, Config.ADMIN_KEY_FILENAME)
+        try:
+            with open(path, 'rb') as f:
+                _key['digest'] = hashlib.sha256(f.read()).digest()
+        except OSError as e:
+            current_app.logger.warning(f'无法读取管理员密钥文件 {path}: {e.strerror}')
+
+def init_app(app):
+    with app.app_context():
+        _load_key()
+
+# 密钥指纹（不泄露摘要本身）；密钥未加载时为 None，所有令牌都无效
+def _fingerprint():
+    digest = _key['digest']
+    if digest is None:
+        return None
+    return hashlib.sha256(b'admin-session:' + digest).hexdigest()[:16]
+
+# 校验上传的密钥文件
+def verify_key(stream):
+    if _key['digest'] is None:
+        _load_key()
+    expected = _key['digest']
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(64 * 1024), b''):
+        digest.update(chunk)
+    return expected is not None and hmac.compare_digest(digest.digest(), expected)
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='admin-session')
+
+
+# 撤销列表：只缓存未过期的已撤销会话ID，按TTL定期刷新（每个进程每个周期一次查询）
+class RevocationCache:
+    def __init__(self):
+        self._ids = frozenset()
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def is_revoked(self, sid):
+        if time.time() - self._loaded_at > Config.ADMIN_SESSION_REVOCATION_TTL:
+            self.refresh()
+        return sid in self._ids
+
+    def refresh(self):
+        with self._lock:
+            if time.time() - self._loaded_at <= Config.ADMIN_SESSION_REVOCATION_TTL:
+                return
+            rows = db.session.query(AdminSession.id).filter(
+                AdminSession.revoked_at.isnot(None), AdminSession.expires_at > datetime.utcnow()).all()
+            self._ids = frozenset(row[0] for row in rows)
+            self._loaded_at = time.time()
+
+    def add(self, sids):
+        self._ids = self._ids | set(sids)
+
+revocations = RevocationCache()
+
+
+# 签发管理员会话（同时清理已过期的会话记录）
+def start_session(user, ip=None):
+    now = datetime.utcnow()
+    AdminSession.query.filter(AdminSession.expires_at < now).delete(synchronize_session=False)
+    sid = uuid.uuid4().hex
+    db.session.add(AdminSession(id=sid, user_id=user.id, created_at=now,
+                                expires_at=now + Config.ADMIN_SESSION_DURATION, ip=ip))
+    db.session.commit()
+    session[SESSION_KEY] = _serializer().dumps({'u': user.id, 'sid': sid, 'k': _fingerprint()})
+    return sid
+
+# 当前请求的管理员会话载荷，无效时返回 None（结果在请求内缓存）
+def current_session(user_id):
+    if 'admin_session' in g:
+        return g.admin_session
+    payload = None
+    token = session.get(SESSION_KEY)
+    if token:
+        try:
+            payload = _serializer().loads(token, max_age=Config.ADMIN_SESSION_DURATION.total_seconds())
+        except BadSignature:  # 包括已过期（SignatureExpired）
+            payload = None
+        if payload and (payload['u'] != user_id or payload['k'] != _fingerprint()
+                        or revocations.is_revoked(payload['sid'])):
+            payload = None
+    g.admin_session = payload
+    return payload
+
+# 撤销会话，返回撤销的数量；sids 和 user_id 都为空时撤销全部
+def revoke(sids=None, user_id=None):
+    query = AdminSession.query.filter(AdminSession.revoked_at.is_(None),
+                                      AdminSession.expires_at > datetime.utcnow())
+    if sids is not None:
+        query = query.filter(AdminSession.id.in_(sids))
+    if user_id is not None:
+        query = query.filter(AdminSession.user_id == user_id)
+    ids = [row[0] for row in query.with_entities(AdminSession.id)]
+    if ids:
+        AdminSession.query.filter(AdminSession.id.in_(ids)).update(
+            {'revoked_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        revocations.add(ids)
+    return len(ids)
+
+# 退出管理员模式：撤销当前会话并从 cookie 中移除令牌
+def end_session():
+    token = session.pop(SESSION_KEY, None)
+    g.pop('admin_session', None)
+    if token:
+        try:
+            payload = _serializer().loads(token)
+        except BadSignature:
+            return
+        revoke([payload['sid']])
+
+def active_sessions():
+    return AdminSession.query.filter(AdminSession.revoked_at.is_(None),
+                                     AdminSession.expires_at > datetime.utcnow()) \
+        .order_by(AdminSession.created_at.desc()).all()
@@ -0,0 +1,444 @@
+import io
+import os
+import json
+import gzip
+import tarfile
+import zipfile
+import tempfile
+from contextlib import closing, contextmanager
+from datetime import datetime
+from app import db
+from app.models import File, Folder, ArchiveIndex
+from app.config import BaseConfig as Config
+from app.journal import record_change
+from app.storage import get_storage, storage_key, HashingReader
+from app.storage.base import CHUNK_SIZE
+from app.trash import free_name
+from app.quotas import reserve, release, adjust, available_bytes
+from app.foldersize import rebuild, move_totals
+
+# 压缩包浏览
+#
+# 成员列表在第一次浏览时生成并缓存在 ArchiveIndex 中（以存储标识判断是否过期）。
+# 读取单个成员时不解压整个压缩包：
+#   zip      通过中央目录定位，只读取该成员的数据（远程存储使用范围请求）
+#   tar      索引中记录了成员数据的偏移，直接按范围读取
+#   tar.gz   只能顺序解压，读到该成员为止
+#   gz       单个文件，流式解压
+#   7z       依赖 py7zr，只解出该成员到临时目录再发送（写入时限制字节数，见 _extract_7z_member）
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def archive_format(filename):
+    name = filename.lower()
+    if name.endswith('.zip'):
+        return 'zip'
+    if name.endswith('.tar'):
+        return 'tar'
+    if name.endswith('.tar.gz') or name.endswith('.tgz'):
+        return 'tgz'
+    if name.endswith('.gz'):
+        return 'gz'
+    if name.endswith('.7z'):
+        return '7z'
+    return None
+
+
+# 以范围请求实现的只读可定位文件，供 zipfile / tarfile / py7zr 随机访问远程对象
+class RangeFile(io.RawIOBase):
+    def __init__(self, storage, key, size):
+        self.storage = storage
+        self.key = key
+        self.size = size
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = max(0, offset)
+        return self.pos
+
+    def readinto(self, buffer):
+        if self.pos >= self.size:
+            return 0
+        end = min(self.size, self.pos + len(buffer)) - 1
+        n = 0
+        for chunk in self.storage.iter_range(self.key, self.pos, end):
+            buffer[n:n + len(chunk)] = chunk
+            n += len(chunk)
+        self.pos += n
+        return n
+
+# 打开可随机访问的文件对象：本地文件直接打开，远程对象加一层缓冲减少请求数
+def open_seekable(storage, key):
+    path = storage.local_path(key)
+    if path:
+        return open(path, 'rb')
+    obj = storage.stat(key)
+    if obj is None:
+        raise FileNotFoundError(key)
+    return io.BufferedReader(RangeFile(storage, key, obj.size), buffer_size=CHUNK_SIZE)
+
+def _import_py7zr():
+    try:
+        import py7zr
+    except ImportError:
+        raise ArchiveError('服务器未安装 py7zr，无法读取 7z 压缩包: pip install py7zr')
+    return py7zr
+
+
+# 成员: n 名称  s 大小  d 是否目录  o 数据偏移（仅 tar）
+def _list_members(fmt, storage, key, filename):
+    members = []
+    if fmt == 'zip':
+        with open_seekable(storage, key) as f, zipfile.ZipFile(f) as zf:
+            for info in zf.infolist():
+                members.append({'n': info.filename, 's': info.file_size, 'd': info.is_dir()})
+    elif fmt == 'tar':
+        with open_seekable(storage, key) as f, tarfile.open(fileobj=f, mode='r:') as tf:
+            for info in tf:
+                if info.isdir() or info.isreg():
+                    members.append({'n': info.name, 's': info.size, 'd': info.isdir(), 'o': info.offset_data})
+    elif fmt == 'tgz':
+        with closing(storage.open(key)) as raw, tarfile.open(fileobj=raw, mode='r|gz') as tf:
+            for info in tf:
+                if info.isdir() or info.isreg():
+                    members.append({'n': info.name, 's': info.size, 'd': info.isdir()})
+    elif fmt == 'gz':
+        # gzip 尾部 4 字节为原始大小（模 2^32）
+        obj = storage.stat(key)
+        size = None
+        if obj and obj.size >= 4:
+            tail = b''.join(storage.iter_range(key, obj.size - 4, obj.size - 1))
+            size = int.from_bytes(tail, 'little')
+        members.append({'n': filename[:-3] or 'data', 's': size, 'd': False})
+    elif fmt == '7z':
+        py7zr = _import_py7zr()
+        with open_seekable(storage, key) as f, py7zr.SevenZipFile(f, 'r') as zf:
+            for info in zf.list():
+                members.append({'n': info.filename, 's': info.uncompressed, 'd': info.is_directory})
+    if len(members) > Config.ARCHIVE_MAX_MEMBERS:
+        raise ArchiveError(f'压缩包成员超过 {Config.ARCHIVE_MAX_MEMBERS} 个，无法浏览')
+    return members
+
+
+# 获取成员索引（带缓存），返回 (格式, 成员列表)
+def get_index(file):
+    fmt = archive_format(file.filename)
+    if fmt is None:
+        raise ArchiveError('不支持的压缩包格式')
+    storage = get_storage()
+    obj = storage.stat(file.filepath)
+    if obj is None:
+        raise FileNotFoundError(file.filepath)
+
+    index = db.session.get(ArchiveIndex, file.id)
+    if index and index.etag == obj.etag:
+        return index.format, json.loads(index.members)
+
+    try:
+        members = _list_members(fmt, storage, file.filepath, file.filename)
+    except (zipfile.BadZipFile, tarfile.TarError, gzip.BadGzipFile, EOFError) as e:
+        raise ArchiveError(f'压缩包已损坏或格式不正确: {e}')
+    if index is None:
+        index = ArchiveIndex(file_id=file.id)
+        db.session.add(index)
+    index.etag = obj.etag
+    index.format = fmt
+    index.member_count = len(members)
+    index.total_size = sum(m['s'] or 0 for m in members)
+    index.members = json.dumps(members, ensure_ascii=False, separators=(',', ':'))
+    index.created_at = datetime.utcnow()
+    db.session.commit()
+    return fmt, members
+
+
+def _find_member(members, name):
+    for member in members:
+        if member['n'] == name and not member['d']:
+            return member
+    raise ArchiveError(f'压缩包中没有文件 "{name}"')
+
+def _iter_stream(f):
+    try:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+# 流式读取单个成员，返回 (大小, 数据块迭代器)
+def open_member(file, name):
+    fmt, members = get_index(file)
+    member = _find_member(members, name)
+    storage = get_storage()
+    key = file.filepath
+
+    if fmt == 'tar':
+        if member['s'] == 0:
+            return 0, iter(())
+        start = member['o']
+        return member['s'], storage.iter_range(key, start, start + member['s'] - 1)
+
+    if fmt == 'zip':
+        def generate():
+            with open_seekable(storage, key) as f, zipfile.ZipFile(f) as zf:
+                yield from _iter_stream(zf.open(name))
+        return member['s'], generate()
+
+    if fmt == 'tgz':
+        def generate():
+            with closing(storage.open(key)) as raw, tarfile.open(fileobj=raw, mode='r|gz') as tf:
+                for info in tf:
+                    if info.name == name and info.isreg():
+                        yield from _iter_stream(tf.extractfile(info))
+                        return
+        return member['s'], generate()
+
+    if fmt == 'gz':
+        def generate():
+            with closing(storage.open(key)) as raw:
+                yield from _iter_stream(gzip.GzipFile(fileobj=raw))
+        return None, generate()
+
+    py7zr = _import_py7zr()
+    def generate():
+        with tempfile.TemporaryDirectory() as tmp:
+            with open_seekable(storage, key) as f, py7zr.SevenZipFile(f, 'r') as zf:
+                if name not in _7z_file_names(zf):
+                    return
+                paths, _ = _extract_7z_member(zf, name, tmp, Config.ARCHIVE_EXTRACT_MAX_BYTES)
+            for path in paths[:1]:
+                with open(path, 'rb') as out:
+                    yield from _iter_stream(out)
+    return member['s'], generate()
+
+
+def _safe_parts(name):
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.', '..')]
+    return parts
+
+
+# 解压时限制实际写入的字节数（压缩包声明的大小不可信）
+class _LimitedReader:
+    def __init__(self, stream, budget):
+        self.stream = stream
+        self.budget = budget
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.count += len(data)
+        if self.count > self.budget:
+            raise ArchiveError('解压后的数据超过大小上限')
+        return data
+
+
+# py7zr 的写入工厂：成员内容写到临时目录中由我们创建的普通文件，
+# 写入过程中累计字节数，超过预算立即中止，不等解压完再按声明的大小检查
+class _BudgetWriter:
+    def __init__(self, factory, path):
+        self.factory = factory
+        self.file = open(path, 'wb')
+        self.written = 0
+
+    def write(self, data):
+        self.factory.remaining -= len(data)
+        if self.factory.remaining < 0:
+            raise ArchiveError('解压后的数据超过大小上限')
+        self.written += len(data)
+        return self.file.write(data)
+
+    def read(self, size=None):
+        return b''
+
+    def seek(self, offset, whence=0):
+        return self.file.seek(offset, whence)
+
+    def flush(self):
+        self.file.flush()
+
+    def size(self):
+        return self.written
+
+    def close(self):
+        self.file.close()
+
+
+class _BudgetWriterFactory:
+    def __init__(self, root, budget):
+        self.root = root
+        self.remaining = budget
+        self.writers = []
+
+    def create(self, filename):
+        writer = _BudgetWriter(self, os.path.join(self.root, f'{len(self.writers)}.member'))
+        self.writers.append(writer)
+        return writer
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+# 解出 7z 的单个成员到 tmp，返回 (临时文件路径列表, 写入的字节数)；
+# 符号链接等非普通文件不解出，写入字节数超过 budget 时抛出 ArchiveError
+def _extract_7z_member(zf, name, tmp, budget):
+    factory = _BudgetWriterFactory(tmp, budget)
+    zf.reset()
+    try:
+        zf.extract(path=tmp, targets=[name], factory=factory)
+    finally:
+        factory.close()
+    paths = [w.file.name for w in factory.writers if not os.path.islink(w.file.name)]
+    return paths, budget - factory.remaining
+
+def _7z_file_names(zf):
+    return [info.filename for info in zf.list() if not info.is_directory and not info.is_symlink]
+
+
+# 依次产生 (成员名, 可读流)，不在内存中保存成员内容
+# 7z 逐个成员解出到临时目录，tmp 中同时只有一个成员，写入的总字节数不超过 budget
+def _iter_member_streams(fmt, storage, key, filename, tmp, budget):
+    if fmt == 'zip':
+        with open_seekable(storage, key) as f, zipfile.ZipFile(f) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    with zf.open(info) as member:
+                        yield info.filename, member
+    elif fmt in ('tar', 'tgz'):
+        with closing(storage.open(key)) as raw, tarfile.open(fileobj=raw, mode='r|*') as tf:
+            for info in tf:
+                if info.isreg():
+                    yield info.name, tf.extractfile(info)
+    elif fmt == 'gz':
+        with closing(storage.open(key)) as raw:
+            yield filename[:-3] or 'data', gzip.GzipFile(fileobj=raw)
+    else:
+        py7zr = _import_py7zr()
+        with open_seekable(storage, key) as f, py7zr.SevenZipFile(f, 'r') as zf:
+            for name in _7z_file_names(zf):
+                paths, written = _extract_7z_member(zf, name, tmp, budget)
+                budget -= written
+                for path in paths:
+                    with open(path, 'rb') as member:
+                        yield name, member
+                    os.remove(path)
+
+
+@contextmanager
+def _commit_on_exit():
+    try:
+        yield
+    finally:
+        db.session.commit()
+
+
+# 后台任务：把压缩包解压到同级的新文件夹中
+# 成员数和解压总字节数都有上限；不允许的文件类型和非法路径跳过
+def extract_archive(job, file_id, user_id):
+    file = File.query.filter_by(id=file_id, user_id=user_id).first()
+    if file is None:
+        raise ArchiveError('文件不存在')
+    fmt, members = get_index(file)
+    files_in_archive = [m for m in members if not m['d']]
+    if len(files_in_archive) > Config.ARCHIVE_EXTRACT_MAX_MEMBERS:
+        raise ArchiveError(f'压缩包成员超过 {Config.ARCHIVE_EXTRACT_MAX_MEMBERS} 个，无法解压')
+    declared = sum(m['s'] or 0 for m in files_in_archive)
+    if declared > Config.ARCHIVE_EXTRACT_MAX_BYTES:
+        raise ArchiveError('压缩包解压后超过大小上限')
+    # 按成员声明的总大小预留配额；有配额限制的用户实际解压的字节数不能超过预留
+    if not reserve(user_id, declared):
+        raise ArchiveError('存储空间不足，无法解压')
+    budget = Config.ARCHIVE_EXTRACT_MAX_BYTES if available_bytes(user_id) is None else declared
+    quota = {'reserved': declared}
+    try:
+        return _extract_members(job, file, fmt, user_id, budget, quota)
+    finally:
+        release(user_id, quota['reserved'])
+
+# 解压到新文件夹，每个文件的大小从 quota['reserved'] 转为用量
+def _extract_members(job, file, fmt, user_id, budget, quota):
+    from app.routes.files import allowed_file
+    storage = get_storage()
+    parent_id = file.folder_id
+    stem = file.filename
+    for suffix in ('.tar.gz', '.tgz', '.zip', '.tar', '.gz', '.7z'):
+        if stem.lower().endswith(suffix):
+            stem = stem[:-len(suffix)] or stem
+            break
+    root_name = free_name(stem, lambda n: Folder.query.filter_by(
+        user_id=user_id, parent_id=parent_id, name=n, deleted_at=None).first() is not None)
+    root = Folder(name=root_name, parent_id=parent_id, user_id=user_id)
+    db.session.add(root)
+    db.session.flush()
+    record_change(user_id, 'folder', root.id, 'create', name=root.name, parent_id=parent_id)
+    db.session.commit()
+
+    folders = {(): root.id}
+    stats = {'files': 0, 'skipped': 0, 'bytes': 0}
+
+    def folder_for(parts):
+        if parts in folders:
+            return folders[parts]
+        parent = folder_for(parts[:-1])
+        folder = Folder(name=parts[-1], parent_id=parent, user_id=user_id)
+        db.session.add(folder)
+        db.session.flush()
+        record_change(user_id, 'folder', folder.id, 'create', name=folder.name, parent_id=parent)
+        folders[parts] = folder.id
+        return folder.id
+
+    written = set()
+    # 中途失败时已解压的部分保留，并提交对应的记录
+    with tempfile.TemporaryDirectory() as tmp, _commit_on_exit():
+        try:
+            for name, stream in _iter_member_streams(fmt, storage, file.filepath, file.filename, tmp, budget):
+                parts = tuple(_safe_parts(name))
+                if not parts or not allowed_file(parts[-1]) or parts in written:
+                    stats['skipped'] += 1
+                    continue
+                folder_id = folder_for(parts[:-1])
+                try:
+                    key = storage_key(user_id, folder_id, parts[-1])
+                except ValueError:
+                    stats['skipped'] += 1
+                    continue
+                written.add(parts)
+                reader = HashingReader(_LimitedReader(stream, budget - stats['bytes']))
+                size = storage.put(key, reader)
+                new_file = File(filename=parts[-1], filepath=key, filesize=size, checksum=reader.hexdigest(),
+                                checksum_verified_at=datetime.utcnow(), user_id=user_id, folder_id=folder_id)
+                db.session.add(new_file)
+                db.session.flush()
+                record_change(user_id, 'file', new_file.id, 'upload', name=new_file.filename,
+                              parent_id=folder_id, size=size)
+                from_reserved = min(size, quota['reserved'])
+                adjust(user_id, used=size, reserved=-from_reserved)
+                quota['reserved'] -= from_reserved
+                stats['files'] += 1
+                stats['bytes'] += size
+                if stats['files'] % 100 == 0:
+                    db.session.commit()
+                    job.progress = f"已解压 {stats['files']} 个文件"
+        finally:
+            # 新建的子树在解压结束后统计一次，再整体加到所在文件夹的祖先链上
+            rebuild(user_id, root.id)
+            move_totals(root.id, None, parent_id)
+    stats['folder_id'] = root.id
+    return stats
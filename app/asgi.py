@@ -0,0 +1,133 @@
+import asyncio
+import re
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+# 轻量 ASGI 应用：与 Flask 应用共享配置、模型和登录会话
+# 每个连接只是一个协程，适合大量长连接（推送、慢速传输）
+class AsgiApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.routes = []
+        self.startup_hooks = []
+        self.shutdown_hooks = []
+
+    # 注册路由，pattern 为正则，命名分组作为参数传入处理函数
+    def route(self, pattern, methods=('GET',)):
+        def decorator(handler):
+            self.routes.append((re.compile(f'^{pattern}$'), set(methods), handler))
+            return handler
+        return decorator
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        path = scope['path']
+        for regex, methods, handler in self.routes:
+            match = regex.match(path)
+            if not match:
+                continue
+            if scope['method'] not in methods:
+                await send_response(send, 405, b'Method Not Allowed')
+                return
+            await handler(Request(self, scope, receive), send, **match.groupdict())
+            return
+        await send_response(send, 404, b'Not Found')
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                for hook in self.startup_hooks:
+                    await hook()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for hook in self.shutdown_hooks:
+                    await hook()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # 在线程池中以应用上下文执行同步代码（数据库查询等）
+    async def run_sync(self, func, *args):
+        def call():
+            with self.flask_app.app_context():
+                return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, call)
+
+
+# 请求对象：解析请求头、查询参数与登录用户
+class Request:
+    def __init__(self, asgi_app, scope, receive):
+        self.app = asgi_app
+        self.scope = scope
+        self.receive = receive
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1')
+                        for k, v in scope.get('headers', [])}
+        self.args = {k: v[0] for k, v in parse_qs(scope.get('query_string', b'').decode()).items()}
+
+    @property
+    def cookies(self):
+        cookie = SimpleCookie()
+        cookie.load(self.headers.get('cookie', ''))
+        return {k: morsel.value for k, morsel in cookie.items()}
+
+    # 从 Flask 会话 Cookie（或记住我 Cookie）中解析当前用户ID，失败返回 None
+    async def user_id(self):
+        flask_app = self.app.flask_app
+        cookies = self.cookies
+
+        session_cookie = cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+        if session_cookie:
+            serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+            try:
+                data = serializer.loads(
+                    session_cookie,
+                    max_age=int(flask_app.permanent_session_lifetime.total_seconds())
+                )
+                if data.get('_user_id'):
+                    return int(data['_user_id'])
+            except Exception:
+                pass
+
+        remember_cookie = cookies.get(flask_app.config.get('REMEMBER_COOKIE_NAME', 'remember_token'))
+        if remember_cookie:
+            from flask_login.utils import decode_cookie
+            user_id = await self.app.run_sync(decode_cookie, remember_cookie)
+            if user_id:
+                return int(user_id)
+        return None
+
+    # 跨源请求（推送服务端口与页面不同）时回显同主机的 Origin
+    def cors_headers(self):
+        origin = self.headers.get('origin')
+        if not origin:
+            return []
+        allowed = self.app.flask_app.config.get('PUSH_ALLOWED_ORIGINS')
+        host = self.headers.get('host', '').split(':')[0]
+        origin_host = origin.split('://', 1)[-1].split(':')[0]
+        if (allowed and origin in allowed) or (not allowed and origin_host == host):
+            return [(b'access-control-allow-origin', origin.encode('latin-1')),
+                    (b'access-control-allow-credentials', b'true'),
+                    (b'vary', b'Origin')]
+        return []
+
+
+# 发送完整的简单响应
+async def send_response(send, status, body=b'', headers=None, content_type=b'text/plain; charset=utf-8'):
+    headers = list(headers or [])
+    headers.append((b'content-type', content_type))
+    headers.append((b'content-length', str(len(body)).encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# 后台监听客户端断开
+async def wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
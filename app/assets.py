@@ -0,0 +1,122 @@
+import os
+import gzip
+import json
+import hashlib
+from flask import current_app, url_for
+from app.config import BaseConfig as Config
+
+# 静态资源指纹与预压缩
+#
+# 构建时（flask --app run assets-build）或启动时，把 static/ 下 ASSETS_DIRS 中的文件按内容哈希复制为
+#   static/dist/<目录>/<文件名>.<哈希><扩展名>
+# 并为可压缩的类型生成 .gz（以及安装了 brotli 时的 .br）版本，映射关系写入 static/dist/manifest.json。
+# 模板中用 asset_url('css/style.css') 得到带指纹的地址；内容变化地址随之变化，因此可以永久缓存。
+# 生成的文件名只取决于内容，多个进程同时构建时结果相同。
+
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.map', '.html', '.xml', '.ico'}
+MANIFEST = 'manifest.json'
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时只生成 .gz
+    brotli = None
+
+
+def build_folder(app):
+    return os.path.join(app.static_folder, Config.ASSETS_BUILD_DIR)
+
+def _sources(app):
+    static = app.static_folder
+    for directory in Config.ASSETS_DIRS:
+        base = os.path.join(static, directory)
+        for dirpath, dirnames, filenames in os.walk(base):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                yield os.path.relpath(path, static).replace(os.sep, '/'), path
+
+def fingerprinted_name(logical, digest):
+    stem, ext = os.path.splitext(logical)
+    return f'{stem}.{digest[:Config.ASSETS_HASH_LENGTH]}{ext}'
+
+# 写临时文件后原子替换，其他进程不会读到写了一半的文件
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _variants(name, data):
+    yield name, data
+    if os.path.splitext(name)[1] not in COMPRESSIBLE:
+        return
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        yield name + '.gz', gz
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            yield name + '.br', br
+
+
+# 构建所有资源，返回清单 {逻辑路径: 带指纹的相对路径}
+# 未压缩的文件最后写入，它存在即表示各版本都已生成，下次构建跳过
+def build_assets(app):
+    out = build_folder(app)
+    manifest = {}
+    for logical, path in _sources(app):
+        with open(path, 'rb') as f:
+            data = f.read()
+        name = fingerprinted_name(logical, hashlib.sha256(data).hexdigest())
+        manifest[logical] = name
+        if os.path.exists(os.path.join(out, name)):
+            continue
+        for variant, content in reversed(list(_variants(name, data))):
+            _write(os.path.join(out, variant), content)
+    _write(os.path.join(out, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+# 删除不在清单中的旧版本（部署后旧页面可能还在引用，应在确认不再需要后执行）
+def clean_assets(app, manifest):
+    out = build_folder(app)
+    keep = set(manifest.values())
+    removed = 0
+    for dirpath, _, filenames in os.walk(out):
+        for filename in filenames:
+            rel = os.path.relpath(os.path.join(dirpath, filename), out).replace(os.sep, '/')
+            base = rel[:-3] if rel.endswith(('.gz', '.br')) else rel
+            if rel != MANIFEST and base not in keep:
+                os.remove(os.path.join(dirpath, filename))
+                removed += 1
+    return removed
+
+def load_manifest(app):
+    try:
+        with open(os.path.join(build_folder(app), MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# 模板函数：带指纹的资源地址，清单中没有的文件退回普通的 /static/ 地址
+def asset_url(filename):
+    name = current_app.extensions.get('assets', {}).get(filename)
+    if name is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.asset', filename=name)
+
+
+def init_app(app):
+    if app.config.get('ASSETS_BUILD_ON_STARTUP'):
+        try:
+            manifest = build_assets(app)
+        except OSError as e:
+            # 静态目录只读等情况下使用已有的清单
+            app.logger.warning(f'构建静态资源失败: {e}')
+            manifest = load_manifest(app)
+    else:
+        manifest = load_manifest(app)
+    app.extensions['assets'] = manifest
+    app.extensions['asset_files'] = frozenset(manifest.values())
+    app.add_template_global(asset_url)
@@ -0,0 +1,182 @@
+import click
+from datetime import timedelta
+
+# 注册命令行工具（flask --app run <命令>）
+def register_commands(app):
+
+    @app.cli.command('journal-compact')
+    @click.option('--days', type=int, default=None, help='保留天数（不应小于 JOURNAL_RETENTION，否则客户端游标可能漏掉变更）')
+    def journal_compact(days):
+        """压缩变更日志，删除超过保留期的记录"""
+        from app.journal import compact_journal
+        retention = timedelta(days=days) if days else None
+        removed = compact_journal(retention)
+        click.echo(f"已压缩变更日志 {removed} 条")
+
+    @app.cli.command('upload-sessions-cleanup')
+    @click.option('--hours', type=int, default=24, help='清理创建超过此小时数的未完成分片上传')
+    def upload_sessions_cleanup(hours):
+        """清理长时间未完成的分片上传会话"""
+        from datetime import datetime
+        from app import db
+        from app.models import UploadSession
+        from app.storage import get_storage
+        from app.quotas import adjust
+        cutoff = datetime.utcnow() - timedelta(hours=hours)
+        count = 0
+        for session in UploadSession.query.filter(UploadSession.created_at < cutoff).all():
+            try:
+                get_storage().abort_multipart(session.key, session.upload_id)
+            except Exception as e:
+                click.echo(f"放弃分片上传失败 {session.id}: {str(e)}")
+            adjust(session.user_id, reserved=-session.reserved_bytes)
+            db.session.delete(session)
+            count += 1
+        db.session.commit()
+        click.echo(f"已清理分片上传会话 {count} 个")
+
+    @app.cli.command('quota-set')
+    @click.argument('email')
+    @click.option('--plan', default=None, help='套餐名（QUOTA_PLANS 中的键）')
+    @click.option('--bytes', 'quota_bytes', type=int, default=None, help='单独设置的配额（字节），优先于套餐')
+    @click.option('--clear', is_flag=True, help='清除单独设置的配额，改回按套餐计算')
+    def quota_set(email, plan, quota_bytes, clear):
+        """设置用户的套餐或单独配额"""
+        from app import db
+        from app.models import User
+        from app.quotas import usage
+        user = User.query.filter_by(email=email).first()
+        if user is None:
+            raise click.ClickException(f'用户 {email} 不存在')
+        if plan is not None:
+            if plan not in app.config['QUOTA_PLANS']:
+                raise click.BadParameter(f'未知的套餐: {plan}（可选: {", ".join(app.config["QUOTA_PLANS"])}）')
+            user.plan = plan
+        if clear:
+            user.quota_bytes = None
+        elif quota_bytes is not None:
+            user.quota_bytes = quota_bytes
+        db.session.commit()
+        info = usage(user)
+        limit = '不限' if info['limit'] is None else f"{info['limit']} 字节"
+        click.echo(f"{email}: 套餐 {info['plan']}，配额 {limit}，已使用 {info['used']} 字节")
+
+    @app.cli.command('quota-recount')
+    @click.option('--reset-reserved', is_flag=True, help='同时重置上传预留（只在服务停止、没有进行中的上传时使用）')
+    def quota_recount(reset_reserved):
+        """按文件记录重新统计每个用户的存储用量"""
+        from app.quotas import recount
+        click.echo(f"已重新统计 {recount(reset_reserved=reset_reserved)} 个用户的用量")
+
+    @app.cli.command('folder-sizes-rebuild')
+    @click.option('--email', default=None, help='只统计该用户的文件夹（默认全部用户）')
+    def folder_sizes_rebuild(email):
+        """按文件记录重新统计文件夹的递归大小和文件数"""
+        from app import db
+        from app.models import User
+        from app.foldersize import rebuild
+        query = db.session.query(User.id)
+        if email:
+            query = query.filter(User.email == email)
+        user_ids = [row[0] for row in query]
+        if email and not user_ids:
+            raise click.ClickException(f'用户 {email} 不存在')
+        fixed = 0
+        for user_id in user_ids:
+            fixed += rebuild(user_id)
+            db.session.commit()
+        click.echo(f"已统计 {len(user_ids)} 个用户，修正 {fixed} 个文件夹")
+
+    @app.cli.command('fsck')
+    @click.option('--repair', is_flag=True, help='修复发现的问题（孤立文件移入 .lost+found，删除丢失文件的记录，修正大小）')
+    def fsck(repair):
+        """检查存储与数据库的一致性"""
+        from app.fsck import run_fsck
+        result = run_fsck(repair=repair)
+        counts = result['counts']
+        click.echo(f"扫描文件 {counts['scanned']} 个，数据库记录 {counts['rows']} 条，用时 {result['seconds']} 秒")
+        click.echo(f"孤立文件 {counts['orphan']} 个，丢失文件 {counts['missing']} 个，大小不一致 {counts['size']} 个")
+        for kind, samples in result['samples'].items():
+            for sample in samples:
+                click.echo(f"  [{kind}] {sample}")
+        if repair:
+            click.echo(f"已修复 {counts['repaired']} 项")
+
+    @app.cli.command('scrub')
+    @click.option('--limit', type=int, default=None, help='本轮最多校验的文件数')
+    @click.option('--loop', is_flag=True, help='常驻运行，每轮结束后休眠 SCRUB_IDLE_SECONDS 秒')
+    def scrub(limit, loop):
+        """重新计算文件校验和，检查存储中的静默损坏"""
+        from app.scrubber import run_scrub_pass, run_scrubber_forever
+        if loop:
+            run_scrubber_forever()
+            return
+        stats = run_scrub_pass(max_files=limit)
+        click.echo(f"已校验 {stats['verified']} 个文件（新建基准 {stats['baseline']} 个），"
+                   f"不一致 {stats['mismatch']} 个，用时 {stats['seconds']} 秒")
+
+    @app.cli.command('trash-purge')
+    @click.option('--days', type=int, default=None, help='保留天数（默认使用 TRASH_RETENTION）')
+    def trash_purge(days):
+        """彻底删除回收站中超过保留期的文件和文件夹（建议由 cron 每天运行）"""
+        from app.trash import purge_trash
+        retention = timedelta(days=days) if days is not None else None
+        files, folders = purge_trash(retention)
+        click.echo(f"已清理回收站: 文件 {files} 个，文件夹 {folders} 个")
+
+    @app.cli.command('db-upgrade')
+    @click.option('--to', 'target', type=int, default=None, help='升级到指定版本（默认最新）')
+    def db_upgrade(target):
+        """应用未执行的数据库迁移（可重复运行，已存在的表、列和索引会跳过）"""
+        from app.migrations import upgrade, current_version
+        applied = upgrade(target, echo=click.echo)
+        if applied:
+            click.echo(f"已升级到版本 {current_version()}")
+        else:
+            click.echo(f"数据库已是版本 {current_version()}，无需升级")
+
+    @app.cli.command('db-version')
+    def db_version():
+        """显示数据库结构版本"""
+        from app.migrations import current_version, latest_version
+        current, latest = current_version(), latest_version()
+        click.echo(f"当前版本 {current}，最新版本 {latest}" + ("" if current >= latest else "，请运行 db-upgrade"))
+
+    @app.cli.command('serve')
+    @click.option('--config', 'config_name', default=None, help='配置名（development / testing / production），默认取环境变量 APP_CONFIG')
+    @click.option('--host', default=None, help='监听地址（默认 HOST）')
+    @click.option('--port', type=int, default=None, help='监听端口（默认 PORT）')
+    @click.option('--workers', type=int, default=None, help='进程数（默认 SERVER_WORKERS）')
+    @click.option('--threads', type=int, default=None, help='每个进程的线程数（默认 SERVER_THREADS）')
+    @click.option('--connection-limit', type=int, default=None, help='每个进程的最大连接数')
+    @click.option('--backlog', type=int, default=None, help='监听队列长度')
+    @click.option('--channel-timeout', type=int, default=None, help='空闲连接超时（秒）')
+    @click.option('--drain-timeout', type=int, default=None, help='停止时等待请求完成的最长时间（秒）')
+    def serve_command(config_name, **overrides):
+        """以生产模式启动 HTTP 服务（kill -HUP 主进程平滑重载，kill -TERM 平滑停止）"""
+        from app.server import serve
+        serve(config_name, **overrides)
+
+    @app.cli.command('assets-build')
+    @click.option('--clean', is_flag=True, help='删除不在新清单中的旧版本')
+    def assets_build(clean):
+        """为静态资源生成带内容哈希的文件名和预压缩版本（.gz / .br）"""
+        from app.assets import build_assets, clean_assets, brotli
+        manifest = build_assets(app)
+        click.echo(f"已构建静态资源 {len(manifest)} 个" + ("" if brotli else "（未安装 brotli，只生成 .gz）"))
+        if clean:
+            click.echo(f"已删除旧版本 {clean_assets(app, manifest)} 个")
+
+    @app.cli.command('admin-sessions-revoke')
+    @click.option('--email', default=None, help='只撤销该用户的会话（默认全部）')
+    def admin_sessions_revoke(email):
+        """撤销管理员会话（其他服务进程最迟 ADMIN_SESSION_REVOCATION_TTL 秒后生效）"""
+        from app.models import User
+        from app.adminauth import revoke
+        user_id = None
+        if email:
+            user = User.query.filter_by(email=email).first()
+            if user is None:
+                raise click.ClickException(f'用户 {email} 不存在')
+            user_id = user.id
+        click.echo(f"已撤销管理员会话 {revoke(user_id=user_id)} 个")
@@ -17,7 +17,7 @@ class BaseConfig:
     # 服务器配置 - 添加HOST和PORT默认值
     HOST = os.environ.get('FLASK_HOST') or '127.0.0.1'  # 默认本地访问
     PORT = int(os.environ.get('FLASK_PORT') or 5000)     # 默认端口5000
-    DEBUG = True  # 默认关闭调试模式
+    DEBUG = os.environ.get('FLASK_DEBUG') == '1'  # 默认关闭调试模式（开发时设置 FLASK_DEBUG=1 或使用 DevelopmentConfig）
     
     # 文件上传配置
     UPLOAD_FOLDER = os.path.join(
@@ -27,6 +27,17 @@ class BaseConfig:
     )
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024 *20 # 100MB
     
+    # 存储后端配置: local 使用 UPLOAD_FOLDER，s3 使用 S3 兼容对象存储（需要 boto3）
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND') or 'local'
+    STORAGE_S3_BUCKET = os.environ.get('STORAGE_S3_BUCKET')
+    STORAGE_S3_ENDPOINT = os.environ.get('STORAGE_S3_ENDPOINT')  # MinIO 等自建服务的地址
+    STORAGE_S3_ACCESS_KEY = os.environ.get('STORAGE_S3_ACCESS_KEY')
+    STORAGE_S3_SECRET_KEY = os.environ.get('STORAGE_S3_SECRET_KEY')
+    STORAGE_S3_REGION = os.environ.get('STORAGE_S3_REGION')
+    STORAGE_S3_PREFIX = os.environ.get('STORAGE_S3_PREFIX') or ''
+    STORAGE_LOCAL_COPY_MODE = os.environ.get('STORAGE_LOCAL_COPY_MODE') or 'clone'  # 本地复制方式: clone（reflink/copy_file_range）或 hardlink
+    UPLOAD_PART_SIZE = 16 * 1024 * 1024  # 分片上传的单片最大字节数
+    
     # 允许上传的文件类型
     ALLOWED_EXTENSIONS = {
         'txt', 'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx',
@@ -44,7 +55,145 @@ class BaseConfig:
     ADMIN_KEY_FOLDER = os.path.join(basedir, 'admin_keys')
     ADMIN_KEY_FILENAME = 'admin_key.dat'  # 密钥文件名
     ADMIN_SESSION_DURATION = timedelta(hours=1)  # 管理员会话有效期
+    ADMIN_SESSION_REVOCATION_TTL = 10  # 撤销列表在内存中的缓存时间（秒），其他进程中的撤销最迟在此时间后生效
+    
+    # 变更日志配置
+    JOURNAL_RETENTION = timedelta(days=30)  # 日志保留期，超过后可被压缩
+    JOURNAL_PAGE_SIZE = 500  # 单次拉取的最大条数
+    JOURNAL_COMPACT_BATCH = 5000  # 压缩时每批删除条数
+    
+    # 文件夹变更推送服务配置（serve_push.py）
+    PUSH_HOST = os.environ.get('PUSH_HOST') or '127.0.0.1'
+    PUSH_PORT = int(os.environ.get('PUSH_PORT') or 5001)
+    PUSH_URL = os.environ.get('PUSH_URL')  # 浏览器访问推送服务的地址，为空则页面不订阅
+    PUSH_ALLOWED_ORIGINS = None  # 允许跨源订阅的页面来源，为空时只允许同主机
+    PUSH_POLL_INTERVAL = 1.0  # 轮询变更日志的间隔（秒）
+    PUSH_POLL_BATCH = 1000  # 每次轮询读取的最大日志条数
+    PUSH_HEARTBEAT = 25  # 空闲连接心跳间隔（秒）
+    PUSH_QUEUE_SIZE = 100  # 每个连接缓存的最大事件数
+    
+    # 异步传输服务配置（serve_transfer.py，承担上传/下载的字节传输）
+    TRANSFER_HOST = os.environ.get('TRANSFER_HOST') or '127.0.0.1'
+    TRANSFER_PORT = int(os.environ.get('TRANSFER_PORT') or 5002)
+    TRANSFER_URL = os.environ.get('TRANSFER_URL')  # 浏览器访问传输服务的地址，为空则下载仍由 Flask 处理
+    TRANSFER_IO_THREADS = 16  # 文件读写线程数（每次只占用一块数据的读写时间，与连接数无关）
+    TRANSFER_CHUNK_SIZE = 256 * 1024  # 下载时每次读取和发送的字节数
+    
+    # 分享链接配置
+    SHARE_REVOCATION_TTL = 30  # 撤销列表在内存中的缓存时间（秒）
+    SHARE_CACHE_MAX_AGE = 300  # 公开分享下载允许缓存的时间（秒）
+    SHARE_GRANTS_MAX = 20  # 每个会话保留的限次分享续传许可数量
+    
+    # 传输限速配置（0 表示不限制）
+    THROTTLE_USER_BYTES_PER_SEC = 0  # 每个用户的上传/下载速率（字节/秒）
+    THROTTLE_USER_BURST_BYTES = 8 * 1024 * 1024  # 每个用户允许的突发字节数
+    THROTTLE_GLOBAL_BYTES_PER_SEC = 0  # 全局上传/下载速率（字节/秒）
+    THROTTLE_GLOBAL_BURST_BYTES = 64 * 1024 * 1024
+    THROTTLE_USER_CONCURRENCY = 0  # 每个用户同时进行的下载数/上传数
+    THROTTLE_GLOBAL_CONCURRENCY = 0  # 全局同时进行的下载数/上传数
+    THROTTLE_MAX_WAIT = 10  # 开始传输前需要等待超过此秒数时直接返回 429
+    THROTTLE_RETRY_AFTER = 5  # 并发超限时建议客户端重试的间隔（秒）
+    THROTTLE_CHUNK_SIZE = 64 * 1024  # 累积多少字节后扣减一次令牌
+    THROTTLE_STORE = os.environ.get('THROTTLE_STORE')  # 多进程共享状态的 SQLite 文件，为空则仅进程内共享
+    
+    # 后台任务配置
+    JOBS_MAX_WORKERS = 2  # 同时运行的后台任务数
+    
+    # 一致性检查（fsck）配置
+    FSCK_WORKERS = 8  # 并行检查的用户数
+    FSCK_SCAN_THREADS = 16  # 并行读取目录的线程数
+    FSCK_PREFETCH = 32  # 每个目录预读的子目录数
+    FSCK_BATCH_SIZE = 5000  # 每批读取的 File 行数
+    FSCK_GRACE_SECONDS = 3600  # 最近修改的文件可能是正在进行的上传，不判定为孤立文件
+    FSCK_SAMPLE_LIMIT = 100  # 报告中每类问题保留的示例数
+    
+    # 完整性巡检（scrub）配置
+    SCRUB_INTERVAL = timedelta(days=30)  # 每个文件的重新校验周期
+    SCRUB_WORKERS = 4  # 并行校验的线程数
+    SCRUB_BYTES_PER_SEC = 20 * 1024 * 1024  # 巡检读取速率上限（所有线程共享），0为不限制
+    SCRUB_BATCH_SIZE = 200  # 每批选取的文件数
+    SCRUB_IDLE_SECONDS = 600  # 常驻巡检每轮结束后的休眠时间
+    
+    # 回收站配置
+    TRASH_RETENTION = timedelta(days=30)  # 回收站保留期，超过后由 trash-purge 彻底删除
+    TRASH_PURGE_BATCH = 500  # 每批清理的条目数
+    
+    # 移动/复制配置
+    TREE_COPY_BATCH = 500  # 复制子树时每批处理的文件夹数
+    
+    # 增量更新配置
+    DELTA_BLOCK_SIZE = 64 * 1024  # 默认签名块大小
+    DELTA_MIN_BLOCK_SIZE = 2 * 1024  # 客户端可指定的块大小范围
+    DELTA_MAX_BLOCK_SIZE = 1024 * 1024
+    DELTA_MAX_RESULT_SIZE = MAX_CONTENT_LENGTH  # 重建后的文件大小上限，与普通上传一致
     
+    # 压缩包浏览配置
+    ARCHIVE_MAX_MEMBERS = 100000  # 可浏览的最大成员数（索引缓存在数据库中）
+    ARCHIVE_PAGE_SIZE = 200  # 成员列表每页条数
+    ARCHIVE_EXTRACT_MAX_MEMBERS = 10000  # 服务端解压的最大文件数
+    ARCHIVE_EXTRACT_MAX_BYTES = 5 * 1024 * 1024 * 1024  # 服务端解压的最大总字节数（防止压缩炸弹）
+    
+    # 文本预览配置
+    PREVIEW_EXTENSIONS = {'txt', 'csv', 'json', 'xml', 'md', 'log'}  # 可在线预览的文本类扩展名
+    PREVIEW_INDEX_STRIDE = 10000  # 行索引每隔多少行记录一次偏移
+    PREVIEW_PAGE_LINES = 200  # 默认每页行数
+    PREVIEW_MAX_LINES = 2000  # 单次请求最多返回的行数
+    PREVIEW_MAX_BYTES = 1024 * 1024  # 单次请求最多读取的字节数（超长行会被截断）
+    PREVIEW_SCAN_CHUNK = 8 * 1024 * 1024  # 建立索引时每次读取的字节数
+    
+    # 热点小文件缓存配置（每个进程一份，0 表示关闭）
+    HOT_CACHE_MAX_BYTES = int(os.environ.get('HOT_CACHE_MAX_BYTES') or 0)  # 缓存内容的总字节数上限（如 67108864）
+    HOT_CACHE_MAX_FILE_SIZE = 1024 * 1024  # 超过此大小的文件不缓存
+    HOT_CACHE_REVALIDATE = 5  # 命中后多少秒内不再 stat（其他进程的修改在此时间后生效）
+    
+    # 文件列表配置
+    LISTING_BATCH_SIZE = 1000  # 每批从数据库游标读取的行数
+    LISTING_FLUSH_BYTES = 16 * 1024  # 流式输出页面时每次发送的最小字节数
+    
+    # 数据库迁移配置
+    SCHEMA_AUTO_UPGRADE = False  # 启动时自动升级数据库结构（多进程部署时应关闭，改为部署时运行 flask db-upgrade）
+    MIGRATION_BATCH_SIZE = 5000  # 回填数据时每批更新的行数
+    
+    # 生产服务器配置（flask --app run serve / main.py，命令行参数可覆盖）
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS') or 1)  # 进程数，大于 1 时各进程以 SO_REUSEPORT 共享端口
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS') or 8)  # 每个进程的请求处理线程数
+    SERVER_CONNECTION_LIMIT = 1000  # 每个进程同时打开的最大连接数，超过后暂停 accept
+    SERVER_BACKLOG = 2048  # 监听队列长度
+    SERVER_CHANNEL_TIMEOUT = 120  # 空闲连接超时（秒）
+    SERVER_DRAIN_TIMEOUT = 30  # 停止或重载时等待进行中请求完成的最长时间（秒）
+    SERVER_READY_TIMEOUT = 60  # 等待新工作进程预热完成的最长时间（秒）
+    
+    # 静态资源配置（asset_url 生成带指纹的地址，预压缩版本见 app/assets.py）
+    ASSETS_DIRS = ('css', 'js', 'img', 'fonts')  # static/ 下参与构建的目录（不包含用户上传内容）
+    ASSETS_BUILD_DIR = 'dist'  # 构建输出目录（static/ 下）
+    ASSETS_BUILD_ON_STARTUP = True  # 启动时构建；静态目录只读的部署可关闭，改为构建时运行 flask assets-build
+    ASSETS_HASH_LENGTH = 12  # 文件名中内容哈希的长度
+    ASSETS_MAX_AGE = 365 * 24 * 3600  # 带指纹资源的缓存时间（秒）
+    
+    # 密码哈希配置（修改参数后，用户下次登录时自动按新参数重新计算）
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'  # werkzeug 格式，也可用 pbkdf2:sha256:600000
+    PASSWORD_HASH_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or min(4, os.cpu_count() or 1))  # 计算哈希的进程数，0 表示在请求线程中计算
+    PASSWORD_HASH_MAX_PENDING = 64  # 同时等待或计算中的哈希任务上限
+    PASSWORD_HASH_QUEUE_TIMEOUT = 5  # 等待空位的最长时间（秒），超时返回 503
+    
+    # 存储配额配置（None 表示不限制；User.quota_bytes 可为单个用户单独设置）
+    QUOTA_PLANS = {
+        'free': 10 * 1024 * 1024 * 1024,  # 10GB
+        'pro': 1024 * 1024 * 1024 * 1024,  # 1TB
+        'unlimited': None,
+    }
+    QUOTA_DEFAULT_PLAN = os.environ.get('QUOTA_DEFAULT_PLAN') or 'free'  # 未指定套餐的用户
+    
+    # 数据导出配置（导出单独限速，0 表示不限制）
+    EXPORT_BATCH_SIZE = 1000  # 每批从数据库读取的文件记录数
+    EXPORT_USER_BYTES_PER_SEC = 0  # 每个用户的导出速率（字节/秒）
+    EXPORT_USER_BURST_BYTES = 8 * 1024 * 1024
+    EXPORT_GLOBAL_BYTES_PER_SEC = 32 * 1024 * 1024  # 所有导出合计的速率上限
+    EXPORT_GLOBAL_BURST_BYTES = 64 * 1024 * 1024
+    EXPORT_USER_CONCURRENCY = 2  # 每个用户同时进行的导出下载数（续传工具可能并行请求多个范围）
+    EXPORT_GLOBAL_CONCURRENCY = 4  # 同时进行的导出总数（每个导出占用一个服务线程）
+
     # Flask-Login配置
     REMEMBER_COOKIE_DURATION = timedelta(days=7)
 
@@ -73,6 +222,9 @@ class TestingConfig(BaseConfig):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite:///:memory:'
+    SCHEMA_AUTO_UPGRADE = True
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'  # 测试中不需要高强度哈希
+    PASSWORD_HASH_WORKERS = 0
 
 
 # 生产环境配置
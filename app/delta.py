@@ -0,0 +1,204 @@
+import hashlib
+import struct
+import zlib
+from app.config import BaseConfig as Config
+from app.storage.base import CHUNK_SIZE
+
+# 增量更新（类似 rsync）
+#
+# 1. 客户端获取服务器上现有版本的分块签名：每块一个弱校验（Adler-32，可滚动计算）和一个强校验（BLAKE2b-128）。
+# 2. 客户端在本地新版本上滚动匹配，生成指令流：
+#      b'C' + >II (起始块号, 连续块数)       复制服务器上已有的块
+#      b'L' + >I  (长度) + 字面数据          新数据
+#      b'E' + 32 字节 SHA-256               结束，附带新版本的完整校验和
+# 3. 服务器边读指令边重建新版本，经由存储后端写入临时文件并原子替换；
+#    校验和不一致时在替换之前中止，旧版本保持不变。
+
+MOD_ADLER = 65521
+
+OP_COPY = b'C'
+OP_LITERAL = b'L'
+OP_END = b'E'
+
+
+class DeltaError(ValueError):
+    pass
+
+
+def weak_checksum(data):
+    return zlib.adler32(data)
+
+def strong_checksum(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+# 客户端可指定块大小，限制在配置范围内
+def clamp_block_size(block_size):
+    if not block_size:
+        return Config.DELTA_BLOCK_SIZE
+    return max(Config.DELTA_MIN_BLOCK_SIZE, min(Config.DELTA_MAX_BLOCK_SIZE, block_size))
+
+# 按块流式产生 (弱校验, 强校验)，内存占用只有一个块
+def iter_signatures(storage, key, block_size):
+    buffer = b''
+    for chunk in storage.iter_range(key, chunk_size=max(CHUNK_SIZE, block_size)):
+        buffer += chunk
+        while len(buffer) >= block_size:
+            block, buffer = buffer[:block_size], buffer[block_size:]
+            yield weak_checksum(block), strong_checksum(block)
+    if buffer:
+        yield weak_checksum(buffer), strong_checksum(buffer)
+
+
+# 读取已有版本中的块：本地文件直接按偏移读取，远程对象按范围请求
+class BlockSource:
+    def __init__(self, storage, key, size, block_size):
+        self.storage = storage
+        self.key = key
+        self.size = size
+        self.block_size = block_size
+        self.block_count = (size + block_size - 1) // block_size
+        path = storage.local_path(key)
+        self.file = open(path, 'rb') if path else None
+
+    def iter_blocks(self, index, count):
+        if count <= 0 or index < 0 or index + count > self.block_count:
+            raise DeltaError(f'块范围无效: {index}+{count}')
+        start = index * self.block_size
+        end = min(self.size, (index + count) * self.block_size) - 1
+        if self.file is None:
+            yield from self.storage.iter_range(self.key, start, end)
+            return
+        self.file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = self.file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise DeltaError('原文件在更新过程中被截断')
+            remaining -= len(chunk)
+            yield chunk
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+# 把指令流还原为新版本内容的可读流，供 storage.put 读取
+# 读到结束指令后核对 SHA-256，不一致时抛出异常，存储后端据此放弃临时文件
+class DeltaReader:
+    def __init__(self, ops, source, max_size=None):
+        self.ops = ops
+        self.source = source
+        self.max_size = Config.DELTA_MAX_RESULT_SIZE if max_size is None else max_size
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.literal_bytes = 0
+        self._chunks = self._generate()
+        self._buffer = b''
+
+    def _read_exact(self, n):
+        data = self.ops.read(n)
+        while len(data) < n:
+            more = self.ops.read(n - len(data))
+            if not more:
+                raise DeltaError('指令流意外结束')
+            data += more
+        return data
+
+    def _generate(self):
+        while True:
+            op = self._read_exact(1)
+            if op == OP_COPY:
+                index, count = struct.unpack('>II', self._read_exact(8))
+                for chunk in self.source.iter_blocks(index, count):
+                    yield chunk
+            elif op == OP_LITERAL:
+                (length,) = struct.unpack('>I', self._read_exact(4))
+                remaining = length
+                while remaining > 0:
+                    chunk = self._read_exact(min(CHUNK_SIZE, remaining))
+                    remaining -= len(chunk)
+                    self.literal_bytes += len(chunk)
+                    yield chunk
+            elif op == OP_END:
+                expected = self._read_exact(32)
+                if self.hash.digest() != expected:
+                    raise DeltaError('重建结果的校验和与客户端声明的不一致')
+                return
+            else:
+                raise DeltaError(f'未知指令: {op!r}')
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self.hash.update(chunk)
+            self.size += len(chunk)
+            if self.size > self.max_size:
+                raise DeltaError('重建后的文件超过大小上限')
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+# 参考客户端实现：根据服务器签名和本地新文件生成指令流（产生 bytes 片段）
+def make_delta(signatures, block_size, stream):
+    table = {}
+    for index, (weak, strong) in enumerate(signatures):
+        table.setdefault(weak, {}).setdefault(strong, index)
+
+    data = stream.read()
+    digest = hashlib.sha256(data).digest()
+    literal_start = 0
+    pending = None  # 待合并的连续复制 [起始块, 块数]
+
+    def flush_literal(end):
+        if end > literal_start:
+            yield OP_LITERAL + struct.pack('>I', end - literal_start) + data[literal_start:end]
+
+    def flush_copy():
+        if pending:
+            yield OP_COPY + struct.pack('>II', pending[0], pending[1])
+
+    pos = 0
+    n = block_size
+    a = b = None
+    while pos + n <= len(data):
+        if a is None:
+            weak = zlib.adler32(data[pos:pos + n])
+            a, b = weak & 0xffff, weak >> 16
+        weak = (b << 16) | a
+        candidates = table.get(weak)
+        index = None
+        if candidates:
+            index = candidates.get(strong_checksum(data[pos:pos + n]))
+        if index is not None:
+            yield from flush_literal(pos)
+            if pending and pending[0] + pending[1] == index:
+                pending[1] += 1
+            else:
+                yield from flush_copy()
+                pending = [index, 1]
+            pos += n
+            literal_start = pos
+            a = None
+            continue
+        if pending and literal_start == pos:
+            yield from flush_copy()
+            pending = None
+        # 滚动一个字节
+        if pos + n < len(data):
+            out, new = data[pos], data[pos + n]
+            a = (a - out + new) % MOD_ADLER
+            b = (b - n * out + a - 1) % MOD_ADLER
+        pos += 1
+
+    yield from flush_copy()
+    yield from flush_literal(len(data))
+    yield OP_END + digest
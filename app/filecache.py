@@ -0,0 +1,221 @@
+import os
+import time
+import mimetypes
+import threading
+from collections import OrderedDict
+from werkzeug.http import http_date, quote_etag
+from app.config import BaseConfig as Config
+from app.storage.base import StorageBackend, StoredObject
+
+# 热点小文件内存缓存
+#
+# 下载请求集中在少数小文件上（团队模板、热门分享、头像）。命中缓存时直接用内存中的内容
+# 和预先生成的响应头返回，不做 open / stat / read。
+#   键为文件标识：存储中的文件用存储键，头像用 "avatar:<文件名>"。
+#   本进程内经由存储后端的写入、改名、删除会立即使对应条目失效（见 CacheInvalidatingStorage），
+#   其他进程的修改在 HOT_CACHE_REVALIDATE 秒后重新 stat 时发现。
+#   总字节数超过 HOT_CACHE_MAX_BYTES 时淘汰最久未使用的条目。
+
+
+class CachedFile:
+    __slots__ = ('data', 'etag', 'headers', 'validated_at')
+
+    def __init__(self, data, obj, mimetype, validated_at):
+        self.data = data
+        self.etag = obj.etag
+        self.headers = [
+            ('Content-Type', mimetype),
+            ('ETag', quote_etag(obj.etag)),
+            ('Last-Modified', http_date(obj.mtime)),
+            ('Accept-Ranges', 'bytes'),
+        ]
+        self.validated_at = validated_at
+
+
+class HotFileCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return Config.HOT_CACHE_MAX_BYTES > 0
+
+    # 返回缓存条目，未命中时通过 stat/read 加载；文件不存在或超过单文件上限时返回 None，由调用方按原方式处理
+    def fetch(self, key, stat, read, mimetype='application/octet-stream'):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.validated_at < Config.HOT_CACHE_REVALIDATE:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            version = self._version
+
+        obj = stat()
+        if entry is not None and obj is not None and obj.etag == entry.etag and obj.size == len(entry.data):
+            with self._lock:
+                entry.validated_at = now
+                self.hits += 1
+            return entry
+
+        if entry is not None:
+            with self._lock:
+                self._remove(key)
+        if obj is None or obj.size > Config.HOT_CACHE_MAX_FILE_SIZE:
+            return None
+        with self._lock:
+            self.misses += 1
+        try:
+            data = read()
+        except OSError:
+            return None
+        if len(data) != obj.size:
+            return None  # 读取期间文件被修改
+        entry = CachedFile(data, obj, mimetype, now)
+        with self._lock:
+            # 加载期间发生过失效时不写入，避免缓存旧内容
+            if version == self._version:
+                self._remove(key)
+                self._entries[key] = entry
+                self._bytes += len(data)
+                while self._bytes > Config.HOT_CACHE_MAX_BYTES and self._entries:
+                    self._remove(next(iter(self._entries)))
+                    self.evictions += 1
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.data)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._version += 1
+            self._remove(key)
+
+    def invalidate_prefix(self, prefix):
+        with self._lock:
+            self._version += 1
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': Config.HOT_CACHE_MAX_BYTES,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else None,
+            }
+
+hot_files = HotFileCache()
+
+
+# 存储后端的包装：写入、改名、复制、删除后使缓存中对应的键失效，其余方法原样转发
+class CacheInvalidatingStorage(StorageBackend):
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def put(self, key, stream):
+        try:
+            return self.backend.put(key, stream)
+        finally:
+            self.cache.invalidate(key)
+
+    def put_file(self, key, path):
+        try:
+            return self.backend.put_file(key, path)
+        finally:
+            self.cache.invalidate(key)
+
+    def open(self, key):
+        return self.backend.open(key)
+
+    def iter_range(self, key, *args, **kwargs):
+        return self.backend.iter_range(key, *args, **kwargs)
+
+    def stat(self, key):
+        return self.backend.stat(key)
+
+    def local_path(self, key):
+        return self.backend.local_path(key)
+
+    def delete(self, key):
+        try:
+            return self.backend.delete(key)
+        finally:
+            self.cache.invalidate(key)
+
+    def delete_prefix(self, prefix):
+        try:
+            return self.backend.delete_prefix(prefix)
+        finally:
+            self.cache.invalidate_prefix(prefix.rstrip('/') + '/')
+
+    def rename(self, src, dst):
+        try:
+            return self.backend.rename(src, dst)
+        finally:
+            self.cache.invalidate(src)
+            self.cache.invalidate(dst)
+
+    def copy(self, src, dst):
+        try:
+            return self.backend.copy(src, dst)
+        finally:
+            self.cache.invalidate(dst)
+
+    def list(self, prefix=''):
+        return self.backend.list(prefix)
+
+    def create_multipart(self, key):
+        return self.backend.create_multipart(key)
+
+    def upload_part(self, key, upload_id, part_number, stream):
+        return self.backend.upload_part(key, upload_id, part_number, stream)
+
+    def complete_multipart(self, key, upload_id):
+        try:
+            return self.backend.complete_multipart(key, upload_id)
+        finally:
+            self.cache.invalidate(key)
+
+    def abort_multipart(self, key, upload_id):
+        return self.backend.abort_multipart(key, upload_id)
+
+
+# 本地文件（头像）的元信息，与 LocalStorage.stat 的格式一致
+def stat_path(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return StoredObject(st.st_size, st.st_mtime, f'{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}')
+
+def read_path(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def guess_mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
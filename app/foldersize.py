@@ -0,0 +1,102 @@
+from app import db
+from app.models import File, Folder
+
+# 文件夹的递归大小与文件数
+#
+# Folder.total_bytes / file_count 为子树中所有文件（不含回收站中的条目）的大小之和与个数。
+# 文件的增删、大小变化和移动只把差值加到所在文件夹及其祖先上：先沿 parent_id 找出祖先链，
+# 再用一条 UPDATE ... WHERE id IN (...) 累加，与调用方的修改在同一事务中提交。
+# 移入回收站的文件夹保留自己子树的统计，只从祖先中扣除，因此祖先链在第一个位于回收站中的文件夹处截止；
+# 恢复时把整个子树的统计加到新的祖先链上即可，子树内部不需要重新计算。
+# 计数出现偏差（如旧版本进程写入、手工修改数据库）时用 rebuild 按文件记录重新统计。
+
+
+_folder = Folder.__table__
+
+
+# folder_id 及其祖先的ID（到根目录或第一个位于回收站中的文件夹为止）
+def _chain(folder_id):
+    ids = []
+    while folder_id is not None:
+        row = db.session.query(Folder.parent_id, Folder.deleted_at).filter(Folder.id == folder_id).first()
+        if row is None:
+            break
+        ids.append(folder_id)
+        if row.deleted_at is not None:
+            break
+        folder_id = row.parent_id
+    return ids
+
+# 把大小和文件数的差值加到 folder_id 及其祖先上（folder_id 为 None 表示根目录，没有需要更新的行）
+def propagate(folder_id, nbytes=0, count=0):
+    if not nbytes and not count:
+        return
+    ids = _chain(folder_id)
+    if ids:
+        db.session.execute(db.update(_folder).where(_folder.c.id.in_(ids)).values(
+            total_bytes=_folder.c.total_bytes + nbytes, file_count=_folder.c.file_count + count))
+
+def totals(folder_id):
+    row = db.session.query(Folder.total_bytes, Folder.file_count).filter(Folder.id == folder_id).first()
+    return (row.total_bytes, row.file_count) if row else (0, 0)
+
+# 文件夹子树从 old_parent_id 下移到 new_parent_id 下（None 表示不计入任何祖先：移入回收站、恢复、新建的副本）
+def move_totals(folder_id, old_parent_id, new_parent_id):
+    nbytes, count = totals(folder_id)
+    propagate(old_parent_id, -nbytes, -count)
+    propagate(new_parent_id, nbytes, count)
+
+
+# 由每个文件夹直接包含的文件统计出递归统计；回收站中的文件夹不计入父文件夹
+def _rollup(folders, direct):
+    parents = {row.id: row.parent_id for row in folders}
+    trashed = {row.id for row in folders if row.deleted_at is not None}
+    children = {}
+    for folder_id, parent_id in parents.items():
+        children.setdefault(parent_id, []).append(folder_id)
+    # 从顶层按层展开，倒序累加时子文件夹总是先于父文件夹完成
+    order = [folder_id for folder_id, parent_id in parents.items() if parent_id not in parents]
+    for folder_id in order:
+        order.extend(children.get(folder_id, ()))
+    result = {folder_id: list(direct.get(folder_id, (0, 0))) for folder_id in parents}
+    for folder_id in reversed(order):
+        parent_id = parents[folder_id]
+        if parent_id in result and folder_id not in trashed:
+            result[parent_id][0] += result[folder_id][0]
+            result[parent_id][1] += result[folder_id][1]
+    return result
+
+def _subtree(folder_id):
+    folders = db.session.query(Folder.id, Folder.parent_id, Folder.deleted_at, Folder.total_bytes,
+                               Folder.file_count).filter(Folder.id == folder_id).all()
+    level = [folder_id]
+    while level:
+        rows = db.session.query(Folder.id, Folder.parent_id, Folder.deleted_at, Folder.total_bytes,
+                                Folder.file_count).filter(Folder.parent_id.in_(level)).all()
+        folders.extend(rows)
+        level = [row.id for row in rows]
+    return folders
+
+# 按文件记录重新统计用户全部文件夹（或 folder_id 的子树）的递归大小，返回修正的文件夹数
+# 只统计子树时不更新子树以外的祖先
+def rebuild(user_id, folder_id=None, batch_size=500):
+    if folder_id is None:
+        folders = db.session.query(Folder.id, Folder.parent_id, Folder.deleted_at, Folder.total_bytes,
+                                   Folder.file_count).filter(Folder.user_id == user_id).all()
+    else:
+        folders = _subtree(folder_id)
+    ids = [row.id for row in folders]
+    direct = {}
+    for i in range(0, len(ids), batch_size):
+        rows = db.session.query(File.folder_id, db.func.coalesce(db.func.sum(File.filesize), 0), db.func.count(File.id)) \
+            .filter(File.user_id == user_id, File.folder_id.in_(ids[i:i + batch_size]), File.deleted_at.is_(None)) \
+            .group_by(File.folder_id)
+        direct.update((row[0], (row[1], row[2])) for row in rows)
+
+    result = _rollup(folders, direct)
+    changed = [{'fid': row.id, 'nbytes': result[row.id][0], 'count': result[row.id][1]} for row in folders
+               if (row.total_bytes, row.file_count) != tuple(result[row.id])]
+    if changed:
+        db.session.execute(db.update(_folder).where(_folder.c.id == db.bindparam('fid')).values(
+            total_bytes=db.bindparam('nbytes'), file_count=db.bindparam('count')), changed)
+    return len(changed)
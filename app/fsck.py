@@ -0,0 +1,301 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app import db
+from app.models import File, User, ArchiveIndex, LineIndex
+from app.config import BaseConfig as Config
+from app.journal import record_change
+from app.quotas import adjust
+from app.foldersize import rebuild
+from app.storage import get_storage
+from app.storage.local import LocalStorage
+
+# 存储与数据库一致性检查（fsck）
+#
+# 按用户分区并行检查：每个用户的存储对象按键的字典序流式产生，
+# 数据库中的 File 行也按 filepath 字典序分批读取，两路有序序列做归并比较，
+# 内存占用只与单个目录的条目数和批大小有关，与文件总数无关。
+#
+# 发现的问题：
+#   orphan   存储中存在但没有对应 File 行（修复：移入 .lost+found）
+#   missing  File 行存在但存储中没有（修复：删除该行）
+#   size     大小不一致（修复：以存储中的实际大小为准）
+#
+# 归并比较的是读取时的快照，重命名、移动、回收站等操作不改变对象的修改时间，FSCK_GRACE_SECONDS 不能覆盖它们。
+# 因此每个问题在报告和修复之前都重新读取该行、重新 stat 对象，期间有变化的条目跳过；
+# 删除和修正大小以读取到的 filepath、filesize 为条件，与并发的修改不会互相覆盖。
+
+LOST_FOUND_DIR = '.lost+found'
+
+
+class FsckReport:
+    def __init__(self, sample_limit):
+        self.sample_limit = sample_limit
+        self.counts = {'scanned': 0, 'rows': 0, 'orphan': 0, 'missing': 0, 'size': 0, 'repaired': 0}
+        self.samples = {'orphan': [], 'missing': [], 'size': []}
+        self._lock = threading.Lock()
+
+    def add(self, kind, detail):
+        with self._lock:
+            self.counts[kind] += 1
+            if len(self.samples[kind]) < self.sample_limit:
+                self.samples[kind].append(detail)
+
+    def bump(self, kind, n=1):
+        with self._lock:
+            self.counts[kind] += n
+
+    def to_dict(self):
+        return {'counts': dict(self.counts), 'samples': {k: list(v) for k, v in self.samples.items()}}
+
+
+# 目录项排序键：目录名后加 "/"，使递归产生的完整路径恰好符合字符串字典序
+def _entry_key(entry):
+    return entry[0] + '/' if entry[1] else entry[0]
+
+def _scan(path):
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    entries.append((entry.name, True, 0, 0))
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    entries.append((entry.name, False, st.st_size, st.st_mtime))
+            except OSError:
+                continue
+    entries.sort(key=_entry_key)
+    return entries
+
+# 有序遍历本地目录，产生 (key, size, mtime)；子目录的列表由线程池预先读取
+def walk_sorted(path, key_prefix, pool, window, listing=None):
+    entries = listing if listing is not None else _scan(path)
+    subdirs = deque()
+    pending_dirs = deque(name for name, is_dir, _, _ in entries if is_dir)
+
+    def prefetch():
+        while pending_dirs and len(subdirs) < window:
+            name = pending_dirs.popleft()
+            subdirs.append((name, pool.submit(_scan, os.path.join(path, name))))
+
+    prefetch()
+    for name, is_dir, size, mtime in entries:
+        if not is_dir:
+            yield key_prefix + name, size, mtime
+            continue
+        _, future = subdirs.popleft()
+        prefetch()
+        try:
+            sub_listing = future.result()
+        except OSError:
+            continue
+        yield from walk_sorted(os.path.join(path, name), f'{key_prefix}{name}/', pool, window, sub_listing)
+
+# 非本地存储：直接使用后端的有序列举
+def list_sorted(storage, prefix):
+    for key, obj in storage.list(prefix):
+        yield key, obj.size, obj.mtime
+
+
+def _binary_order(column):
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return column.collate('C')
+    if dialect == 'mysql':
+        return column.collate('utf8mb4_bin')
+    return column.collate('BINARY')
+
+# 早期数据保存的是根目录内的绝对路径，转换成相对键
+def _relative_key(filepath, root):
+    if root and filepath.startswith(root + os.sep):
+        return os.path.relpath(filepath, root).replace(os.sep, '/')
+    return filepath
+
+# 按 filepath 字典序分批读取某用户的 File 行，产生 (key, id, size, folder_id, filename)
+def iter_rows(user_id, root, batch_size):
+    legacy = []
+    for row in db.session.query(File.id, File.filepath, File.filesize, File.folder_id, File.filename).filter(
+            File.user_id == user_id, File.filepath.like('/%')):
+        legacy.append((_relative_key(row.filepath, root), row.id, row.filesize, row.folder_id, row.filename))
+    legacy.sort()
+    legacy = deque(legacy)
+
+    last = None
+    while True:
+        query = db.session.query(File.filepath, File.id, File.filesize, File.folder_id, File.filename).filter(
+            File.user_id == user_id, File.filepath.like(f'{user_id}/%'))
+        if last is not None:
+            query = query.filter(_binary_order(File.filepath) > last)
+        batch = query.order_by(_binary_order(File.filepath)).limit(batch_size).all()
+        for row in batch:
+            while legacy and legacy[0][0] < row.filepath:
+                yield legacy.popleft()
+            yield tuple(row)
+        if len(batch) < batch_size:
+            break
+        last = batch[-1].filepath
+    yield from legacy
+
+
+class Fsck:
+    def __init__(self, repair=False, job=None):
+        self.repair = repair
+        self.job = job
+        self.storage = get_storage()
+        backend = getattr(self.storage, 'backend', self.storage)  # 热点缓存包装下的实际后端
+        self.root = backend.root if isinstance(backend, LocalStorage) else None
+        self.report = FsckReport(Config.FSCK_SAMPLE_LIMIT)
+        self.grace = Config.FSCK_GRACE_SECONDS
+        self.app = current_app._get_current_object()
+
+    def user_ids(self):
+        ids = {row[0] for row in db.session.query(File.user_id).distinct()}
+        if self.root:
+            if os.path.isdir(self.root):
+                for entry in os.scandir(self.root):
+                    if entry.is_dir() and entry.name.isdigit():
+                        ids.add(int(entry.name))
+        else:
+            ids.update(row[0] for row in db.session.query(User.id))
+        return sorted(ids)
+
+    def run(self):
+        started = time.time()
+        user_ids = self.user_ids()
+        with ThreadPoolExecutor(max_workers=Config.FSCK_SCAN_THREADS, thread_name_prefix='fsck-scan') as scan_pool, \
+                ThreadPoolExecutor(max_workers=Config.FSCK_WORKERS, thread_name_prefix='fsck') as user_pool:
+            futures = [user_pool.submit(self._check_user_in_context, uid, scan_pool) for uid in user_ids]
+            for done, future in enumerate(futures, 1):
+                future.result()
+                if self.job:
+                    self.job.progress = f'{done}/{len(user_ids)} 个用户，已扫描 {self.report.counts["scanned"]} 个文件'
+        result = self.report.to_dict()
+        result['seconds'] = round(time.time() - started, 2)
+        result['repair'] = self.repair
+        return result
+
+    def _check_user_in_context(self, user_id, scan_pool):
+        with self.app.app_context():
+            try:
+                self.check_user(user_id, scan_pool)
+            finally:
+                db.session.remove()
+
+    def _objects(self, user_id, scan_pool):
+        if self.root:
+            user_dir = os.path.join(self.root, str(user_id))
+            if not os.path.isdir(user_dir):
+                return iter(())
+            return walk_sorted(user_dir, f'{user_id}/', scan_pool, Config.FSCK_PREFETCH)
+        return list_sorted(self.storage, f'{user_id}/')
+
+    # 两路有序序列归并
+    def check_user(self, user_id, scan_pool):
+        objects = self._objects(user_id, scan_pool)
+        rows = iter_rows(user_id, self.root, Config.FSCK_BATCH_SIZE)
+        obj = next(objects, None)
+        row = next(rows, None)
+        now = time.time()
+        missing = []
+
+        while obj is not None or row is not None:
+            if row is None or (obj is not None and obj[0] < row[0]):
+                self.report.bump('scanned')
+                # 最近写入的文件可能是正在进行的上传，暂不判定为孤立文件
+                if now - obj[2] > self.grace and self._confirm_orphan(obj):
+                    self.report.add('orphan', {'key': obj[0], 'size': obj[1]})
+                    if self.repair:
+                        self._quarantine(obj)
+                obj = next(objects, None)
+            elif obj is None or row[0] < obj[0]:
+                self.report.bump('rows')
+                if self._confirm_missing(row):
+                    self.report.add('missing', {'file_id': row[1], 'key': row[0]})
+                    if self.repair:
+                        missing.append(row)
+                        if len(missing) >= Config.FSCK_BATCH_SIZE:
+                            self._remove_rows(user_id, missing)
+                            missing = []
+                row = next(rows, None)
+            else:
+                self.report.bump('scanned')
+                self.report.bump('rows')
+                if row[2] != obj[1]:
+                    filepath, current = self._recheck_row(row), self.storage.stat(row[0])
+                    if filepath is not None and current is not None and current.size != row[2]:
+                        self.report.add('size', {'file_id': row[1], 'key': row[0], 'db': row[2], 'storage': current.size})
+                        if self.repair and self._rows_for(row, filepath).update(
+                                {'filesize': current.size}, synchronize_session=False):
+                            adjust(user_id, used=current.size - (row[2] or 0))
+                            self.report.bump('repaired')
+                obj = next(objects, None)
+                row = next(rows, None)
+
+        if missing:
+            self._remove_rows(user_id, missing)
+        if self.repair:
+            # 删除记录和修正大小后重新统计文件夹的递归大小（顺带修正其他原因造成的偏差）
+            self.report.bump('repaired', rebuild(user_id))
+        db.session.commit()
+
+    # 重新读取记录：存储键和大小与归并时相同时返回数据库中的 filepath，否则（已修改或删除）返回 None
+    def _recheck_row(self, row):
+        key, file_id, size = row[:3]
+        current = db.session.query(File.filepath, File.filesize).filter(File.id == file_id).first()
+        if current is None or current.filesize != size or _relative_key(current.filepath, self.root) != key:
+            return None
+        return current.filepath
+
+    # 以重新读取到的 filepath 和大小为条件的查询，期间被修改的行不会被更新或删除
+    def _rows_for(self, row, filepath):
+        return db.session.query(File).filter(File.id == row[1], File.filepath == filepath, File.filesize == row[2])
+
+    def _confirm_missing(self, row):
+        return self._recheck_row(row) is not None and self.storage.stat(row[0]) is None
+
+    # 对象仍然存在且未被改写，并且没有任何记录（包括归并之后新建或改名的记录）指向它
+    def _confirm_orphan(self, obj):
+        key, size, mtime = obj
+        current = self.storage.stat(key)
+        if current is None or current.size != size or current.mtime != mtime:
+            return False
+        paths = [key] + ([os.path.join(self.root, *key.split('/'))] if self.root else [])
+        return db.session.query(File.id).filter(File.filepath.in_(paths)).first() is None
+
+    # 删除存储中已不存在的文件记录（在归并读取结束的批次之后执行，不影响分页）
+    def _remove_rows(self, user_id, rows):
+        removed = []
+        for row in rows:
+            filepath = self._recheck_row(row)
+            if filepath is None or self.storage.stat(row[0]) is not None:
+                continue
+            if self._rows_for(row, filepath).delete(synchronize_session=False):
+                removed.append(row)
+        if not removed:
+            return
+        for key, file_id, _, folder_id, filename in removed:
+            record_change(user_id, 'file', file_id, 'delete', name=filename, parent_id=folder_id)
+        file_ids = [row[1] for row in removed]
+        ArchiveIndex.query.filter(ArchiveIndex.file_id.in_(file_ids)).delete(synchronize_session=False)
+        LineIndex.query.filter(LineIndex.file_id.in_(file_ids)).delete(synchronize_session=False)
+        adjust(user_id, used=-sum(row[2] or 0 for row in removed))
+        self.report.bump('repaired', len(removed))
+
+    # 孤立文件移入 .lost+found/<原键>，由管理员确认后再删除；移动前再确认一次
+    def _quarantine(self, obj):
+        key = obj[0]
+        if not self._confirm_orphan(obj):
+            return
+        try:
+            self.storage.rename(key, f'{LOST_FOUND_DIR}/{key}')
+            self.report.bump('repaired')
+        except Exception as e:
+            current_app.logger.warning(f"移动孤立文件失败 {key}: {str(e)}")
+
+
+def run_fsck(repair=False, job=None):
+    return Fsck(repair=repair, job=job).run()
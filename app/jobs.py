@@ -0,0 +1,81 @@
+import uuid
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+
+# 后台任务：在有界线程池中以应用上下文运行，管理员页面可查看状态
+# 只在当前进程内记录，保留最近 MAX_JOBS 个任务
+
+MAX_JOBS = 50
+
+_executor = None
+_jobs = OrderedDict()
+_lock = threading.Lock()
+
+
+class Job:
+    def __init__(self, name, description='', user_id=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.description = description
+        self.user_id = user_id  # 用户发起的任务记录发起人，管理员任务为空
+        self.state = 'pending'  # pending / running / done / failed
+        self.progress = ''
+        self.result = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.finished_at = None
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=app.config['JOBS_MAX_WORKERS'],
+                                               thread_name_prefix='job')
+    return _executor
+
+# 提交任务，func(job, *args) 可更新 job.progress，返回值记录为 job.result
+def submit_job(name, func, *args, description='', user_id=None):
+    app = current_app._get_current_object()
+    job = Job(name, description, user_id)
+    with _lock:
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_JOBS:
+            _jobs.popitem(last=False)
+
+    def run():
+        with app.app_context():
+            job.state = 'running'
+            try:
+                job.result = func(job, *args)
+                job.state = 'done'
+            except Exception as e:
+                job.state = 'failed'
+                job.error = f'{e}\n{traceback.format_exc()}'
+            finally:
+                job.finished_at = datetime.utcnow()
+                from app import db
+                db.session.remove()
+
+    _get_executor(app).submit(run)
+    return job
+
+def list_jobs():
+    with _lock:
+        return list(reversed(_jobs.values()))
+
+def get_job(job_id):
+    return _jobs.get(job_id)
+
+# 同名任务是否正在运行（避免重复触发）；指定 user_id 时只看该用户的任务
+def job_running(name, user_id=None):
+    return any(job.name == name and job.state in ('pending', 'running')
+               and (user_id is None or job.user_id == user_id) for job in list_jobs())
+
+def user_jobs(user_id, name=None):
+    return [job for job in list_jobs() if job.user_id == user_id and (name is None or job.name == name)]
@@ -0,0 +1,70 @@
+import time
+from datetime import datetime
+from app import db
+from app.models import ChangeJournal
+from app.config import BaseConfig as Config
+
+# 记录一条变更（只加入会话，随调用方的 commit 一起提交，保证与业务修改原子）
+def record_change(user_id, entity, entity_id, action, name=None, parent_id=None,
+                  old_parent_id=None, size=None):
+    entry = ChangeJournal(
+        user_id=user_id,
+        entity=entity,
+        entity_id=entity_id,
+        action=action,
+        name=name,
+        parent_id=parent_id,
+        old_parent_id=old_parent_id,
+        size=size
+    )
+    db.session.add(entry)
+    return entry
+
+# 游标格式: "<最后一条日志ID>-<签发时间戳>"
+# 签发时间用于判断压缩是否可能删掉了客户端尚未看到的记录，无需额外查询
+def make_cursor(last_id, issued_at=None):
+    return f"{int(last_id)}-{int(issued_at if issued_at is not None else time.time())}"
+
+def parse_cursor(cursor):
+    try:
+        last_id, issued_at = cursor.split('-', 1)
+        return int(last_id), int(issued_at)
+    except (AttributeError, ValueError):
+        return None, None
+
+def cursor_expired(issued_at, now=None):
+    now = now if now is not None else time.time()
+    return now - issued_at > Config.JOURNAL_RETENTION.total_seconds()
+
+# 获取某用户在游标之后的变更
+def changes_since(user_id, last_id, limit):
+    rows = ChangeJournal.query.filter(
+        ChangeJournal.user_id == user_id,
+        ChangeJournal.id > last_id
+    ).order_by(ChangeJournal.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    return rows[:limit], has_more
+
+# 当前最新游标（首次同步时使用）
+def latest_id(user_id):
+    last = db.session.query(ChangeJournal.id).filter(
+        ChangeJournal.user_id == user_id
+    ).order_by(ChangeJournal.id.desc()).first()
+    return last[0] if last else 0
+
+# 压缩：分批删除超过保留期的日志，返回删除条数
+def compact_journal(retention=None, batch_size=None):
+    retention = retention or Config.JOURNAL_RETENTION
+    batch_size = batch_size or Config.JOURNAL_COMPACT_BATCH
+    cutoff = datetime.utcnow() - retention
+    removed = 0
+    while True:
+        ids = [row[0] for row in db.session.query(ChangeJournal.id).filter(
+            ChangeJournal.created_at < cutoff
+        ).order_by(ChangeJournal.id).limit(batch_size)]
+        if not ids:
+            break
+        ChangeJournal.query.filter(ChangeJournal.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        removed += len(ids)
+    return removed
@@ -0,0 +1,199 @@
+import importlib
+import pkgutil
+from datetime import datetime
+import sqlalchemy as sa
+from app import db
+
+# 数据库结构迁移
+#
+# 每个迁移是本包中名为 v<版本号>_<说明>.py 的模块，提供 VERSION、DESCRIPTION 和 upgrade(ctx)。
+# 已应用的版本记录在 schema_version 表中；应用启动时只读取这一张表的最大版本号，不反射整个数据库结构。
+#
+# 迁移脚本要求：
+#   可重复执行：通过 ctx.has_table / has_column / has_index 判断，已存在的对象跳过
+#               （由 db.create_all() 建立的旧数据库可以直接升级，中途失败后也可以重新运行）；
+#   对大表友好：加列只加可为空或带常量默认值的列（主流数据库上只改元数据），
+#               回填数据用 ctx.backfill 分批提交，建索引用 ctx.create_index（尽量不阻塞写入）。
+#   迁移模块中的表结构是当时的快照，不引用 app.models，模型以后的修改不会影响旧迁移。
+
+SCHEMA_TABLE = 'schema_version'
+
+_metadata = sa.MetaData()
+schema_version = sa.Table(
+    SCHEMA_TABLE, _metadata,
+    sa.Column('version', sa.Integer, primary_key=True),
+    sa.Column('description', sa.String(255)),
+    sa.Column('applied_at', sa.DateTime),
+)
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+_migrations = None
+
+# 按版本号排序的迁移模块列表，版本号必须从 1 开始连续
+def load_migrations():
+    global _migrations
+    if _migrations is None:
+        modules = [importlib.import_module(f'{__name__}.{info.name}')
+                   for info in pkgutil.iter_modules(__path__) if info.name.startswith('v')]
+        modules.sort(key=lambda m: m.VERSION)
+        for expected, module in enumerate(modules, 1):
+            if module.VERSION != expected:
+                raise MigrationError(f'迁移版本号不连续: 期望 {expected}，实际为 {module.__name__}')
+        _migrations = modules
+    return _migrations
+
+def latest_version():
+    migrations = load_migrations()
+    return migrations[-1].VERSION if migrations else 0
+
+# 数据库当前的结构版本，还没有 schema_version 表时为 0
+def current_version(engine=None):
+    engine = engine or db.engine
+    try:
+        with engine.connect() as conn:
+            return conn.execute(sa.select(sa.func.max(schema_version.c.version))).scalar() or 0
+    except (sa.exc.OperationalError, sa.exc.ProgrammingError):
+        return 0
+
+
+# 传给迁移脚本的辅助对象：每条语句单独提交，便于大表上的操作分段进行
+class MigrationContext:
+    def __init__(self, engine, echo=print):
+        self.engine = engine
+        self.dialect = engine.dialect
+        self.echo = echo
+
+    def quote(self, name):
+        return self.dialect.identifier_preparer.quote(name)
+
+    def execute(self, statement, params=None):
+        if isinstance(statement, str):
+            statement = sa.text(statement)
+        with self.engine.begin() as conn:
+            return conn.execute(statement, params or {})
+
+    def _inspector(self):
+        return sa.inspect(self.engine)
+
+    def has_table(self, table):
+        return self._inspector().has_table(table)
+
+    def has_column(self, table, column):
+        return any(c['name'] == column for c in self._inspector().get_columns(table))
+
+    def has_index(self, table, name):
+        return any(i['name'] == name for i in self._inspector().get_indexes(table))
+
+    # 建表（已存在的跳过），tables 为迁移模块中的表结构快照
+    # 快照的 MetaData 中可以有只含主键的外键目标表，它们不会被创建
+    def create_tables(self, *tables):
+        tables[0].metadata.create_all(self.engine, tables=list(tables), checkfirst=True)
+
+    # 加列：column 为 sa.Column，NOT NULL 列必须带 server_default
+    def add_column(self, table, column):
+        if self.has_column(table, column.name):
+            return
+        if not column.nullable and column.server_default is None:
+            raise MigrationError(f'大表上新增的非空列 {table}.{column.name} 必须带默认值')
+        sa.Table(table, sa.MetaData(), column)  # CreateColumn 需要列属于某张表
+        ddl = sa.schema.CreateColumn(column).compile(dialect=self.dialect)
+        self.echo(f'  添加列 {table}.{column.name}')
+        self.execute(f'ALTER TABLE {self.quote(table)} ADD COLUMN {ddl}')
+
+    # 加长字符串列：SQLite 不检查长度，跳过；PostgreSQL 加长 VARCHAR 只改元数据
+    def widen_column(self, table, column, length, nullable=True):
+        if self.dialect.name == 'sqlite':
+            return
+        current = next(c for c in self._inspector().get_columns(table) if c['name'] == column)
+        if (getattr(current['type'], 'length', None) or 0) >= length:
+            return
+        ddl = sa.String(length).compile(dialect=self.dialect)
+        self.echo(f'  加长列 {table}.{column} 为 {ddl}')
+        if self.dialect.name in ('mysql', 'mariadb'):
+            null = 'NULL' if nullable else 'NOT NULL'
+            self.execute(f'ALTER TABLE {self.quote(table)} MODIFY {self.quote(column)} {ddl} {null}, ALGORITHM=INPLACE, LOCK=NONE')
+        else:
+            self.execute(f'ALTER TABLE {self.quote(table)} ALTER COLUMN {self.quote(column)} TYPE {ddl}')
+
+    # 建索引：PostgreSQL 使用 CONCURRENTLY（不阻塞写入，不能在事务中执行），
+    # MySQL 使用在线 DDL（ALGORITHM=INPLACE, LOCK=NONE），其他数据库普通建索引
+    def create_index(self, name, table, columns, unique=False):
+        if self.has_index(table, name):
+            return
+        cols = ', '.join(self.quote(c) for c in columns)
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        self.echo(f'  创建索引 {name}')
+        if self.dialect.name == 'postgresql':
+            with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(sa.text(f'CREATE {kind} CONCURRENTLY {self.quote(name)} ON {self.quote(table)} ({cols})'))
+        elif self.dialect.name in ('mysql', 'mariadb'):
+            self.execute(f'CREATE {kind} {self.quote(name)} ON {self.quote(table)} ({cols}) ALGORITHM=INPLACE LOCK=NONE')
+        else:
+            self.execute(f'CREATE {kind} {self.quote(name)} ON {self.quote(table)} ({cols})')
+
+    # 分批回填：按主键顺序每次更新 batch_size 行并单独提交，锁只持有很短的时间
+    # assignments 为 SET 子句，where 限定需要回填的行（回填后应不再满足，重新运行时可跳过已完成的部分）
+    def backfill(self, table, assignments, where, batch_size=None, pk='id', params=None):
+        from app.config import BaseConfig as Config
+        batch_size = batch_size or Config.MIGRATION_BATCH_SIZE
+        t, key = self.quote(table), self.quote(pk)
+        last, total = None, 0
+        while True:
+            with self.engine.begin() as conn:
+                bound = f'{key} > :last AND ' if last is not None else ''
+                ids = [row[0] for row in conn.execute(sa.text(
+                    f'SELECT {key} FROM {t} WHERE {bound}({where}) ORDER BY {key} LIMIT :limit'),
+                    {**(params or {}), 'last': last, 'limit': batch_size})]
+                if not ids:
+                    break
+                conn.execute(sa.text(
+                    f'UPDATE {t} SET {assignments} WHERE {key} >= :first AND {key} <= :final AND ({where})'),
+                    {**(params or {}), 'first': ids[0], 'final': ids[-1]})
+            last = ids[-1]
+            total += len(ids)
+            self.echo(f'  已回填 {table} {total} 行')
+        return total
+
+
+# 升级到 target 版本（默认最新），返回本次应用的版本号列表
+def upgrade(target=None, engine=None, echo=print):
+    engine = engine or db.engine
+    target = latest_version() if target is None else target
+    schema_version.create(engine, checkfirst=True)
+    current = current_version(engine)
+    ctx = MigrationContext(engine, echo)
+    applied = []
+    for migration in load_migrations():
+        if current < migration.VERSION <= target:
+            echo(f'应用迁移 {migration.VERSION:04d}: {migration.DESCRIPTION}')
+            migration.upgrade(ctx)
+            with engine.begin() as conn:
+                conn.execute(schema_version.insert().values(
+                    version=migration.VERSION, description=migration.DESCRIPTION, applied_at=datetime.utcnow()))
+            applied.append(migration.VERSION)
+    return applied
+
+
+# 应用启动时调用：只检查版本号。版本落后时请求返回 503，直到在其他进程中完成升级
+def init_app(app):
+    with app.app_context():
+        if app.config.get('SCHEMA_AUTO_UPGRADE'):
+            upgrade(echo=app.logger.info)
+        up_to_date = current_version() >= latest_version()
+    if up_to_date:
+        return
+    app.logger.warning('数据库结构版本过旧，请运行 flask --app run db-upgrade')
+    state = {'ok': False}
+
+    @app.before_request
+    def require_schema():
+        if state['ok']:
+            return None
+        if current_version() >= latest_version():
+            state['ok'] = True
+            return None
+        return '数据库结构版本过旧，请管理员运行 flask --app run db-upgrade', 503
@@ -0,0 +1,54 @@
+import sqlalchemy as sa
+
+VERSION = 1
+DESCRIPTION = '初始表结构：用户、文件夹、文件、帖子'
+
+metadata = sa.MetaData()
+
+user = sa.Table(
+    'user', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('username', sa.String(64), unique=True, nullable=False),
+    sa.Column('email', sa.String(120), unique=True, nullable=False),
+    sa.Column('password_hash', sa.String(128)),
+    sa.Column('confirmed', sa.Boolean),
+    sa.Column('confirmation_token', sa.String(36), unique=True),
+    sa.Column('created_at', sa.DateTime),
+    sa.Column('avatar_filename', sa.String(255)),
+    sa.Column('avatar_path', sa.String(512)),
+    sa.Column('admin_authenticated', sa.Boolean),
+    sa.Column('admin_auth_time', sa.DateTime),
+)
+
+folder = sa.Table(
+    'folder', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('name', sa.String(255), nullable=False),
+    sa.Column('created_time', sa.DateTime),
+    sa.Column('parent_id', sa.Integer, sa.ForeignKey('folder.id')),
+    sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id'), nullable=False),
+)
+
+file = sa.Table(
+    'file', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('filename', sa.String(255), nullable=False),
+    sa.Column('filepath', sa.String(512), nullable=False),
+    sa.Column('filesize', sa.Integer),
+    sa.Column('upload_time', sa.DateTime),
+    sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id'), nullable=False),
+    sa.Column('folder_id', sa.Integer, sa.ForeignKey('folder.id')),
+)
+
+post = sa.Table(
+    'post', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('title', sa.String(100), nullable=False),
+    sa.Column('content', sa.Text, nullable=False),
+    sa.Column('created_at', sa.DateTime),
+    sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id')),
+)
+
+
+def upgrade(ctx):
+    ctx.create_tables(user, folder, file, post)
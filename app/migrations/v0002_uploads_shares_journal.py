@@ -0,0 +1,57 @@
+import sqlalchemy as sa
+
+VERSION = 2
+DESCRIPTION = '分片上传会话、分享链接、变更日志'
+
+metadata = sa.MetaData()
+
+# 外键目标（已由 0001 创建）
+sa.Table('user', metadata, sa.Column('id', sa.Integer, primary_key=True))
+sa.Table('folder', metadata, sa.Column('id', sa.Integer, primary_key=True))
+sa.Table('file', metadata, sa.Column('id', sa.Integer, primary_key=True))
+
+upload_session = sa.Table(
+    'upload_session', metadata,
+    sa.Column('id', sa.String(32), primary_key=True),
+    sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id'), nullable=False, index=True),
+    sa.Column('folder_id', sa.Integer, sa.ForeignKey('folder.id')),
+    sa.Column('filename', sa.String(255), nullable=False),
+    sa.Column('key', sa.String(512), nullable=False),
+    sa.Column('upload_id', sa.String(256), nullable=False),
+    sa.Column('declared_size', sa.BigInteger),
+    sa.Column('created_at', sa.DateTime, index=True),
+)
+
+share_link = sa.Table(
+    'share_link', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id'), nullable=False, index=True),
+    sa.Column('file_id', sa.Integer, sa.ForeignKey('file.id', ondelete='CASCADE')),
+    sa.Column('folder_id', sa.Integer, sa.ForeignKey('folder.id', ondelete='CASCADE')),
+    sa.Column('token', sa.String(512), nullable=False),
+    sa.Column('password_hash', sa.String(256)),
+    sa.Column('max_downloads', sa.Integer),
+    sa.Column('download_count', sa.Integer, nullable=False),
+    sa.Column('expires_at', sa.DateTime),
+    sa.Column('revoked', sa.Boolean, nullable=False, index=True),
+    sa.Column('created_at', sa.DateTime),
+)
+
+change_journal = sa.Table(
+    'change_journal', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('user_id', sa.Integer, nullable=False),
+    sa.Column('entity', sa.String(16), nullable=False),
+    sa.Column('entity_id', sa.Integer, nullable=False),
+    sa.Column('action', sa.String(16), nullable=False),
+    sa.Column('name', sa.String(255)),
+    sa.Column('parent_id', sa.Integer),
+    sa.Column('old_parent_id', sa.Integer),
+    sa.Column('size', sa.Integer),
+    sa.Column('created_at', sa.DateTime, index=True),
+    sa.Index('ix_change_journal_user_cursor', 'user_id', 'id'),
+)
+
+
+def upgrade(ctx):
+    ctx.create_tables(upload_session, share_link, change_journal)
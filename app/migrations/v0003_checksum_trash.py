@@ -0,0 +1,21 @@
+import sqlalchemy as sa
+
+VERSION = 3
+DESCRIPTION = '文件校验和与回收站字段'
+
+# file / folder 可能很大：只加可为空或带常量默认值的列，索引单独在线创建
+
+
+def upgrade(ctx):
+    ctx.add_column('file', sa.Column('checksum', sa.String(64)))
+    ctx.add_column('file', sa.Column('checksum_verified_at', sa.DateTime))
+    ctx.add_column('file', sa.Column('checksum_mismatch', sa.Boolean, nullable=False, server_default=sa.false()))
+    ctx.add_column('file', sa.Column('deleted_at', sa.DateTime))
+    ctx.add_column('folder', sa.Column('deleted_at', sa.DateTime))
+
+    ctx.create_index('ix_file_checksum_verified_at', 'file', ['checksum_verified_at'])
+    ctx.create_index('ix_file_checksum_mismatch', 'file', ['checksum_mismatch'])
+    ctx.create_index('ix_file_deleted_at', 'file', ['deleted_at'])
+    ctx.create_index('ix_file_user_folder_deleted', 'file', ['user_id', 'folder_id', 'deleted_at'])
+    ctx.create_index('ix_folder_deleted_at', 'folder', ['deleted_at'])
+    ctx.create_index('ix_folder_user_parent_deleted', 'folder', ['user_id', 'parent_id', 'deleted_at'])
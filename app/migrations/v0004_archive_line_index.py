@@ -0,0 +1,33 @@
+import sqlalchemy as sa
+
+VERSION = 4
+DESCRIPTION = '压缩包成员索引与文本预览行索引'
+
+metadata = sa.MetaData()
+
+archive_index = sa.Table(
+    'archive_index', metadata,
+    sa.Column('file_id', sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column('etag', sa.String(128), nullable=False),
+    sa.Column('format', sa.String(8), nullable=False),
+    sa.Column('member_count', sa.Integer, nullable=False),
+    sa.Column('total_size', sa.BigInteger),
+    sa.Column('members', sa.Text, nullable=False),
+    sa.Column('created_at', sa.DateTime),
+)
+
+line_index = sa.Table(
+    'line_index', metadata,
+    sa.Column('file_id', sa.Integer, primary_key=True, autoincrement=False),
+    sa.Column('etag', sa.String(128), nullable=False),
+    sa.Column('stride', sa.Integer, nullable=False),
+    sa.Column('offsets', sa.Text, nullable=False),
+    sa.Column('scanned_pos', sa.BigInteger, nullable=False),
+    sa.Column('scanned_lines', sa.BigInteger, nullable=False),
+    sa.Column('line_count', sa.BigInteger),
+    sa.Column('updated_at', sa.DateTime),
+)
+
+
+def upgrade(ctx):
+    ctx.create_tables(archive_index, line_index)
@@ -0,0 +1,8 @@
+VERSION = 5
+DESCRIPTION = '加长密码哈希列'
+
+# scrypt 哈希约 160 个字符，参数更高时更长，原来的 128 不够
+
+
+def upgrade(ctx):
+    ctx.widen_column('user', 'password_hash', 255)
@@ -0,0 +1,19 @@
+import sqlalchemy as sa
+
+VERSION = 6
+DESCRIPTION = '用户存储配额与用量'
+
+# used_bytes 先以可为空的列加入，再按用户分批回填（回填期间旧进程新建的用户为空，按 0 处理）
+
+
+def upgrade(ctx):
+    ctx.add_column('user', sa.Column('plan', sa.String(32)))
+    ctx.add_column('user', sa.Column('quota_bytes', sa.BigInteger))
+    ctx.add_column('user', sa.Column('used_bytes', sa.BigInteger))
+    ctx.add_column('user', sa.Column('reserved_bytes', sa.BigInteger, nullable=False, server_default='0'))
+    # 已有的分片会话创建时没有预留空间，记为 0
+    ctx.add_column('upload_session', sa.Column('reserved_bytes', sa.BigInteger, nullable=False, server_default='0'))
+
+    user, file = ctx.quote('user'), ctx.quote('file')
+    ctx.backfill('user', f'used_bytes = (SELECT COALESCE(SUM(filesize), 0) FROM {file} WHERE {file}.user_id = {user}.id)',
+                 'used_bytes IS NULL')
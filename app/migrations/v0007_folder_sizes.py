@@ -0,0 +1,50 @@
+import sqlalchemy as sa
+
+VERSION = 7
+DESCRIPTION = '文件夹递归大小与文件数'
+
+# 新列默认为 0，再按用户逐个统计：每个用户一个事务，读取其全部文件夹和按文件夹汇总的文件大小，
+# 在内存中自下而上累加后写回。升级期间仍在运行的旧版本进程不维护这两列，
+# 升级完成后可运行 flask --app run folder-sizes-rebuild 修正。
+
+
+def _rollup(folders, direct):
+    parents = {row.id: row.parent_id for row in folders}
+    trashed = {row.id for row in folders if row.deleted_at is not None}
+    children = {}
+    for folder_id, parent_id in parents.items():
+        children.setdefault(parent_id, []).append(folder_id)
+    order = [folder_id for folder_id, parent_id in parents.items() if parent_id not in parents]
+    for folder_id in order:
+        order.extend(children.get(folder_id, ()))
+    result = {folder_id: list(direct.get(folder_id, (0, 0))) for folder_id in parents}
+    for folder_id in reversed(order):
+        parent_id = parents[folder_id]
+        if parent_id in result and folder_id not in trashed:
+            result[parent_id][0] += result[folder_id][0]
+            result[parent_id][1] += result[folder_id][1]
+    return result
+
+
+def upgrade(ctx):
+    ctx.add_column('folder', sa.Column('total_bytes', sa.BigInteger, nullable=False, server_default='0'))
+    ctx.add_column('folder', sa.Column('file_count', sa.Integer, nullable=False, server_default='0'))
+
+    folder, file = ctx.quote('folder'), ctx.quote('file')
+    user_ids = [row[0] for row in ctx.execute(f'SELECT DISTINCT user_id FROM {folder}')]
+    for n, user_id in enumerate(user_ids, 1):
+        with ctx.engine.begin() as conn:
+            folders = conn.execute(sa.text(
+                f'SELECT id, parent_id, deleted_at FROM {folder} WHERE user_id = :user_id'),
+                {'user_id': user_id}).all()
+            direct = {row[0]: (row[1], row[2]) for row in conn.execute(sa.text(
+                f'SELECT folder_id, COALESCE(SUM(filesize), 0), COUNT(*) FROM {file} '
+                f'WHERE user_id = :user_id AND folder_id IS NOT NULL AND deleted_at IS NULL GROUP BY folder_id'),
+                {'user_id': user_id})}
+            params = [{'id': folder_id, 'nbytes': nbytes, 'count': count}
+                      for folder_id, (nbytes, count) in _rollup(folders, direct).items() if nbytes or count]
+            if params:
+                conn.execute(sa.text(f'UPDATE {folder} SET total_bytes = :nbytes, file_count = :count WHERE id = :id'),
+                             params)
+        if n % 100 == 0:
+            ctx.echo(f'  已统计 {n} 个用户的文件夹')
@@ -0,0 +1,25 @@
+import sqlalchemy as sa
+
+VERSION = 8
+DESCRIPTION = '管理员会话'
+
+metadata = sa.MetaData()
+
+# 外键目标（已由 0001 创建）
+sa.Table('user', metadata, sa.Column('id', sa.Integer, primary_key=True))
+
+admin_session = sa.Table(
+    'admin_session', metadata,
+    sa.Column('id', sa.String(32), primary_key=True),
+    sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id'), nullable=False, index=True),
+    sa.Column('created_at', sa.DateTime),
+    sa.Column('expires_at', sa.DateTime, nullable=False, index=True),
+    sa.Column('revoked_at', sa.DateTime),
+    sa.Column('ip', sa.String(45)),
+)
+
+# user.admin_authenticated / admin_auth_time 不再使用，保留到旧版本进程全部退出之后
+
+
+def upgrade(ctx):
+    ctx.create_tables(admin_session)
@@ -0,0 +1,10 @@
+import sqlalchemy as sa
+
+VERSION = 9
+DESCRIPTION = '分片会话已接收的字节数'
+
+# 已有的会话记为 0（合并时仍按实际大小补扣配额）
+
+
+def upgrade(ctx):
+    ctx.add_column('upload_session', sa.Column('uploaded_bytes', sa.BigInteger, nullable=False, server_default='0'))
@@ -11,7 +11,7 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(255))
     # 邮箱验证相关字段
     confirmed = db.Column(db.Boolean, default=False)
     confirmation_token = db.Column(db.String(36), unique=True)
@@ -25,16 +25,29 @@ class User(UserMixin, db.Model):
     files = db.relationship('File', backref='owner', lazy=True, cascade="all, delete-orphan")
     folders = db.relationship('Folder', backref='owner', lazy=True, cascade="all, delete-orphan")
 
-    admin_authenticated = db.Column(db.Boolean, default=False)  # 标记是否通过管理员验证
-    admin_auth_time = db.Column(db.DateTime)  # 记录验证时间
+    # 存储配额（见 app/quotas.py）
+    plan = db.Column(db.String(32), nullable=True)  # 套餐名，为空时使用 QUOTA_DEFAULT_PLAN
+    quota_bytes = db.Column(db.BigInteger, nullable=True)  # 单独设置的配额，优先于套餐
+    used_bytes = db.Column(db.BigInteger, default=0)  # 已保存文件的大小之和（含回收站）
+    reserved_bytes = db.Column(db.BigInteger, default=0, nullable=False)  # 进行中的上传预留的空间
     
+    # 已不再使用（管理员会话见 AdminSession），保留列以兼容升级期间仍在运行的旧版本进程
+    admin_authenticated = db.Column(db.Boolean, default=False)
+    admin_auth_time = db.Column(db.DateTime)
+    
+    # 哈希在进程池中计算，参数见 PASSWORD_HASH_* 配置
     def set_password(self, password):
-        from werkzeug.security import generate_password_hash
-        self.password_hash = generate_password_hash(password)
+        from app.passwords import hash_password
+        self.password_hash = hash_password(password)
         
     def check_password(self, password):
-        from werkzeug.security import check_password_hash
-        return check_password_hash(self.password_hash, password)
+        from app.passwords import verify_password
+        return verify_password(self.password_hash, password)
+    
+    # 密码哈希使用的是旧参数（登录成功后用明文重新计算）
+    def password_needs_rehash(self):
+        from app.passwords import needs_rehash
+        return needs_rehash(self.password_hash)
     
     # 生成邮箱验证令牌
     def generate_confirmation_token(self):
@@ -46,20 +59,18 @@ class User(UserMixin, db.Model):
     # 获取头像URL
     def get_avatar(self, size=128):
         if self.avatar_filename:
-            return f"/static/avatars/{self.avatar_filename}"
+            return f"/user/avatar/{self.avatar_filename}"
         # 默认头像
         return f"https://ui-avatars.com/api/?name={self.username}&size={size}"
     
     # 删除用户所有数据（用于账号销毁）
     def delete_all_data(self):
-        # 删除用户文件夹和文件
-        user_dir = os.path.join(Config.UPLOAD_FOLDER, str(self.id))
-        if os.path.exists(user_dir):
-            import shutil
-            try:
-                shutil.rmtree(user_dir)
-            except Exception as e:
-                print(f"删除用户文件失败: {str(e)}")
+        # 删除用户文件夹和文件（存储中 <用户ID>/ 前缀下的全部对象）
+        from app.storage import get_storage
+        try:
+            get_storage().delete_prefix(f'{self.id}/')
+        except Exception as e:
+            print(f"删除用户文件失败: {str(e)}")
         
         # 头像文件
         if self.avatar_path and os.path.exists(self.avatar_path):
@@ -67,6 +78,17 @@ class User(UserMixin, db.Model):
                 os.remove(self.avatar_path)
             except Exception as e:
                 print(f"删除头像失败: {str(e)}")
+        if self.avatar_filename:
+            from app.filecache import hot_files
+            hot_files.invalidate(f'avatar:{self.avatar_filename}')
+
+        # 分享链接、变更日志、压缩包索引与行索引
+        own_files = db.session.query(File.id).filter(File.user_id == self.id)
+        ArchiveIndex.query.filter(ArchiveIndex.file_id.in_(own_files)).delete(synchronize_session=False)
+        LineIndex.query.filter(LineIndex.file_id.in_(own_files)).delete(synchronize_session=False)
+        ShareLink.query.filter_by(user_id=self.id).delete(synchronize_session=False)
+        ChangeJournal.query.filter_by(user_id=self.id).delete(synchronize_session=False)
+        AdminSession.query.filter_by(user_id=self.id).delete(synchronize_session=False)
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -78,6 +100,13 @@ class Folder(db.Model):
     created_time = db.Column(db.DateTime, default=datetime.utcnow)  # 创建时间
     parent_id = db.Column(db.Integer, db.ForeignKey('folder.id'), nullable=True)  # 支持子文件夹
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # 外键关联用户
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True)  # 移入回收站的时间，只在顶层条目上设置
+    # 子树中所有文件的大小之和与个数（不含回收站中的条目），由 app.foldersize 增量维护
+    total_bytes = db.Column(db.BigInteger, default=0, nullable=False)
+    file_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    # 列表查询: user_id + parent_id + deleted_at IS NULL
+    __table_args__ = (db.Index('ix_folder_user_parent_deleted', 'user_id', 'parent_id', 'deleted_at'),)
     
     # 自引用，用于子文件夹
     subfolders = db.relationship('Folder', backref=db.backref('parent', remote_side=[id]), lazy=True, cascade="all, delete-orphan")
@@ -94,9 +123,17 @@ class File(db.Model):
     filepath = db.Column(db.String(512), nullable=False)  # 文件存储路径
     filesize = db.Column(db.Integer)  # 文件大小(字节)
     upload_time = db.Column(db.DateTime, default=datetime.utcnow)  # 上传时间
+    # 完整性校验
+    checksum = db.Column(db.String(64), nullable=True)  # SHA-256，写入时计算
+    checksum_verified_at = db.Column(db.DateTime, nullable=True, index=True)  # 最近一次校验时间
+    checksum_mismatch = db.Column(db.Boolean, default=False, nullable=False, index=True)  # 校验不一致
     # 外键关联用户和文件夹
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     folder_id = db.Column(db.Integer, db.ForeignKey('folder.id'), nullable=True)  # 可以属于某个文件夹
+    deleted_at = db.Column(db.DateTime, nullable=True, index=True)  # 移入回收站的时间
+    
+    # 列表查询: user_id + folder_id + deleted_at IS NULL
+    __table_args__ = (db.Index('ix_file_user_folder_deleted', 'user_id', 'folder_id', 'deleted_at'),)
     
     def __repr__(self):
         return f'<File {self.filename}>'
@@ -112,4 +149,117 @@ class Post(db.Model):
     author = db.relationship('User', backref=db.backref('posts', lazy=True))
     
     def __repr__(self):
-        return f'<Post {self.title}>'
\ No newline at end of file
+        return f'<Post {self.title}>'
+
+
+# 分片上传会话：大文件分多次请求上传，完成后合并为一个 File
+class UploadSession(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # 随机会话ID
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    folder_id = db.Column(db.Integer, db.ForeignKey('folder.id'), nullable=True)
+    filename = db.Column(db.String(255), nullable=False)
+    key = db.Column(db.String(512), nullable=False)  # 目标存储键
+    upload_id = db.Column(db.String(256), nullable=False)  # 存储后端的分片上传ID
+    declared_size = db.Column(db.BigInteger, nullable=True)  # 客户端声明的文件大小
+    reserved_bytes = db.Column(db.BigInteger, default=0, nullable=False)  # 创建时预留的配额空间
+    uploaded_bytes = db.Column(db.BigInteger, default=0, nullable=False)  # 已接收的分片字节数（重复上传的分片也计入）
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<UploadSession {self.id}>'
+
+
+# 分享链接：令牌本身带签名，常规下载无需查询此表；此表用于管理、撤销、密码和次数限制
+class ShareLink(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    file_id = db.Column(db.Integer, db.ForeignKey('file.id', ondelete='CASCADE'), nullable=True)
+    folder_id = db.Column(db.Integer, db.ForeignKey('folder.id', ondelete='CASCADE'), nullable=True)
+    token = db.Column(db.String(512), nullable=False)
+    password_hash = db.Column(db.String(256), nullable=True)  # 可选访问密码
+    max_downloads = db.Column(db.Integer, nullable=True)  # 可选下载次数上限
+    download_count = db.Column(db.Integer, default=0, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=True)  # 为空表示永不过期
+    revoked = db.Column(db.Boolean, default=False, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    file = db.relationship('File')
+    folder = db.relationship('Folder')
+
+    def __repr__(self):
+        return f'<ShareLink {self.id}>'
+
+
+# 变更日志：记录文件/文件夹的每一次增删改，供同步客户端按游标增量拉取
+class ChangeJournal(db.Model):
+    id = db.Column(db.Integer, primary_key=True)  # 自增ID即同步游标
+    user_id = db.Column(db.Integer, nullable=False)  # 不建外键，用户删除时批量清理
+    entity = db.Column(db.String(16), nullable=False)  # file / folder / avatar
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(16), nullable=False)  # create / upload / rename / move / delete / restore / update
+    name = db.Column(db.String(255))  # 变更后的名称
+    parent_id = db.Column(db.Integer)  # 变更后所在文件夹
+    old_parent_id = db.Column(db.Integer)  # 移动前所在文件夹
+    size = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    # 空闲轮询只需一次 (user_id, id) 范围查询
+    __table_args__ = (db.Index('ix_change_journal_user_cursor', 'user_id', 'id'),)
+
+    def to_dict(self):
+        return {
+            'cursor': self.id,
+            'entity': self.entity,
+            'id': self.entity_id,
+            'action': self.action,
+            'name': self.name,
+            'parent_id': self.parent_id,
+            'old_parent_id': self.old_parent_id,
+            'size': self.size,
+            'time': self.created_at.isoformat() + 'Z' if self.created_at else None,
+        }
+
+    def __repr__(self):
+        return f'<ChangeJournal {self.id} {self.entity}:{self.entity_id} {self.action}>'
+
+# 压缩包成员索引缓存：etag 与存储中的对象不一致时重建
+class ArchiveIndex(db.Model):
+    file_id = db.Column(db.Integer, primary_key=True)  # 不建外键，文件彻底删除时一并清理
+    etag = db.Column(db.String(128), nullable=False)
+    format = db.Column(db.String(8), nullable=False)  # zip / tar / tgz / gz / 7z
+    member_count = db.Column(db.Integer, nullable=False)
+    total_size = db.Column(db.BigInteger)
+    members = db.Column(db.Text, nullable=False)  # JSON 成员列表
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ArchiveIndex {self.file_id}>'
+
+# 文本预览的稀疏行索引：每隔 stride 行记录一次行首偏移，按需向后扩展
+class LineIndex(db.Model):
+    file_id = db.Column(db.Integer, primary_key=True)  # 不建外键，文件彻底删除时一并清理
+    etag = db.Column(db.String(128), nullable=False)
+    stride = db.Column(db.Integer, nullable=False)
+    offsets = db.Column(db.Text, nullable=False)  # JSON: 第 k*stride+1 行的起始偏移
+    scanned_pos = db.Column(db.BigInteger, nullable=False, default=0)  # 已扫描到的字节位置
+    scanned_lines = db.Column(db.BigInteger, nullable=False, default=0)  # scanned_pos 之前的换行数
+    line_count = db.Column(db.BigInteger)  # 扫描到文件末尾后才有值
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<LineIndex {self.file_id}>'
+
+
+# 管理员会话：通过密钥验证时写入一行，之后的请求只校验签名令牌和内存中的撤销列表（见 app.adminauth）
+class AdminSession(db.Model):
+    id = db.Column(db.String(32), primary_key=True)  # 会话ID，写在令牌中
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, nullable=True)  # 撤销时间
+    ip = db.Column(db.String(45))  # 验证时的客户端地址
+
+    user = db.relationship('User')
+
+    def __repr__(self):
+        return f'<AdminSession {self.id}>'
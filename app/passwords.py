@@ -0,0 +1,91 @@
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# 密码哈希与校验
+#
+# 哈希计算是纯 CPU 运算且持有 GIL，在请求线程中执行会拖慢同一进程中的所有请求。
+# PASSWORD_HASH_WORKERS > 0 时交给进程池计算，请求线程只等待结果；
+# 同时排队的任务数不超过 PASSWORD_HASH_MAX_PENDING，超出时等待空位，超时返回 503。
+# 哈希参数由 PASSWORD_HASH_METHOD 配置（werkzeug 格式，如 scrypt:32768:8:1、pbkdf2:sha256:600000），
+# 修改后旧哈希仍可校验，用户下次登录成功时按新参数重新计算。
+
+
+class PasswordHashBusy(ServiceUnavailable):
+    description = '登录请求过多，请稍后重试'
+
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+_methods = {}
+
+
+def _get_executor(config):
+    global _executor, _slots
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                # 请求线程已在运行时 fork 不安全，使用 forkserver（不支持的平台用 spawn）
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                if _slots is None:
+                    _slots = threading.BoundedSemaphore(config['PASSWORD_HASH_MAX_PENDING'])
+                _executor = ProcessPoolExecutor(max_workers=config['PASSWORD_HASH_WORKERS'],
+                                                mp_context=multiprocessing.get_context(method))
+    return _executor
+
+def _run(func, *args):
+    config = current_app.config
+    if config['PASSWORD_HASH_WORKERS'] <= 0:
+        return func(*args)
+    executor = _get_executor(config)
+    if not _slots.acquire(timeout=config['PASSWORD_HASH_QUEUE_TIMEOUT']):
+        raise PasswordHashBusy()
+    try:
+        return executor.submit(func, *args).result()
+    except BrokenProcessPool:
+        # 工作进程被杀死后进程池不可再用，换一个新的重试一次
+        shutdown(executor)
+        return _get_executor(config).submit(func, *args).result()
+    finally:
+        _slots.release()
+
+# 启动工作进程（服务预热时调用，避免第一次登录等待进程启动）
+def warm_up(app):
+    workers = app.config['PASSWORD_HASH_WORKERS']
+    if workers > 0:
+        executor = _get_executor(app.config)
+        for future in [executor.submit(int) for _ in range(workers)]:
+            future.result()
+
+def shutdown(executor=None):
+    global _executor
+    with _lock:
+        if _executor is not None and executor in (None, _executor):
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def hash_password(password):
+    config = current_app.config
+    return _run(generate_password_hash, password, config['PASSWORD_HASH_METHOD'], config['PASSWORD_HASH_SALT_LENGTH'])
+
+def verify_password(pwhash, password):
+    if not pwhash or password is None:
+        return False
+    return _run(check_password_hash, pwhash, password)
+
+
+# 配置的参数补全默认值后的写法（如 scrypt 补全为 scrypt:32768:8:1），与哈希中 $ 之前的部分比较
+def _method_prefix(method):
+    if method not in _methods:
+        _methods[method] = generate_password_hash('', method, 1).split('$', 1)[0]
+    return _methods[method]
+
+# 哈希是否使用旧的参数（应在校验成功后用明文重新计算）
+def needs_rehash(pwhash):
+    return bool(pwhash) and pwhash.split('$', 1)[0] != _method_prefix(current_app.config['PASSWORD_HASH_METHOD'])
@@ -0,0 +1,272 @@
+import json
+import mmap
+from datetime import datetime
+from app import db
+from app.models import LineIndex
+from app.config import BaseConfig as Config
+from app.storage import get_storage
+
+# 大文本文件预览
+#
+# 不读取整个文件，只读取请求的那一页：
+#   本地存储用 mmap 映射文件，按偏移切片读取；远程存储按范围请求读取。
+#   行号到字节偏移的换算依赖稀疏行索引（每隔 PREVIEW_INDEX_STRIDE 行记录一次行首偏移），
+#   索引在第一次跳到某处时才向后扩展，已扫描的部分保存在 LineIndex 中，以存储标识判断是否过期。
+#   跳到第 N 行 = 取最近的索引点 + 最多 stride 行的局部扫描；查看末尾从文件尾部向前读取，不需要索引。
+
+NEWLINE = b'\n'
+
+
+class PreviewError(ValueError):
+    pass
+
+
+def previewable(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in Config.PREVIEW_EXTENSIONS
+
+
+# 按偏移读取文件内容
+class _Source:
+    def __init__(self, storage, key, size):
+        self.storage = storage
+        self.key = key
+        self.size = size
+        self.file = self.map = None
+        path = storage.local_path(key)
+        if path and size:
+            self.file = open(path, 'rb')
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, offset, length):
+        if offset >= self.size or length <= 0:
+            return b''
+        end = min(self.size, offset + length)
+        if self.map is not None:
+            return self.map[offset:end]
+        return b''.join(self.storage.iter_range(self.key, offset, end - 1))
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        if self.file is not None:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# buf[start:] 中第 n 个换行符的位置（调用方保证至少有 n 个）
+# 先用 count 二分缩小范围，避免逐个 find
+def _nth_newline(buf, start, n):
+    lo, hi, before = start, len(buf), 0
+    while hi - lo > 1024:
+        mid = (lo + hi) // 2
+        c = buf.count(NEWLINE, lo, mid)
+        if before + c >= n:
+            hi = mid
+        else:
+            before += c
+            lo = mid
+    pos = lo - 1
+    for _ in range(n - before):
+        pos = buf.index(NEWLINE, pos + 1)
+    return pos
+
+def _decode(line):
+    return line.decode('utf-8', 'replace').rstrip('\r')
+
+
+class TextPreview:
+    def __init__(self, file):
+        self.file = file
+        storage = get_storage()
+        obj = storage.stat(file.filepath)
+        if obj is None:
+            raise FileNotFoundError(file.filepath)
+        self.size = obj.size
+        self.source = _Source(storage, file.filepath, obj.size)
+        self.stride = Config.PREVIEW_INDEX_STRIDE
+
+        index = db.session.get(LineIndex, file.id)
+        if index is None:
+            index = LineIndex(file_id=file.id)
+            db.session.add(index)
+        if index.etag != obj.etag or index.stride != self.stride:
+            index.etag, index.stride = obj.etag, self.stride
+            index.offsets = '[0]'
+            index.scanned_pos = index.scanned_lines = 0
+            index.line_count = None
+            self.dirty = True
+        else:
+            self.dirty = False
+        self.index = index
+        self.offsets = json.loads(index.offsets)
+        # 之前的版本在行数恰好是 stride 的整数倍时没有记录总行数，这里补上
+        if index.line_count is None and self.size and self.offsets[-1] == self.size == index.scanned_pos:
+            index.line_count = index.scanned_lines
+            self.dirty = True
+
+    def close(self):
+        self.source.close()
+        if self.dirty:
+            self.index.offsets = json.dumps(self.offsets, separators=(',', ':'))
+            self.index.updated_at = datetime.utcnow()
+            db.session.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def total_lines(self):
+        return self.index.line_count
+
+    # 向后扫描，直到索引中有第 mark 个索引点或到达文件末尾
+    def _extend(self, mark):
+        index = self.index
+        pos, lines = index.scanned_pos, index.scanned_lines
+        while len(self.offsets) <= mark and index.line_count is None:
+            chunk = self.source.read(pos, Config.PREVIEW_SCAN_CHUNK)
+            if not chunk:
+                # 最后一行没有换行符时也算一行
+                last = self.source.read(self.size - 1, 1) if self.size else NEWLINE
+                index.line_count = lines + (0 if last == NEWLINE else 1)
+                break
+            count = chunk.count(NEWLINE)
+            start = 0
+            next_mark = len(self.offsets) * self.stride
+            while lines + count >= next_mark:
+                need = next_mark - lines
+                nl = _nth_newline(chunk, start, need)
+                self.offsets.append(pos + nl + 1)
+                lines += need
+                count -= need
+                start = nl + 1
+                next_mark += self.stride
+            lines += count
+            pos += len(chunk)
+            # 行数恰好是 stride 的整数倍时最后一个索引点就在文件末尾，循环不会再读到空块
+            if self.offsets[-1] == self.size:
+                index.line_count = lines
+        if (pos, lines) != (index.scanned_pos, index.scanned_lines) or index.line_count is not None:
+            self.dirty = True
+        index.scanned_pos, index.scanned_lines = pos, lines
+
+    # 第 line 行（从 1 开始）的起始偏移，超出文件末尾时返回 None
+    def locate(self, line):
+        target = line - 1
+        mark = target // self.stride
+        if mark >= len(self.offsets):
+            self._extend(mark)
+            if mark >= len(self.offsets):
+                return None
+        pos = self.offsets[mark]
+        skip = target - mark * self.stride
+        while skip:
+            chunk = self.source.read(pos, Config.PREVIEW_SCAN_CHUNK)
+            if not chunk:
+                return None
+            count = chunk.count(NEWLINE)
+            if count >= skip:
+                pos += _nth_newline(chunk, 0, skip) + 1
+                break
+            skip -= count
+            pos += len(chunk)
+        return pos if pos < self.size else None
+
+    # 从 offset 开始读取至多 count 行
+    def _lines_from(self, offset, count):
+        data = self.source.read(offset, Config.PREVIEW_MAX_BYTES)
+        at_eof = offset + len(data) >= self.size
+        parts = data.split(NEWLINE)
+        tail = parts.pop()  # 最后一个换行之后的部分：到达文件末尾时是最后一行，否则是不完整的行
+        lines = parts[:count]
+        consumed = sum(len(line) + 1 for line in lines)
+        truncated = False
+        if len(lines) < count and at_eof and tail:
+            lines.append(tail)
+            consumed += len(tail)
+        elif not lines and tail:
+            # 单行超过读取上限，只返回开头部分
+            lines, truncated = [tail], True
+            consumed = len(tail)
+        next_offset = offset + consumed
+        return {
+            'offset': offset,
+            'lines': [_decode(line) for line in lines],
+            'truncated': truncated,
+            'next_offset': next_offset if next_offset < self.size else None,
+        }
+
+    # 从第 line 行开始的一页
+    def page(self, line, count):
+        line = max(1, line)
+        count = max(1, min(count, Config.PREVIEW_MAX_LINES))
+        offset = self.locate(line)
+        if offset is None:
+            result = {'offset': None, 'lines': [], 'truncated': False, 'next_offset': None}
+        else:
+            result = self._lines_from(offset, count)
+        result['start_line'] = line
+        result['next_line'] = line + len(result['lines']) if result['next_offset'] is not None else None
+        result['total_lines'] = self.total_lines
+        return result
+
+    # 最后 count 行：从文件末尾向前读取，直到换行数足够或达到读取上限
+    def tail(self, count):
+        count = max(1, min(count, Config.PREVIEW_MAX_LINES))
+        end = self.size
+        if end and self.source.read(end - 1, 1) == NEWLINE:
+            end -= 1
+        pos, chunks, newlines = end, [], 0
+        block = 64 * 1024
+        while pos > 0 and newlines < count and end - pos < Config.PREVIEW_MAX_BYTES:
+            n = min(block, pos, Config.PREVIEW_MAX_BYTES - (end - pos))
+            pos -= n
+            chunk = self.source.read(pos, n)
+            chunks.append(chunk)
+            newlines += chunk.count(NEWLINE)
+        data = b''.join(reversed(chunks))
+        parts = data.split(NEWLINE) if data else []
+        truncated = False
+        if len(parts) > count:
+            parts = parts[-count:]
+        elif pos > 0:
+            # 读取上限内没有完整的第一行
+            truncated = True
+        start = end - len(NEWLINE.join(parts))
+        lines = [_decode(line) for line in parts]
+        total = self.total_lines
+        return {
+            'offset': start,
+            'lines': lines,
+            'truncated': truncated,
+            'next_offset': None,
+            'start_line': total - len(lines) + 1 if total is not None else None,
+            'next_line': None,
+            'total_lines': total,
+        }
+
+    # 任意字节窗口（不按行对齐）
+    def window(self, offset, length):
+        offset = max(0, offset)
+        length = max(0, min(length, Config.PREVIEW_MAX_BYTES))
+        data = self.source.read(offset, length)
+        next_offset = offset + len(data)
+        return {
+            'offset': offset,
+            'text': data.decode('utf-8', 'replace'),
+            'next_offset': next_offset if next_offset < self.size else None,
+            'size': self.size,
+        }
+
+
+def open_preview(file):
+    if not previewable(file.filename):
+        raise PreviewError('该文件类型不支持预览')
+    return TextPreview(file)
@@ -0,0 +1,193 @@
+import asyncio
+import json
+from app.asgi import AsgiApp, send_response, wait_disconnect
+
+# 文件夹变更推送（Server-Sent Events）
+#
+# 跨进程的发布/订阅以变更日志表作为本地替代：Flask 各进程在业务事务中写入日志，
+# 每个推送进程只运行一个轮询任务按主键范围读取新日志，再按 (用户, 文件夹) 分发给订阅者。
+# 轮询开销与连接数无关，空闲连接只占用一个队列和一个协程。
+
+# 一条变更影响的文件夹（None 表示根目录）
+def affected_folders(change):
+    folders = {change['parent_id']}
+    if change['action'] == 'move':
+        folders.add(change['old_parent_id'])
+    if change['entity'] == 'folder':
+        # 正在查看被删除/重命名文件夹的客户端也需要知道
+        folders.add(change['id'])
+    return folders
+
+
+def fetch_journal(after_id, limit, user_id=None):
+    from app.models import ChangeJournal
+    query = ChangeJournal.query.filter(ChangeJournal.id > after_id)
+    if user_id is not None:
+        query = query.filter(ChangeJournal.user_id == user_id)
+    rows = query.order_by(ChangeJournal.id).limit(limit).all()
+    return [dict(row.to_dict(), user_id=row.user_id) for row in rows]
+
+
+def latest_journal_id():
+    from app import db
+    from app.models import ChangeJournal
+    return db.session.query(db.func.max(ChangeJournal.id)).scalar() or 0
+
+
+def user_owns_folder(user_id, folder_id):
+    from app.models import Folder
+    from app.trash import folder_in_trash
+    folder = Folder.query.filter_by(id=folder_id, user_id=user_id).first()
+    return folder is not None and not folder_in_trash(folder)
+
+
+class JournalBroker:
+    def __init__(self, asgi_app):
+        self.app = asgi_app
+        config = asgi_app.flask_app.config
+        self.interval = config['PUSH_POLL_INTERVAL']
+        self.batch = config['PUSH_POLL_BATCH']
+        self.queue_size = config['PUSH_QUEUE_SIZE']
+        self.subscribers = {}  # (user_id, folder_id) -> set(asyncio.Queue)
+        self.last_id = None
+        self._started = False
+        self._task = None
+
+    # 启动轮询任务（可由 lifespan 或首个订阅者触发，只启动一次）
+    async def start(self):
+        if self._started:
+            return
+        self._started = True
+        self.last_id = await self.app.run_sync(latest_journal_id)
+        self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def stop(self):
+        self._started = False
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def subscribe(self, user_id, folder_id):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.setdefault((user_id, folder_id), set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, folder_id, queue):
+        queues = self.subscribers.get((user_id, folder_id))
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[(user_id, folder_id)]
+
+    def publish(self, change):
+        for folder_id in affected_folders(change):
+            for queue in list(self.subscribers.get((change['user_id'], folder_id), ())):
+                try:
+                    queue.put_nowait(change)
+                except asyncio.QueueFull:
+                    # 消费过慢的客户端改为通知其整页刷新
+                    queue.get_nowait()
+                    queue.put_nowait({'action': 'reset'})
+
+    # 没有订阅者时只把游标推进到最新，不把空闲期间的变更补发给之后的订阅者；
+    # 读到整批说明还有积压，立即继续读取，不等待下一个周期
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            while True:
+                try:
+                    if not self.subscribers:
+                        self.last_id = await self.app.run_sync(latest_journal_id)
+                        break
+                    changes = await self.app.run_sync(fetch_journal, self.last_id, self.batch)
+                except Exception as e:
+                    self.app.flask_app.logger.warning(f"读取变更日志失败: {str(e)}")
+                    break
+                for change in changes:
+                    self.last_id = change['cursor']
+                    self.publish(change)
+                if len(changes) < self.batch:
+                    break
+
+
+def format_event(change):
+    if change.get('action') == 'reset':
+        return b'event: reset\ndata: {}\n\n'
+    data = {k: change[k] for k in ('entity', 'id', 'action', 'name', 'parent_id', 'old_parent_id', 'size')}
+    return f"id: {change['cursor']}\nevent: change\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8')
+
+
+def create_push_app(flask_app):
+    asgi_app = AsgiApp(flask_app)
+    broker = JournalBroker(asgi_app)
+    asgi_app.broker = broker
+    asgi_app.startup_hooks.append(broker.start)
+    asgi_app.shutdown_hooks.append(broker.stop)
+    heartbeat = flask_app.config['PUSH_HEARTBEAT']
+
+    # 订阅文件夹变更: /push/folders/root 或 /push/folders/<id>
+    @asgi_app.route(r'/push/folders/(?P<folder>root|\d+)')
+    async def folder_events(request, send, folder):
+        cors = request.cors_headers()
+        user_id = await request.user_id()
+        if user_id is None:
+            await send_response(send, 401, b'Unauthorized', cors)
+            return
+
+        folder_id = None if folder == 'root' else int(folder)
+        if folder_id is not None and not await asgi_app.run_sync(user_owns_folder, user_id, folder_id):
+            await send_response(send, 404, b'Not Found', cors)
+            return
+
+        await broker.start()
+        queue = broker.subscribe(user_id, folder_id)
+        subscribed_at = broker.last_id  # 此后的变更由轮询任务放入队列
+        disconnect = asyncio.get_running_loop().create_task(wait_disconnect(request.receive))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': cors + [
+                    (b'content-type', b'text/event-stream; charset=utf-8'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+
+            # 断线重连时按 Last-Event-ID 补发之后错过的变更；错过的超过一批时通知客户端整页刷新。
+            # 补发期间轮询任务可能已把同一批变更放入队列，不重复发送游标不大于已发送位置的变更
+            sent_id = 0
+            last_event_id = request.headers.get('last-event-id')
+            if last_event_id and last_event_id.isdigit():
+                sent_id = int(last_event_id)
+                missed = await asgi_app.run_sync(fetch_journal, sent_id, broker.batch, user_id)
+                if len(missed) == broker.batch and missed[-1]['cursor'] < subscribed_at:
+                    await send({'type': 'http.response.body', 'body': format_event({'action': 'reset'}),
+                                'more_body': True})
+                    missed = []
+                for change in missed:
+                    sent_id = change['cursor']
+                    if folder_id in affected_folders(change):
+                        await send({'type': 'http.response.body', 'body': format_event(change), 'more_body': True})
+
+            while not disconnect.done():
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter, disconnect}, timeout=heartbeat,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    change = getter.result()
+                    if change.get('cursor', sent_id + 1) <= sent_id:
+                        continue
+                    body = format_event(change)
+                else:
+                    getter.cancel()
+                    if disconnect in done:
+                        break
+                    body = b': ping\n\n'
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        finally:
+            broker.unsubscribe(user_id, folder_id, queue)
+            disconnect.cancel()
+
+    return asgi_app
@@ -0,0 +1,141 @@
+from werkzeug.exceptions import RequestEntityTooLarge
+from app import db
+from app.models import User, File, UploadSession
+from app.config import BaseConfig as Config
+
+# 存储配额
+#
+# 每个用户的上限取 User.quota_bytes（单独设置），否则取所属套餐 QUOTA_PLANS[plan]，None 表示不限制。
+# 用量记在 User 行上：used_bytes 为已保存文件（含回收站中的文件）的大小之和，
+# reserved_bytes 为进行中的上传预先占用的空间。
+#
+# 上传在读取请求体之前按 Content-Length（分片上传按创建会话时声明的大小）预留空间：
+#   reserve  以一条带条件的 UPDATE 完成检查与占用，同一用户的并发上传不会同时通过检查；
+#   保存成功后 adjust 把预留转为用量，与文件记录在同一个事务中提交；失败时 release 归还预留。
+# 复制、解压等服务端产生的数据用 charge 在当前事务中检查并计入用量。
+
+
+class QuotaExceeded(RequestEntityTooLarge):
+    description = '存储空间不足'
+
+
+_user = User.__table__
+_upload_session = UploadSession.__table__
+
+
+def plan_limit(plan):
+    return Config.QUOTA_PLANS.get(plan or Config.QUOTA_DEFAULT_PLAN)
+
+# 用户的配额上限（字节），None 表示不限制
+def limit_for(user):
+    if user.quota_bytes is not None:
+        return user.quota_bytes
+    return plan_limit(user.plan)
+
+def _limit(user_id):
+    row = db.session.query(User.quota_bytes, User.plan).filter(User.id == user_id).first()
+    if row is None:
+        return None
+    return row.quota_bytes if row.quota_bytes is not None else plan_limit(row.plan)
+
+def _used():
+    return db.func.coalesce(_user.c.used_bytes, 0)
+
+# 以条件更新检查并占用空间（上限为 None 时只增加，不检查），返回是否成功
+def _update(conn, user_id, limit, used=0, reserved=0):
+    values = {}
+    if used:
+        values['used_bytes'] = _used() + used
+    if reserved:
+        values['reserved_bytes'] = _user.c.reserved_bytes + reserved
+    if not values:
+        return True
+    statement = db.update(_user).where(_user.c.id == user_id).values(**values)
+    if limit is not None:
+        statement = statement.where(_used() + _user.c.reserved_bytes + used + reserved <= limit)
+    return conn.execute(statement).rowcount == 1
+
+
+# 预留空间（在独立的短事务中提交，其他请求立即可见），空间不足返回 False
+def reserve(user_id, nbytes):
+    limit = _limit(user_id)
+    with db.engine.begin() as conn:
+        return _update(conn, user_id, limit, reserved=nbytes)
+
+# 归还未使用的预留（上传失败时调用，独立事务）
+def release(user_id, nbytes):
+    if nbytes:
+        with db.engine.begin() as conn:
+            _update(conn, user_id, None, reserved=-nbytes)
+
+# 预留至多 cap 字节的剩余空间，返回实际预留的字节数（结果大小事先未知的写入，如增量更新）
+def reserve_up_to(user_id, cap):
+    for _ in range(3):
+        available = available_bytes(user_id)
+        amount = cap if available is None else max(0, min(cap, available))
+        if reserve(user_id, amount):
+            return amount
+    return 0
+
+# 在读取分片内容之前为其占用会话的预留（独立事务）：有配额限制的用户，
+# 会话已接收的字节数加上本分片的 Content-Length 不能超过创建会话时预留的空间，超出返回 False
+def claim_part(session_id, user_id, nbytes):
+    statement = db.update(_upload_session).where(_upload_session.c.id == session_id) \
+        .values(uploaded_bytes=_upload_session.c.uploaded_bytes + nbytes)
+    if _limit(user_id) is not None:
+        statement = statement.where(_upload_session.c.uploaded_bytes + nbytes <= _upload_session.c.reserved_bytes)
+    with db.engine.begin() as conn:
+        return conn.execute(statement).rowcount == 1
+
+# 分片保存失败时退回 claim_part 占用的字节数
+def unclaim_part(session_id, nbytes):
+    with db.engine.begin() as conn:
+        conn.execute(db.update(_upload_session).where(_upload_session.c.id == session_id)
+                     .values(uploaded_bytes=_upload_session.c.uploaded_bytes - nbytes))
+
+# 在当前事务中调整用量和预留（随调用方的 commit 一起生效）
+def adjust(user_id, used=0, reserved=0):
+    _update(db.session, user_id, None, used=used, reserved=reserved)
+
+# 在当前事务中检查并计入用量，空间不足时抛出 QuotaExceeded
+def charge(user_id, nbytes):
+    if nbytes > 0 and not _update(db.session, user_id, _limit(user_id), used=nbytes):
+        raise QuotaExceeded()
+
+
+def available_bytes(user_id):
+    row = db.session.query(User.used_bytes, User.reserved_bytes, User.quota_bytes, User.plan) \
+        .filter(User.id == user_id).first()
+    limit = row.quota_bytes if row.quota_bytes is not None else plan_limit(row.plan)
+    if limit is None:
+        return None
+    return max(0, limit - (row.used_bytes or 0) - row.reserved_bytes)
+
+# 个人资料页显示的用量
+def usage(user):
+    db.session.refresh(user, ['used_bytes', 'reserved_bytes'])
+    limit = limit_for(user)
+    used = user.used_bytes or 0
+    return {
+        'plan': user.plan or Config.QUOTA_DEFAULT_PLAN,
+        'used': used,
+        'reserved': user.reserved_bytes,
+        'limit': limit,
+        'percent': min(100, round(used * 100 / limit, 1)) if limit else 0,
+    }
+
+
+# 按文件记录重新统计用量（修正计数偏差）；reset_reserved 时预留重置为未完成分片会话的预留之和，
+# 只应在没有进行中的上传时使用（例如进程崩溃遗留了预留）
+def recount(user_ids=None, reset_reserved=False):
+    ids = user_ids if user_ids is not None else [row[0] for row in db.session.query(User.id)]
+    for user_id in ids:
+        values = {'used_bytes': db.session.query(db.func.coalesce(db.func.sum(File.filesize), 0))
+                  .filter(File.user_id == user_id).scalar_subquery()}
+        if reset_reserved:
+            values['reserved_bytes'] = db.session.query(
+                db.func.coalesce(db.func.sum(UploadSession.reserved_bytes), 0)
+            ).filter(UploadSession.user_id == user_id).scalar_subquery()
+        db.session.execute(db.update(_user).where(_user.c.id == user_id).values(**values))
+        db.session.commit()
+    return len(ids)
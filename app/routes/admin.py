@@ -1,68 +1,25 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app, send_from_directory
 from flask_login import login_required, current_user
 from app import db
-from app.models import User, File, Folder
+from app.models import User, File, Folder, ArchiveIndex, LineIndex
 from app.config import BaseConfig as Config
-import os
-import hashlib
-from datetime import datetime, timedelta
-import shutil
+from app.journal import record_change
+from app.storage import get_storage
+from app.jobs import submit_job, list_jobs, job_running
+from app.filecache import hot_files
+from app.quotas import adjust
+from app.foldersize import propagate
+from app.adminauth import verify_key, start_session, current_session, end_session, revoke, revocations, active_sessions
 
 admin = Blueprint('admin', __name__)
 
-# 密钥验证函数
-def verify_admin_key(uploaded_file):
-    # 检查管理员密钥文件是否存在
-    admin_key_path = os.path.join(Config.ADMIN_KEY_FOLDER, Config.ADMIN_KEY_FILENAME)
-    print(f"本地密钥文件路径: {admin_key_path}")  # 调试用
-    
-    if not os.path.exists(admin_key_path):
-        print("本地密钥文件不存在")  # 调试用
-        return False
-    
-    # 检查文件是否可读取
-    if not os.access(admin_key_path, os.R_OK):
-        print("没有本地密钥文件的读取权限")  # 调试用
-        return False
-    
-    # 计算本地密钥文件的哈希（必须用二进制模式读取）
-    try:
-        with open(admin_key_path, 'rb') as f:
-            local_content = f.read()
-            local_hash = hashlib.sha256(local_content).hexdigest()
-        print(f"本地密钥哈希: {local_hash}")  # 调试用
-    except Exception as e:
-        print(f"读取本地密钥失败: {str(e)}")  # 调试用
-        return False
-    
-    # 计算上传文件的哈希（同样用二进制模式）
-    try:
-        # 重置文件指针到开头（避免上传文件读取不完整）
-        uploaded_file.seek(0)
-        uploaded_content = uploaded_file.read()
-        uploaded_hash = hashlib.sha256(uploaded_content).hexdigest()
-        print(f"上传文件哈希: {uploaded_hash}")  # 调试用
-    except Exception as e:
-        print(f"读取上传文件失败: {str(e)}")  # 调试用
-        return False
-    
-    # 对比哈希值
-    return local_hash == uploaded_hash
-
 # 管理员登录页面（密钥验证）
 @admin.route('/admin/login', methods=['GET', 'POST'])
 @login_required
 def admin_login():
-    # 检查用户是否已通过管理员验证
-    if hasattr(current_user, 'admin_authenticated') and current_user.admin_authenticated:
-        # 检查会话是否过期
-        if hasattr(current_user, 'admin_auth_time') and \
-           datetime.utcnow() - current_user.admin_auth_time < Config.ADMIN_SESSION_DURATION:
-            return redirect(url_for('admin.dashboard'))
-        else:
-            # 会话过期，清除认证状态
-            current_user.admin_authenticated = False
-            current_user.admin_auth_time = None
+    # 已有有效的管理员会话
+    if current_session(current_user.id):
+        return redirect(url_for('admin.dashboard'))
     
     if request.method == 'POST':
         # 检查是否有文件被上传
@@ -77,16 +34,13 @@ def admin_login():
             flash('未选择密钥文件', 'danger')
             return render_template('admin_login.html', title='管理员验证')
         
-        # 验证密钥
-        if verify_admin_key(key_file):
-            # 记录认证状态和时间
-            current_user.admin_authenticated = True
-            current_user.admin_auth_time = datetime.utcnow()
-            db.session.commit()
-            print("密钥验证成功，已设置管理员会话")  # 调试用
-            return redirect(url_for('admin.dashboard'))  # 注意蓝图名称是admin
+        # 验证密钥，通过后签发管理员会话
+        if verify_key(key_file.stream):
+            start_session(current_user, request.remote_addr)
+            current_app.logger.info(f'用户 {current_user.id} 通过管理员密钥验证')
+            return redirect(url_for('admin.dashboard'))
         else:
-            print("密钥验证失败，哈希不匹配")  # 调试用
+            current_app.logger.warning(f'用户 {current_user.id} 管理员密钥验证失败')
             flash('密钥验证失败，请使用正确的管理员密钥文件', 'danger')
     
     return render_template('admin_login.html', title='管理员验证')
@@ -95,13 +49,12 @@ def admin_login():
 @admin.route('/admin/logout')
 @login_required
 def admin_logout():
-    current_user.admin_authenticated = False
-    current_user.admin_auth_time = None
-    db.session.commit()
+    end_session()
     flash('已退出管理员模式', 'info')
     return redirect(url_for('main.index'))
 
 # 检查管理员权限的装饰器
+# 只在内存中校验会话令牌，不写数据库、不读取密钥文件
 def admin_required(f):
     from functools import wraps
     @wraps(f)
@@ -111,29 +64,36 @@ def admin_required(f):
             flash('请先登录', 'warning')
             return redirect(url_for('auth.login'))
         
-        # 检查是否通过管理员验证
-        if not hasattr(current_user, 'admin_authenticated') or not current_user.admin_authenticated:
-            flash('需要管理员权限', 'danger')
-            return redirect(url_for('admin.admin_login'))  # 确保这里的路由正确
-        
-        # 检查会话是否过期
-        if hasattr(current_user, 'admin_auth_time'):
-            time_diff = datetime.utcnow() - current_user.admin_auth_time
-            if time_diff >= Config.ADMIN_SESSION_DURATION:
-                current_user.admin_authenticated = False
-                current_user.admin_auth_time = None
-                db.session.commit()
-                flash('管理员会话已过期，请重新验证', 'warning')
-                return redirect(url_for('admin.admin_login'))  # 确保路由正确
-        else:
-            # 如果没有认证时间，视为未认证
-            current_user.admin_authenticated = False
-            db.session.commit()
+        # 检查管理员会话（签名、有效期、密钥指纹、撤销列表）
+        if not current_session(current_user.id):
+            flash('需要管理员权限，或管理员会话已过期，请重新验证', 'warning')
             return redirect(url_for('admin.admin_login'))
         
         return f(*args, **kwargs)
     return decorated_function
 
+# 管理员会话列表
+@admin.route('/admin/sessions')
+@login_required
+@admin_required
+def session_list():
+    return render_template('admin_sessions.html', title='管理员会话', sessions=active_sessions(),
+                           current_sid=current_session(current_user.id)['sid'])
+
+# 撤销管理员会话（所有进程在 ADMIN_SESSION_REVOCATION_TTL 秒内生效）
+@admin.route('/admin/sessions/revoke', methods=['POST'])
+@login_required
+@admin_required
+def revoke_sessions():
+    own_sid = current_session(current_user.id)['sid']
+    sid = request.form.get('sid')
+    count = revoke([sid]) if sid else revoke()
+    flash(f'已撤销 {count} 个管理员会话', 'success')
+    # 撤销了自己的会话时需要重新验证
+    if revocations.is_revoked(own_sid):
+        return redirect(url_for('admin.admin_login'))
+    return redirect(url_for('admin.session_list'))
+
 # 管理员控制面板
 @admin.route('/admin/dashboard')
 @login_required
@@ -160,12 +120,31 @@ def dashboard():
     
     total_storage_display = convert_size(total_storage)
     
+    # 完整性校验失败的文件数
+    corrupt_count = File.query.filter(File.checksum_mismatch.is_(True)).count()
+    
+    # 热点文件缓存统计（当前进程）
+    cache_stats = hot_files.stats()
+    cache_stats['size_display'] = convert_size(cache_stats['bytes'])
+    cache_stats['max_display'] = convert_size(cache_stats['max_bytes'])
+    
     return render_template('admin_dashboard.html', 
                          title='管理员面板',
                          user_count=user_count,
                          file_count=file_count,
                          folder_count=folder_count,
-                         total_storage=total_storage_display)
+                         total_storage=total_storage_display,
+                         corrupt_count=corrupt_count,
+                         cache_stats=cache_stats)
+
+# 清空热点文件缓存（仅当前进程）
+@admin.route('/admin/cache/clear', methods=['POST'])
+@login_required
+@admin_required
+def clear_cache():
+    hot_files.clear()
+    flash('热点文件缓存已清空', 'success')
+    return redirect(url_for('admin.dashboard'))
 
 # 用户管理页面
 @admin.route('/admin/users')
@@ -202,13 +181,17 @@ def delete_user(user_id):
 @login_required
 @admin_required
 def file_management():
-    # 可以按用户筛选文件
+    # 可以按用户筛选文件，corrupt=1 只显示完整性校验失败的文件
     user_id = request.args.get('user_id', type=int)
+    corrupt_only = request.args.get('corrupt', type=int) == 1
+    query = File.query
+    if corrupt_only:
+        query = query.filter(File.checksum_mismatch.is_(True))
     if user_id:
-        files = File.query.filter_by(user_id=user_id).order_by(File.upload_time.desc()).all()
+        files = query.filter_by(user_id=user_id).order_by(File.upload_time.desc()).all()
         current_user_filter = User.query.get(user_id)
     else:
-        files = File.query.order_by(File.upload_time.desc()).all()
+        files = query.order_by(File.upload_time.desc()).all()
         current_user_filter = None
     
     # 获取所有用户用于筛选
@@ -227,7 +210,8 @@ def file_management():
                          title='文件管理',
                          files=files,
                          users=users,
-                         current_user_filter=current_user_filter)
+                         current_user_filter=current_user_filter,
+                         corrupt_only=corrupt_only)
 
 # 删除文件
 @admin.route('/admin/files/delete/<int:file_id>', methods=['POST'])
@@ -238,17 +222,88 @@ def delete_file(file_id):
     filename = file.filename
     user_id = file.user_id
     
-    # 删除物理文件
-    if os.path.exists(file.filepath):
-        try:
-            os.remove(file.filepath)
-        except Exception as e:
-            flash(f'删除文件失败: {str(e)}', 'danger')
-            return redirect(url_for('admin.file_management', user_id=user_id))
+    # 删除存储中的文件
+    try:
+        get_storage().delete(file.filepath)
+    except Exception as e:
+        flash(f'删除文件失败: {str(e)}', 'danger')
+        return redirect(url_for('admin.file_management', user_id=user_id))
     
     # 从数据库删除记录
+    record_change(user_id, 'file', file.id, 'delete',
+                  name=filename, parent_id=file.folder_id)
+    ArchiveIndex.query.filter_by(file_id=file.id).delete(synchronize_session=False)
+    LineIndex.query.filter_by(file_id=file.id).delete(synchronize_session=False)
+    adjust(user_id, used=-(file.filesize or 0))
+    # 回收站中的文件已从所在文件夹的统计中扣除
+    if file.deleted_at is None:
+        propagate(file.folder_id, -(file.filesize or 0), -1)
     db.session.delete(file)
     db.session.commit()
     
     flash(f'文件 "{filename}" 已删除', 'success')
-    return redirect(url_for('admin.file_management', user_id=user_id))
\ No newline at end of file
+    return redirect(url_for('admin.file_management', user_id=user_id))
+
+# 后台任务列表
+@admin.route('/admin/jobs')
+@login_required
+@admin_required
+def job_list():
+    return render_template('admin_jobs.html', title='后台任务', jobs=list_jobs())
+
+# 触发一致性检查（fsck）
+@admin.route('/admin/fsck', methods=['POST'])
+@login_required
+@admin_required
+def start_fsck():
+    from app.fsck import run_fsck
+    if job_running('fsck'):
+        flash('一致性检查正在运行中', 'warning')
+        return redirect(url_for('admin.job_list'))
+    repair = bool(request.form.get('repair'))
+    submit_job('fsck', lambda job: run_fsck(repair=repair, job=job),
+               description='检查并修复' if repair else '仅检查')
+    flash('一致性检查已开始', 'success')
+    return redirect(url_for('admin.job_list'))
+
+# 触发一轮完整性巡检
+@admin.route('/admin/scrub', methods=['POST'])
+@login_required
+@admin_required
+def start_scrub():
+    from app.scrubber import run_scrub_pass
+    if job_running('scrub'):
+        flash('完整性巡检正在运行中', 'warning')
+        return redirect(url_for('admin.job_list'))
+    limit = request.form.get('limit', type=int)
+    submit_job('scrub', lambda job: run_scrub_pass(max_files=limit, job=job),
+               description=f'最多 {limit} 个文件' if limit else '全部到期文件')
+    flash('完整性巡检已开始', 'success')
+    return redirect(url_for('admin.job_list'))
+
+# 管理员确认处理后清除损坏标记，下一轮巡检重新建立基准
+@admin.route('/admin/files/clear-mismatch/<int:file_id>', methods=['POST'])
+@login_required
+@admin_required
+def clear_mismatch(file_id):
+    file = File.query.get_or_404(file_id)
+    file.checksum_mismatch = False
+    file.checksum = None
+    file.checksum_verified_at = None
+    db.session.commit()
+    flash(f'已清除文件 "{file.filename}" 的损坏标记', 'success')
+    return redirect(url_for('admin.file_management', corrupt=1))
+
+# 触发回收站清理
+@admin.route('/admin/trash-purge', methods=['POST'])
+@login_required
+@admin_required
+def start_trash_purge():
+    from app.trash import purge_trash
+    if job_running('trash-purge'):
+        flash('回收站清理正在运行中', 'warning')
+        return redirect(url_for('admin.job_list'))
+    submit_job('trash-purge', lambda job: purge_trash(job=job),
+               description=f'保留 {Config.TRASH_RETENTION.days} 天')
+    flash('回收站清理已开始', 'success')
+    return redirect(url_for('admin.job_list'))
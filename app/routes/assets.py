@@ -0,0 +1,37 @@
+import os
+import mimetypes
+from flask import Blueprint, current_app, request, send_file, abort
+from werkzeug.security import safe_join
+from app.config import BaseConfig as Config
+from app.assets import build_folder
+
+# 带指纹的静态资源：地址随内容变化，可永久缓存
+assets = Blueprint('assets', __name__)
+
+# 按 Accept-Encoding 依次尝试的预压缩版本
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+@assets.route('/<path:filename>')
+def asset(filename):
+    if filename not in current_app.extensions.get('asset_files', ()):
+        abort(404)
+    path = safe_join(build_folder(current_app), filename)
+    if path is None:
+        abort(404)
+
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if request.accept_encodings[name] and os.path.isfile(path + suffix):
+            path, encoding = path + suffix, name
+            break
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    try:
+        response = send_file(path, mimetype=mimetype, max_age=Config.ASSETS_MAX_AGE, conditional=True)
+    except FileNotFoundError:
+        abort(404)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
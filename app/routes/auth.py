@@ -5,6 +5,7 @@ from flask_login import logout_user
 from app import db, mail
 #from app.config import mail
 from app.models import User
+from app.adminauth import end_session
 # 不需要单独导入werkzeug的函数，因为User模型中已经实现了密码处理
 
 auth = Blueprint('auth', __name__)
@@ -36,6 +37,11 @@ def login_post():
         flash('请检查您的登录信息并重试。', 'danger')
         return redirect(url_for('auth.login'))
     
+    # 哈希参数修改后，登录成功时按新参数重新计算
+    if user.password_needs_rehash():
+        user.set_password(password)
+        db.session.commit()
+    
     # 新增：检查邮箱是否已验证
     if not user.confirmed:
         flash('请先验证您的邮箱才能登录。', 'warning')
@@ -111,6 +117,7 @@ def confirm_email(token):
 
 @auth.route('/logout')
 def logout():
+    end_session()  # 同时退出管理员模式
     logout_user()  # 使用从flask_login导入的logout_user函数
     flash('您已成功退出登录', 'info')  # 添加退出成功提示
     return redirect(url_for('main.index'))  # 退出后重定向到首页
\ No newline at end of file
@@ -1,15 +1,62 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, send_from_directory, jsonify
+from flask import (Blueprint, render_template, stream_template, redirect, url_for, request, flash, get_flashed_messages,
+                   jsonify, g, abort, Response, stream_with_context)
 from flask_login import login_required, current_user
 from app import db
-from app.models import File, Folder
+from app.models import File, Folder, UploadSession
 from app.config import BaseConfig as Config
-import os
+from app.journal import record_change
+from app.serving import send_stored_file
+from app.throttle import throttle_request_body, throttle_response
+from app.storage import get_storage, storage_key, HashingReader
+from app.scrubber import compute_checksum
+from app.trash import (folder_in_trash, file_in_trash, trash_file, trash_folder, restore_file,
+                       restore_folder, purge_file, purge_folder)
+from app.sharing import revocations
+from app.tree import TreeError, move_file, move_folder, copy_file, copy_folder
+from app.delta import DeltaError, DeltaReader, BlockSource, iter_signatures, clamp_block_size
+from app.archives import ArchiveError, archive_format, get_index, open_member, extract_archive
+from app.preview import PreviewError, previewable, open_preview
+from app.jobs import submit_job, job_running, user_jobs
+from app.quotas import QuotaExceeded, reserve, reserve_up_to, release, adjust, charge, limit_for, claim_part, unclaim_part
+from app.foldersize import propagate
+from datetime import datetime
 from werkzeug.utils import secure_filename
-import shutil
+import json
+import uuid
+import itertools
 
 # 创建文件管理蓝图
 files = Blueprint('files', __name__)
 
+# 整文件上传在读取请求体之前按 Content-Length 预留配额，空间不足时不保存请求体，直接返回
+@files.before_request
+def reserve_upload_quota():
+    if request.endpoint == 'files.upload_file' and current_user.is_authenticated:
+        if request.content_length is None:
+            abort(411)
+        if not reserve(current_user.id, request.content_length):
+            flash(f'{QuotaExceeded.description}，无法上传', 'danger')
+            return redirect(request.referrer or url_for('files.file_list'))
+        g.quota_reserved = (current_user.id, request.content_length)
+
+# 上传请求在读取请求体之前占用限速租约，超限时直接返回 429
+@files.before_request
+def throttle_upload():
+    if request.endpoint in ('files.upload_file', 'files.upload_part', 'files.apply_delta') and current_user.is_authenticated:
+        g.upload_lease = throttle_request_body(request.environ, current_user.id)
+
+@files.teardown_request
+def release_upload(exc=None):
+    lease = g.pop('upload_lease', None)
+    if lease:
+        lease.release()
+    # 上传没有成功保存时归还预留的配额
+    reserved = g.pop('quota_reserved', None)
+    if reserved:
+        if exc is not None:
+            db.session.rollback()
+        release(*reserved)
+
 # 检查文件扩展名是否允许
 def allowed_file(filename):
     return '.' in filename and \
@@ -21,35 +68,101 @@ def convert_size(size_bytes):
         return f"{size_bytes} B"
     elif size_bytes < 1024 * 1024:
         return f"{size_bytes / 1024:.2f} KB"
-    else:
+    elif size_bytes < 1024 * 1024 * 1024:
         return f"{size_bytes / (1024 * 1024):.2f} MB"
+    else:
+        return f"{size_bytes / (1024 * 1024 * 1024):.2f} GB"
+
+# 获取当前用户未被删除的文件夹
+def get_own_folder(folder_id):
+    folder = Folder.query.filter_by(id=folder_id, user_id=current_user.id).first()
+    if folder is None or folder_in_trash(folder):
+        return None
+    return folder
+
+# 列表的排序方式：按名称，或按大小从大到小（文件夹按已维护的递归大小，不需要遍历子树）
+LISTING_ORDERS = {
+    'name': ((Folder.name,), (File.filename,)),
+    'size': ((Folder.total_bytes.desc(), Folder.name), (File.filesize.desc(), File.filename)),
+}
 
 # 获取当前路径下的内容（文件夹和文件）
-def get_contents(folder_id=None):
+# 只查询列表需要的列，结果按批从游标读取（不构造 ORM 对象），边渲染边输出
+def get_contents(folder_id=None, sort='name'):
     # 获取当前文件夹
     current_folder = None
     if folder_id:
-        current_folder = Folder.query.filter_by(id=folder_id, user_id=current_user.id).first()
+        current_folder = get_own_folder(folder_id)
         if not current_folder:
-            return None, None, None  # 文件夹不存在或无权限
+            return None, None, None  # 文件夹不存在、无权限或已在回收站中
     
-    # 获取当前文件夹下的子文件夹
-    subfolders = Folder.query.filter_by(parent_id=folder_id, user_id=current_user.id).order_by(Folder.name).all()
+    batch = Config.LISTING_BATCH_SIZE
+    folder_order, file_order = LISTING_ORDERS[sort]
+    # 获取当前文件夹下的子文件夹（回收站中的子树通过 deleted_at 条件整体隐藏）
+    subfolders = db.session.execute(
+        db.select(Folder.id, Folder.name, Folder.created_time, Folder.total_bytes, Folder.file_count)
+        .filter_by(parent_id=folder_id, user_id=current_user.id, deleted_at=None)
+        .order_by(*folder_order).execution_options(yield_per=batch))
     
     # 获取当前文件夹下的文件
-    files = File.query.filter_by(folder_id=folder_id, user_id=current_user.id).order_by(File.filename).all()
-    # 转换文件大小显示
-    for file in files:
-        file.display_size = convert_size(file.filesize)
+    files = db.session.execute(
+        db.select(File.id, File.filename, File.filesize, File.upload_time)
+        .filter_by(folder_id=folder_id, user_id=current_user.id, deleted_at=None)
+        .order_by(*file_order).execution_options(yield_per=batch))
     
     return current_folder, subfolders, files
 
+# 取出第一行判断是否为空，返回 (是否为空, 完整的行迭代器)
+def _peek(rows):
+    first = next(rows, None)
+    if first is None:
+        return True, iter(())
+    return False, itertools.chain([first], rows)
+
+# 把模板输出的小片段合并成较大的块再发送
+def _buffered(chunks, size):
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+# 列表中每行的链接只有末尾的ID不同：预先生成前缀，模板中直接拼接，避免逐行调用 url_for
+def _url_prefix(endpoint, **values):
+    return url_for(endpoint, **values)[:-1]
+
+def _row_urls():
+    # 配置了异步传输服务时下载直接走传输服务
+    download = Config.TRANSFER_URL + '/transfer/download/' if Config.TRANSFER_URL else \
+        _url_prefix('files.download_file', file_id=0)
+    return {
+        'folder': _url_prefix('files.file_list', folder_id=0),
+        'download': download,
+        'archive': _url_prefix('files.archive_view', file_id=0),
+        'preview': _url_prefix('files.preview_file', file_id=0),
+        'rename_file': _url_prefix('files.rename_file', file_id=0),
+        'rename_folder': _url_prefix('files.rename_folder', folder_id=0),
+        'delete_file': _url_prefix('files.delete_file', file_id=0),
+        'delete_folder': _url_prefix('files.delete_folder', folder_id=0),
+        'move_file': _url_prefix('files.move_or_copy_file', action='move', file_id=0),
+        'copy_file': _url_prefix('files.move_or_copy_file', action='copy', file_id=0),
+        'move_folder': _url_prefix('files.move_or_copy_folder', action='move', folder_id=0),
+        'copy_folder': _url_prefix('files.move_or_copy_folder', action='copy', folder_id=0),
+        'folder_picker': url_for('files.folder_picker'),
+    }
+
 # 文件列表页面（支持文件夹导航）
+# 页面以流的方式输出：页头和前几行立即发送，大文件夹不必等整个列表生成完
 @files.route('/files')
 @files.route('/files/<int:folder_id>')
 @login_required
 def file_list(folder_id=None):
-    current_folder, subfolders, files = get_contents(folder_id)
+    sort = request.args.get('sort') if request.args.get('sort') in LISTING_ORDERS else 'name'
+    current_folder, subfolders, files = get_contents(folder_id, sort)
     
     if folder_id and current_folder is None:
         flash('文件夹不存在或无访问权限', 'danger')
@@ -62,11 +175,39 @@ def file_list(folder_id=None):
         breadcrumbs.insert(0, current)
         current = current.parent
     
-    return render_template('file_list.html', 
-                         current_folder=current_folder,
-                         folders=subfolders,
-                         files=files,
-                         breadcrumbs=breadcrumbs)
+    no_folders, subfolders = _peek(subfolders)
+    no_files, files = _peek(files)
+    # 响应头发出后会话不能再修改，提示消息需要在开始输出前从会话中取出
+    get_flashed_messages(with_categories=True)
+    
+    page = stream_template('file_list.html', 
+                           current_folder=current_folder,
+                           folders=subfolders,
+                           files=files,
+                           empty=no_folders and no_files,
+                           sort=sort,
+                           urls=_row_urls(),
+                           breadcrumbs=breadcrumbs)
+    return Response(_buffered(page, Config.LISTING_FLUSH_BYTES), mimetype='text/html')
+
+# 移动/复制对话框的目标选择：打开对话框后按需逐级读取，每次只返回一个文件夹的路径和直接子文件夹
+@files.route('/files/folder-picker')
+@login_required
+def folder_picker():
+    folder_id = request.args.get('folder_id', type=int)
+    path = []
+    if folder_id is not None:
+        folder = get_own_folder(folder_id)
+        if folder is None:
+            return jsonify({'error': '文件夹不存在或无访问权限'}), 404
+        current = folder
+        while current:
+            path.insert(0, {'id': current.id, 'name': current.name})
+            current = current.parent
+    children = db.session.query(Folder.id, Folder.name) \
+        .filter_by(user_id=current_user.id, parent_id=folder_id, deleted_at=None).order_by(Folder.name)
+    return jsonify({'id': folder_id, 'path': path,
+                    'folders': [{'id': row.id, 'name': row.name} for row in children]})
 
 # 创建文件夹
 @files.route('/files/create-folder', methods=['POST'])
@@ -83,7 +224,8 @@ def create_folder():
     existing_folder = Folder.query.filter_by(
         name=folder_name, 
         parent_id=parent_id,
-        user_id=current_user.id
+        user_id=current_user.id,
+        deleted_at=None
     ).first()
     
     if existing_folder:
@@ -97,13 +239,12 @@ def create_folder():
         user_id=current_user.id
     )
     db.session.add(new_folder)
+    db.session.flush()
+    record_change(current_user.id, 'folder', new_folder.id, 'create',
+                  name=new_folder.name, parent_id=new_folder.parent_id)
     db.session.commit()
     
-    # 创建对应的物理文件夹
-    user_dir = os.path.join(Config.UPLOAD_FOLDER, str(current_user.id))
-    folder_path = os.path.join(user_dir, str(new_folder.id))
-    os.makedirs(folder_path, exist_ok=True)
-    
+    # 存储端无需预先创建目录，写入第一个文件时自动生成
     flash(f'文件夹 "{folder_name}" 创建成功', 'success')
     return redirect(url_for('files.file_list', folder_id=parent_id))
 
@@ -130,41 +271,49 @@ def upload_file():
         # 确保文件名安全(已移除)
         filename = file.filename #secure_filename(file.filename)
         
-        # 创建用户专属目录
-        user_dir = os.path.join(Config.UPLOAD_FOLDER, str(current_user.id))
-        os.makedirs(user_dir, exist_ok=True)
-        
-        # 如果指定了文件夹，使用文件夹ID作为子目录
+        # 如果指定了文件夹，必须是自己的文件夹
         if folder_id:
-            folder = Folder.query.filter_by(id=folder_id, user_id=current_user.id).first()
-            if folder:
-                user_dir = os.path.join(user_dir, str(folder_id))
-                os.makedirs(user_dir, exist_ok=True)
+            folder = get_own_folder(folder_id)
+            if not folder:
+                flash('文件夹不存在或无访问权限', 'danger')
+                return redirect(url_for('files.file_list'))
         
-        # 保存文件路径
-        filepath = os.path.join(user_dir, filename)
+        # 文件在存储中的键
+        try:
+            filepath = storage_key(current_user.id, folder_id, filename)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('files.file_list', folder_id=folder_id))
         
         # 检查文件是否已存在
-        if os.path.exists(filepath):
+        storage = get_storage()
+        if storage.exists(filepath):
             flash(f'文件 "{filename}" 已存在', 'warning')
             return redirect(url_for('files.file_list', folder_id=folder_id))
         
-        # 保存文件
-        file.save(filepath)
-        
-        # 获取文件大小
-        filesize = os.path.getsize(filepath)
+        # 以流的方式保存文件，同时得到文件大小和校验和
+        reader = HashingReader(file.stream)
+        filesize = storage.put(filepath, reader)
         
         # 创建文件记录并保存到数据库
         new_file = File(
             filename=filename,
             filepath=filepath,
             filesize=filesize,
+            checksum=reader.hexdigest(),
+            checksum_verified_at=datetime.utcnow(),
             user_id=current_user.id,
             folder_id=folder_id
         )
         db.session.add(new_file)
+        db.session.flush()
+        record_change(current_user.id, 'file', new_file.id, 'upload',
+                      name=filename, parent_id=new_file.folder_id, size=filesize)
+        propagate(new_file.folder_id, filesize, 1)
+        # 预留转为用量，与文件记录一起提交
+        adjust(current_user.id, used=filesize, reserved=-g.quota_reserved[1])
         db.session.commit()
+        g.pop('quota_reserved')
         
         flash(f'文件 "{filename}" 上传成功', 'success')
         return redirect(url_for('files.file_list', folder_id=folder_id))
@@ -172,6 +321,337 @@ def upload_file():
     flash('不支持的文件类型', 'danger')
     return redirect(url_for('files.file_list', folder_id=folder_id))
 
+# 分片上传：创建会话（适用于大文件和需要断点续传的客户端）
+@files.route('/files/upload-sessions', methods=['POST'])
+@login_required
+def create_upload_session():
+    data = request.get_json(silent=True) or request.form
+    filename = (data.get('filename') or '').strip()
+    folder_id = data.get('folder_id') or None
+    declared_size = data.get('size')
+
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': '不支持的文件类型'}), 400
+    if folder_id and not get_own_folder(folder_id):
+        return jsonify({'error': '文件夹不存在或无访问权限'}), 404
+    try:
+        key = storage_key(current_user.id, folder_id, filename)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    storage = get_storage()
+    if storage.exists(key) or UploadSession.query.filter_by(key=key).first():
+        return jsonify({'error': f'文件 "{filename}" 已存在'}), 409
+
+    # 有配额限制的用户必须声明大小，会话创建时按声明的大小预留空间
+    try:
+        declared_size = int(declared_size) if declared_size not in (None, '') else None
+    except (TypeError, ValueError):
+        declared_size = -1
+    if declared_size is not None and declared_size < 0:
+        return jsonify({'error': '文件大小无效'}), 400
+    if declared_size is None and limit_for(current_user) is not None:
+        return jsonify({'error': '请提供文件大小 size'}), 411
+    if declared_size and not reserve(current_user.id, declared_size):
+        return jsonify({'error': QuotaExceeded.description}), 413
+
+    try:
+        upload_id = storage.create_multipart(key)
+    except Exception:
+        release(current_user.id, declared_size)
+        raise
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=current_user.id,
+        folder_id=folder_id,
+        filename=filename,
+        key=key,
+        upload_id=upload_id,
+        declared_size=declared_size,
+        reserved_bytes=declared_size or 0
+    )
+    db.session.add(session)
+    db.session.commit()
+    return jsonify({'session_id': session.id, 'part_size': Config.UPLOAD_PART_SIZE}), 201
+
+def _get_upload_session(session_id):
+    session = UploadSession.query.get_or_404(session_id)
+    if session.user_id != current_user.id:
+        abort(404)
+    return session
+
+# 删除会话记录并归还预留的配额（调用方提交）
+def drop_upload_session(session):
+    adjust(session.user_id, reserved=-session.reserved_bytes)
+    db.session.delete(session)
+
+# 分片上传：上传一个分片（请求体即分片内容，序号从1开始，可重复上传覆盖）
+@files.route('/files/upload-sessions/<session_id>/parts/<int:part_number>', methods=['PUT'])
+@login_required
+def upload_part(session_id, part_number):
+    session = _get_upload_session(session_id)
+    if not 1 <= part_number <= 10000:
+        return jsonify({'error': '分片序号无效'}), 400
+    if request.content_length is None or request.content_length > Config.UPLOAD_PART_SIZE:
+        return jsonify({'error': '分片大小无效'}), 413
+    # 超出会话预留的分片在读取请求体之前拒绝
+    if not claim_part(session.id, current_user.id, request.content_length):
+        return jsonify({'error': QuotaExceeded.description}), 413
+    try:
+        etag = get_storage().upload_part(session.key, session.upload_id, part_number, request.stream)
+    except Exception:
+        unclaim_part(session.id, request.content_length)
+        raise
+    return jsonify({'part': part_number, 'etag': etag})
+
+# 分片上传：合并分片并创建文件记录
+@files.route('/files/upload-sessions/<session_id>/complete', methods=['POST'])
+@login_required
+def complete_upload_session(session_id):
+    session = _get_upload_session(session_id)
+    storage = get_storage()
+    filesize = storage.complete_multipart(session.key, session.upload_id)
+
+    # 合并后的大小超过预留时补扣差额，空间不足则删除合并结果
+    try:
+        charge(current_user.id, filesize - session.reserved_bytes)
+    except QuotaExceeded as e:
+        storage.delete(session.key)
+        drop_upload_session(session)
+        db.session.commit()
+        return jsonify({'error': e.description}), 413
+    adjust(current_user.id, used=min(filesize, session.reserved_bytes), reserved=-session.reserved_bytes)
+
+    new_file = File(
+        filename=session.filename,
+        filepath=session.key,
+        filesize=filesize,
+        # 分片可能乱序到达，合并后再顺序计算一次校验和
+        checksum=compute_checksum(storage, session.key),
+        checksum_verified_at=datetime.utcnow(),
+        user_id=current_user.id,
+        folder_id=session.folder_id
+    )
+    db.session.add(new_file)
+    db.session.delete(session)
+    db.session.flush()
+    record_change(current_user.id, 'file', new_file.id, 'upload',
+                  name=new_file.filename, parent_id=new_file.folder_id, size=filesize)
+    propagate(new_file.folder_id, filesize, 1)
+    db.session.commit()
+    return jsonify({'file_id': new_file.id, 'size': filesize})
+
+# 分片上传：放弃会话
+@files.route('/files/upload-sessions/<session_id>', methods=['DELETE'])
+@login_required
+def abort_upload_session(session_id):
+    session = _get_upload_session(session_id)
+    get_storage().abort_multipart(session.key, session.upload_id)
+    drop_upload_session(session)
+    db.session.commit()
+    return jsonify({'aborted': True})
+
+def _get_own_file_json(file_id):
+    file = File.query.get_or_404(file_id)
+    if file.user_id != current_user.id or file_in_trash(file):
+        abort(404)
+    return file
+
+# 增量更新：获取现有版本的分块签名（流式输出，不在内存中保存整个签名表）
+# 响应头 ETag 为当前版本的 SHA-256，提交增量时通过 If-Match 带回
+@files.route('/files/delta/<int:file_id>/signatures')
+@login_required
+def delta_signatures(file_id):
+    file = _get_own_file_json(file_id)
+    block_size = clamp_block_size(request.args.get('block_size', type=int))
+    storage = get_storage()
+    if storage.stat(file.filepath) is None:
+        abort(404)
+    
+    def generate():
+        yield json.dumps({'file_id': file.id, 'size': file.filesize, 'checksum': file.checksum,
+                          'block_size': block_size})[:-1] + ', "blocks": ['
+        for i, (weak, strong) in enumerate(iter_signatures(storage, file.filepath, block_size)):
+            yield f'{"," if i else ""}[{weak},"{strong}"]'
+        yield ']}'
+    
+    response = Response(stream_with_context(generate()), mimetype='application/json')
+    if file.checksum:
+        response.set_etag(file.checksum)
+    return response
+
+# 增量更新：提交指令流，重建新版本并原子替换
+@files.route('/files/delta/<int:file_id>', methods=['POST'])
+@login_required
+def apply_delta(file_id):
+    file = _get_own_file_json(file_id)
+    block_size = clamp_block_size(request.args.get('block_size', type=int))
+    # 签名获取之后文件又被修改过，块号已失效
+    if request.if_match and not request.if_match.contains(file.checksum or ''):
+        return jsonify({'error': '文件已被修改，请重新获取签名'}), 412
+    
+    storage = get_storage()
+    obj = storage.stat(file.filepath)
+    if obj is None:
+        abort(404)
+    # 新版本的大小事先未知：预留剩余空间（至多到 DELTA_MAX_RESULT_SIZE），重建结果不能超出
+    old_size = file.filesize or 0
+    reserved = reserve_up_to(current_user.id, max(0, Config.DELTA_MAX_RESULT_SIZE - old_size))
+    max_size = old_size + reserved
+    source = BlockSource(storage, file.filepath, obj.size, block_size)
+    reader = DeltaReader(request.stream, source, max_size)
+    try:
+        filesize = storage.put(file.filepath, reader)
+    except DeltaError as e:
+        release(current_user.id, reserved)
+        if reader.size > max_size and max_size < Config.DELTA_MAX_RESULT_SIZE:
+            return jsonify({'error': QuotaExceeded.description}), 413
+        return jsonify({'error': str(e)}), 400
+    except Exception:
+        release(current_user.id, reserved)
+        raise
+    finally:
+        source.close()
+    
+    adjust(current_user.id, used=filesize - old_size, reserved=-reserved)
+    propagate(file.folder_id, filesize - old_size)
+    file.filesize = filesize
+    file.checksum = reader.hexdigest()
+    file.checksum_verified_at = datetime.utcnow()
+    file.checksum_mismatch = False
+    record_change(current_user.id, 'file', file.id, 'update',
+                  name=file.filename, parent_id=file.folder_id, size=filesize)
+    db.session.commit()
+    return jsonify({'file_id': file.id, 'size': filesize, 'checksum': file.checksum,
+                    'literal_bytes': reader.literal_bytes})
+
+# 模板中显示文件大小
+@files.app_template_filter('filesize')
+def filesize_filter(size_bytes):
+    return convert_size(size_bytes)
+
+# 模板中判断文件是否为可浏览的压缩包
+@files.app_template_filter('archive_format')
+def archive_format_filter(filename):
+    return archive_format(filename)
+
+def _get_own_archive(file_id):
+    file = File.query.get_or_404(file_id)
+    if file.user_id != current_user.id or file_in_trash(file) or not archive_format(file.filename):
+        abort(404)
+    return file
+
+# 浏览压缩包成员（索引缓存在数据库中，分页显示）
+@files.route('/files/archive/<int:file_id>')
+@login_required
+def archive_view(file_id):
+    file = _get_own_archive(file_id)
+    try:
+        fmt, members = get_index(file)
+    except (ArchiveError, OSError) as e:
+        flash(f'无法读取压缩包: {str(e)}', 'danger')
+        return redirect(url_for('files.file_list', folder_id=file.folder_id))
+    
+    query = (request.args.get('q') or '').strip()
+    if query:
+        members = [m for m in members if query.lower() in m['n'].lower()]
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = Config.ARCHIVE_PAGE_SIZE
+    pages = max(1, (len(members) + per_page - 1) // per_page)
+    shown = members[(page - 1) * per_page:page * per_page]
+    for member in shown:
+        member['display_size'] = convert_size(member['s']) if member['s'] is not None else '-'
+    
+    return render_template('archive.html', title=file.filename, file=file, format=fmt, members=shown,
+                           total=len(members), page=page, pages=pages, query=query,
+                           jobs=[job for job in user_jobs(current_user.id, 'extract') if job.description == file.filename][:5])
+
+# 下载压缩包中的单个成员（只读取该成员所需的数据）
+@files.route('/files/archive/<int:file_id>/member')
+@login_required
+def archive_member(file_id):
+    file = _get_own_archive(file_id)
+    name = request.args.get('name') or ''
+    try:
+        size, chunks = open_member(file, name)
+    except (ArchiveError, OSError) as e:
+        flash(f'无法读取压缩包成员: {str(e)}', 'danger')
+        return redirect(url_for('files.archive_view', file_id=file.id))
+    
+    response = Response(stream_with_context(chunks), mimetype='application/octet-stream', direct_passthrough=True)
+    response.headers.set('Content-Disposition', 'attachment', filename=name.rsplit('/', 1)[-1] or 'data')
+    if size is not None:
+        response.content_length = size
+    response.cache_control.private = True
+    return throttle_response(response, current_user.id)
+
+# 在服务器上把压缩包解压到同级的新文件夹（后台任务，每个用户同时只能运行一个）
+@files.route('/files/archive/<int:file_id>/extract', methods=['POST'])
+@login_required
+def archive_extract(file_id):
+    file = _get_own_archive(file_id)
+    if job_running('extract', user_id=current_user.id):
+        flash('已有解压任务正在运行，请稍后再试', 'warning')
+        return redirect(url_for('files.archive_view', file_id=file.id))
+    submit_job('extract', extract_archive, file.id, current_user.id,
+               description=file.filename, user_id=current_user.id)
+    flash('解压任务已开始，完成后会出现在同一文件夹中', 'success')
+    return redirect(url_for('files.archive_view', file_id=file.id))
+
+# 模板中判断文件是否可在线预览
+@files.app_template_filter('previewable')
+def previewable_filter(filename):
+    return previewable(filename)
+
+def _get_own_text(file_id):
+    file = File.query.get_or_404(file_id)
+    if file.user_id != current_user.id or file_in_trash(file) or not previewable(file.filename):
+        abort(404)
+    return file
+
+# 预览文本文件：按行分页，支持跳到指定行和查看末尾
+@files.route('/files/preview/<int:file_id>')
+@login_required
+def preview_file(file_id):
+    file = _get_own_text(file_id)
+    count = request.args.get('count', Config.PREVIEW_PAGE_LINES, type=int)
+    tail = 'tail' in request.args
+    try:
+        with open_preview(file) as preview:
+            if tail:
+                result = preview.tail(count)
+            else:
+                result = preview.page(request.args.get('line', 1, type=int), count)
+    except (PreviewError, OSError) as e:
+        flash(f'无法预览文件: {str(e)}', 'danger')
+        return redirect(url_for('files.file_list', folder_id=file.folder_id))
+    
+    return render_template('preview.html', title=file.filename, file=file, result=result,
+                           count=count, tail=tail, size=convert_size(file.filesize))
+
+# 预览数据接口（JSON）：
+#   ?line=N&count=M       从第 N 行开始的 M 行
+#   ?tail=M               最后 M 行
+#   ?offset=B&length=L    从字节偏移 B 开始的 L 字节
+@files.route('/files/preview/<int:file_id>/data')
+@login_required
+def preview_data(file_id):
+    file = _get_own_text(file_id)
+    count = request.args.get('count', Config.PREVIEW_PAGE_LINES, type=int)
+    try:
+        with open_preview(file) as preview:
+            if 'offset' in request.args:
+                result = preview.window(request.args.get('offset', 0, type=int),
+                                        request.args.get('length', Config.PREVIEW_MAX_BYTES, type=int))
+            elif 'tail' in request.args:
+                result = preview.tail(request.args.get('tail', count, type=int))
+            else:
+                result = preview.page(request.args.get('line', 1, type=int), count)
+    except (PreviewError, OSError) as e:
+        return jsonify({'error': str(e)}), 400
+    result['file_id'] = file.id
+    return jsonify(result)
+
 # 文件重命名
 @files.route('/files/rename/<int:file_id>', methods=['POST'])
 @login_required
@@ -180,7 +660,7 @@ def rename_file(file_id):
     file = File.query.get_or_404(file_id)
     
     # 验证文件所有权
-    if file.user_id != current_user.id:
+    if file.user_id != current_user.id or file_in_trash(file):
         flash('没有访问权限', 'danger')
         return redirect(url_for('files.file_list', folder_id=file.folder_id))
     
@@ -193,25 +673,24 @@ def rename_file(file_id):
     existing_file = File.query.filter_by(
         filename=new_name,
         folder_id=file.folder_id,
-        user_id=current_user.id
+        user_id=current_user.id,
+        deleted_at=None
     ).first()
     
     if existing_file and existing_file.id != file.id:
         flash(f'文件 "{new_name}" 已存在', 'warning')
         return redirect(url_for('files.file_list', folder_id=file.folder_id))
     
-    # 获取原文件路径和新文件路径
-    old_path = file.filepath
-    directory = os.path.dirname(old_path)
-    new_path = os.path.join(directory, new_name)
-    
     try:
-        # 重命名物理文件
-        os.rename(old_path, new_path)
+        # 重命名存储中的文件
+        new_path = storage_key(current_user.id, file.folder_id, new_name)
+        get_storage().rename(file.filepath, new_path)
         
         # 更新数据库记录
         file.filename = new_name
         file.filepath = new_path
+        record_change(current_user.id, 'file', file.id, 'rename',
+                      name=new_name, parent_id=file.folder_id, size=file.filesize)
         db.session.commit()
         
         flash(f'文件已重命名为 "{new_name}"', 'success')
@@ -228,7 +707,7 @@ def rename_folder(folder_id):
     folder = Folder.query.get_or_404(folder_id)
     
     # 验证文件夹所有权
-    if folder.user_id != current_user.id:
+    if folder.user_id != current_user.id or folder_in_trash(folder):
         flash('没有访问权限', 'danger')
         return redirect(url_for('files.file_list', folder_id=folder.parent_id))
     
@@ -241,7 +720,8 @@ def rename_folder(folder_id):
     existing_folder = Folder.query.filter_by(
         name=new_name,
         parent_id=folder.parent_id,
-        user_id=current_user.id
+        user_id=current_user.id,
+        deleted_at=None
     ).first()
     
     if existing_folder and existing_folder.id != folder.id:
@@ -251,6 +731,8 @@ def rename_folder(folder_id):
     try:
         # 更新数据库记录
         folder.name = new_name
+        record_change(current_user.id, 'folder', folder.id, 'rename',
+                      name=new_name, parent_id=folder.parent_id)
         db.session.commit()
         
         flash(f'文件夹已重命名为 "{new_name}"', 'success')
@@ -259,6 +741,81 @@ def rename_folder(folder_id):
     
     return redirect(url_for('files.file_list', folder_id=folder.parent_id))
 
+# 解析移动/复制的目标文件夹（空值表示根目录），返回 (是否有效, 文件夹)
+def _target_folder():
+    target_id = request.form.get('target_folder_id', type=int)
+    if not target_id:
+        return True, None
+    target = get_own_folder(target_id)
+    return target is not None, target
+
+# 移动或复制文件
+@files.route('/files/<any(move, copy):action>/<int:file_id>', methods=['POST'])
+@login_required
+def move_or_copy_file(action, file_id):
+    file = File.query.get_or_404(file_id)
+    if file.user_id != current_user.id or file_in_trash(file):
+        flash('没有访问权限', 'danger')
+        return redirect(url_for('files.file_list'))
+    
+    valid, target = _target_folder()
+    if not valid:
+        flash('目标文件夹不存在或无访问权限', 'danger')
+        return redirect(url_for('files.file_list', folder_id=file.folder_id))
+    
+    try:
+        if action == 'move':
+            move_file(file, target)
+            db.session.commit()
+            flash(f'文件 "{file.filename}" 已移动', 'success')
+        else:
+            new_file = copy_file(file, target)
+            db.session.commit()
+            flash(f'文件已复制为 "{new_file.filename}"', 'success')
+    except TreeError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
+        return redirect(url_for('files.file_list', folder_id=file.folder_id))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'操作失败: {str(e)}', 'danger')
+        return redirect(url_for('files.file_list', folder_id=file.folder_id))
+    
+    return redirect(url_for('files.file_list', folder_id=target.id if target else None))
+
+# 移动或复制文件夹（连同其中的全部内容）
+@files.route('/files/<any(move, copy):action>-folder/<int:folder_id>', methods=['POST'])
+@login_required
+def move_or_copy_folder(action, folder_id):
+    folder = Folder.query.get_or_404(folder_id)
+    if folder.user_id != current_user.id or folder_in_trash(folder):
+        flash('没有访问权限', 'danger')
+        return redirect(url_for('files.file_list'))
+    
+    valid, target = _target_folder()
+    if not valid:
+        flash('目标文件夹不存在或无访问权限', 'danger')
+        return redirect(url_for('files.file_list', folder_id=folder.parent_id))
+    
+    try:
+        if action == 'move':
+            move_folder(folder, target)
+            db.session.commit()
+            flash(f'文件夹 "{folder.name}" 已移动', 'success')
+        else:
+            new_folder = copy_folder(folder, target)
+            flash(f'文件夹已复制为 "{new_folder.name}"', 'success')
+    except TreeError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
+        return redirect(url_for('files.file_list', folder_id=folder.parent_id))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'操作失败: {str(e)}', 'danger')
+        return redirect(url_for('files.file_list', folder_id=folder.parent_id))
+    
+    return redirect(url_for('files.file_list', folder_id=target.id if target else None))
+
 # 文件下载
 @files.route('/files/download/<int:file_id>')
 @login_required
@@ -266,17 +823,15 @@ def download_file(file_id):
     # 获取文件记录
     file = File.query.get_or_404(file_id)
     
-    # 验证文件所有权
-    if file.user_id != current_user.id:
+    # 验证文件所有权（回收站中的文件需先恢复）
+    if file.user_id != current_user.id or file_in_trash(file):
         flash('没有访问权限', 'danger')
         return redirect(url_for('files.file_list', folder_id=file.folder_id))
     
     # 发送文件供下载
-    directory = os.path.dirname(file.filepath)
-    filename = os.path.basename(file.filepath)
-    return send_from_directory(directory, filename, as_attachment=True)
+    return send_stored_file(file.filepath, file.filename, user_id=current_user.id)
 
-# 文件删除
+# 文件删除（移入回收站）
 @files.route('/files/delete/<int:file_id>', methods=['POST'])
 @login_required
 def delete_file(file_id):
@@ -285,29 +840,28 @@ def delete_file(file_id):
     folder_id = file.folder_id  # 记录父文件夹ID用于重定向
     
     # 验证文件所有权
-    if file.user_id != current_user.id:
+    if file.user_id != current_user.id or file_in_trash(file):
         flash('没有删除权限', 'danger')
         return redirect(url_for('files.file_list', folder_id=folder_id))
     
     # 保存文件名用于提示
     filename = file.filename
     
-    # 删除物理文件
-    if os.path.exists(file.filepath):
-        try:
-            os.remove(file.filepath)
-        except Exception as e:
-            flash(f'删除文件失败: {str(e)}', 'danger')
-            return redirect(url_for('files.file_list', folder_id=folder_id))
-    
-    # 从数据库删除记录
-    db.session.delete(file)
-    db.session.commit()
+    # 存储对象改名为回收站键，数据库只更新这一行
+    try:
+        revoked = trash_file(file)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'删除文件失败: {str(e)}', 'danger')
+        return redirect(url_for('files.file_list', folder_id=folder_id))
+    for share_id in revoked:
+        revocations.add(share_id)
     
-    flash(f'文件 "{filename}" 已删除', 'success')
+    flash(f'文件 "{filename}" 已移入回收站', 'success')
     return redirect(url_for('files.file_list', folder_id=folder_id))
 
-# 文件夹删除
+# 文件夹删除（移入回收站）
 @files.route('/files/delete-folder/<int:folder_id>', methods=['POST'])
 @login_required
 def delete_folder(folder_id):
@@ -316,25 +870,93 @@ def delete_folder(folder_id):
     parent_id = folder.parent_id  # 记录父文件夹ID用于重定向
     
     # 验证文件夹所有权
-    if folder.user_id != current_user.id:
+    if folder.user_id != current_user.id or folder.deleted_at is not None:
         flash('没有删除权限', 'danger')
         return redirect(url_for('files.file_list', folder_id=parent_id))
     
     # 保存文件夹名用于提示
     folder_name = folder.name
     
-    # 删除物理文件夹及其内容
-    folder_path = os.path.join(Config.UPLOAD_FOLDER, str(current_user.id), str(folder_id))
-    if os.path.exists(folder_path):
-        try:
-            shutil.rmtree(folder_path)
-        except Exception as e:
-            flash(f'删除文件夹失败: {str(e)}', 'danger')
-            return redirect(url_for('files.file_list', folder_id=parent_id))
-    
-    # 从数据库删除记录（级联删除子文件夹和文件）
-    db.session.delete(folder)
+    # 只标记顶层文件夹，子文件夹和文件保持不变，与文件夹大小无关
+    # 只记录顶层文件夹的删除，客户端据此删除整个子树
+    revoked = trash_folder(folder)
     db.session.commit()
+    for share_id in revoked:
+        revocations.add(share_id)
     
-    flash(f'文件夹 "{folder_name}" 已删除', 'success')
-    return redirect(url_for('files.file_list', folder_id=parent_id))
\ No newline at end of file
+    flash(f'文件夹 "{folder_name}" 已移入回收站', 'success')
+    return redirect(url_for('files.file_list', folder_id=parent_id))
+
+# 回收站
+@files.route('/files/trash')
+@login_required
+def trash_list():
+    folders = Folder.query.filter(Folder.user_id == current_user.id, Folder.deleted_at.isnot(None)) \
+        .order_by(Folder.deleted_at.desc()).all()
+    files = File.query.filter(File.user_id == current_user.id, File.deleted_at.isnot(None)) \
+        .order_by(File.deleted_at.desc()).all()
+    for file in files:
+        file.display_size = convert_size(file.filesize)
+    return render_template('trash.html', title='回收站', folders=folders, files=files,
+                           retention_days=Config.TRASH_RETENTION.days)
+
+def _get_trashed(model, item_id):
+    item = model.query.get_or_404(item_id)
+    if item.user_id != current_user.id or item.deleted_at is None:
+        abort(404)
+    return item
+
+# 从回收站恢复文件（原文件夹已不存在时恢复到根目录，重名时自动追加序号）
+@files.route('/files/trash/restore/<int:file_id>', methods=['POST'])
+@login_required
+def restore_trashed_file(file_id):
+    file = _get_trashed(File, file_id)
+    try:
+        restore_file(file)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'恢复文件失败: {str(e)}', 'danger')
+        return redirect(url_for('files.trash_list'))
+    flash(f'文件 "{file.filename}" 已恢复', 'success')
+    return redirect(url_for('files.file_list', folder_id=file.folder_id))
+
+# 从回收站恢复文件夹（连同其中的全部内容）
+@files.route('/files/trash/restore-folder/<int:folder_id>', methods=['POST'])
+@login_required
+def restore_trashed_folder(folder_id):
+    folder = _get_trashed(Folder, folder_id)
+    restore_folder(folder)
+    db.session.commit()
+    flash(f'文件夹 "{folder.name}" 已恢复', 'success')
+    return redirect(url_for('files.file_list', folder_id=folder.id))
+
+# 彻底删除回收站中的文件
+@files.route('/files/trash/delete/<int:file_id>', methods=['POST'])
+@login_required
+def purge_trashed_file(file_id):
+    file = _get_trashed(File, file_id)
+    filename = file.filename
+    try:
+        purge_file(file.id, file.filepath)
+    except Exception as e:
+        db.session.rollback()
+        flash(f'删除文件失败: {str(e)}', 'danger')
+        return redirect(url_for('files.trash_list'))
+    flash(f'文件 "{filename}" 已彻底删除', 'success')
+    return redirect(url_for('files.trash_list'))
+
+# 彻底删除回收站中的文件夹
+@files.route('/files/trash/delete-folder/<int:folder_id>', methods=['POST'])
+@login_required
+def purge_trashed_folder(folder_id):
+    folder = _get_trashed(Folder, folder_id)
+    folder_name = folder.name
+    try:
+        purge_folder(current_user.id, folder.id)
+    except Exception as e:
+        db.session.rollback()
+        flash(f'删除文件夹失败: {str(e)}', 'danger')
+        return redirect(url_for('files.trash_list'))
+    flash(f'文件夹 "{folder_name}" 已彻底删除', 'success')
+    return redirect(url_for('files.trash_list'))
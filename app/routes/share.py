@@ -0,0 +1,213 @@
+from flask import Blueprint, render_template, redirect, url_for, request, flash, session, abort
+from flask_login import login_required, current_user
+from datetime import datetime, timedelta
+from app import db
+from app.models import ShareLink, File, Folder
+from app.config import BaseConfig as Config
+from app.serving import send_stored_file
+from app.storage import get_storage
+from app.passwords import hash_password, verify_password
+from app.sharing import (make_token, load_token, revocations, resolve_shared_file,
+                         resolve_shared_folder, folder_in_share, consume_download)
+from app.routes.files import convert_size
+from app.trash import folder_in_trash, file_in_trash
+
+# 分享链接蓝图
+share = Blueprint('share', __name__)
+
+# 创建分享链接
+@share.route('/share/create', methods=['POST'])
+@login_required
+def create_share():
+    file_id = request.form.get('file_id', type=int)
+    folder_id = request.form.get('folder_id', type=int)
+    back = request.form.get('back_folder_id') or None
+
+    if file_id:
+        target = File.query.filter_by(id=file_id, user_id=current_user.id).first()
+    elif folder_id:
+        target = Folder.query.filter_by(id=folder_id, user_id=current_user.id).first()
+    else:
+        target = None
+    if target and (file_in_trash(target) if file_id else folder_in_trash(target)):
+        target = None
+    if not target:
+        flash('要分享的内容不存在或无访问权限', 'danger')
+        return redirect(url_for('files.file_list', folder_id=back))
+
+    expires_days = request.form.get('expires_days', type=int)
+    password = (request.form.get('password') or '').strip()
+    max_downloads = request.form.get('max_downloads', type=int)
+
+    link = ShareLink(
+        user_id=current_user.id,
+        file_id=file_id if file_id else None,
+        folder_id=None if file_id else folder_id,
+        token='',
+        password_hash=hash_password(password) if password else None,
+        max_downloads=max_downloads if max_downloads and max_downloads > 0 else None,
+        expires_at=datetime.utcnow() + timedelta(days=expires_days) if expires_days else None
+    )
+    db.session.add(link)
+    db.session.flush()
+    try:
+        link.token = make_token(link)
+    except OSError as e:
+        db.session.rollback()
+        flash(f'创建分享失败: {str(e)}', 'danger')
+        return redirect(url_for('files.file_list', folder_id=back))
+    db.session.commit()
+
+    flash(f'分享链接已创建: {url_for("share.open_share", token=link.token, _external=True)}', 'success')
+    return redirect(url_for('share.share_list'))
+
+# 我的分享
+@share.route('/share/links')
+@login_required
+def share_list():
+    links = ShareLink.query.filter_by(user_id=current_user.id).order_by(ShareLink.created_at.desc()).all()
+    return render_template('share_list.html', title='我的分享', links=links, now=datetime.utcnow())
+
+# 撤销分享
+@share.route('/share/revoke/<int:share_id>', methods=['POST'])
+@login_required
+def revoke_share(share_id):
+    link = ShareLink.query.get_or_404(share_id)
+    if link.user_id != current_user.id:
+        flash('没有访问权限', 'danger')
+        return redirect(url_for('share.share_list'))
+    link.revoked = True
+    db.session.commit()
+    revocations.add(link.id)
+    flash('分享已撤销', 'success')
+    return redirect(url_for('share.share_list'))
+
+
+# 以下为公开访问的路由（无需登录）
+
+def _load_or_404(token):
+    payload = load_token(token)
+    if payload is None:
+        abort(404)
+    return payload
+
+# 带密码的分享需先在本会话中解锁
+def _unlocked(payload):
+    return not payload.get('pw') or payload['s'] in session.get('share_unlocked', [])
+
+# 有次数限制的分享：每次下载计数一次，计数后在本会话中为（分享, 文件）记录下载许可，
+# 许可附带与文件大小相同的续传字节预算。持有许可、所有范围都不从头开始且请求字节数
+# 不超过剩余预算的请求（断点续传）不再计数，只扣减预算；其余请求都视为新的下载
+def _allow_download(payload, file_id, size):
+    if not payload.get('lim'):
+        return True
+    key = f"{payload['s']}:{file_id}"
+    grants = session.get('share_grants')
+    if not isinstance(grants, dict):  # 旧版本会话中记录的是列表
+        grants = {}
+    ranges = request.range.ranges if request.range else None
+    if ranges and key in grants and all(start is not None and start > 0 for start, _ in ranges):
+        wanted = sum(max(0, min(size, size if stop is None else stop) - start) for start, stop in ranges)
+        if wanted <= grants[key]:
+            grants[key] -= wanted
+            session['share_grants'] = grants
+            return True
+    if not consume_download(payload['s']):
+        return False
+    grants.pop(key, None)
+    grants[key] = size
+    # 只保留最近的许可，避免会话 Cookie 无限增长
+    session['share_grants'] = dict(list(grants.items())[-Config.SHARE_GRANTS_MAX:])
+    return True
+
+# 分享页面（带密码时显示密码输入框）
+@share.route('/s/<token>', methods=['GET', 'POST'])
+def open_share(token):
+    payload = _load_or_404(token)
+
+    if request.method == 'POST' and payload.get('pw'):
+        link = ShareLink.query.get(payload['s'])
+        if link and link.password_hash and verify_password(link.password_hash, request.form.get('password', '')):
+            session['share_unlocked'] = session.get('share_unlocked', []) + [payload['s']]
+            return redirect(url_for('share.open_share', token=token))
+        flash('访问密码错误', 'danger')
+
+    if not _unlocked(payload):
+        return render_template('share_view.html', title='访问分享', token=token, locked=True)
+
+    if payload['t'] == 'f':
+        return render_template('share_view.html', title='文件分享', token=token, locked=False,
+                               filename=payload['n'])
+    return redirect(url_for('share.shared_folder', token=token, folder_id=payload['i']))
+
+# 下载分享的文件（热点路径：签名校验 + 一次 stat，不查询数据库）
+@share.route('/s/<token>/download')
+def download_shared(token):
+    payload = _load_or_404(token)
+    if payload['t'] != 'f':
+        abort(404)
+    if not _unlocked(payload):
+        return redirect(url_for('share.open_share', token=token))
+
+    path, filename = resolve_shared_file(payload)
+    if not path:
+        abort(404)
+    if payload.get('lim'):
+        obj = get_storage().stat(path)
+        if obj is None:
+            abort(404)
+        if not _allow_download(payload, payload['i'], obj.size):
+            abort(410)
+
+    # 无密码、无次数限制的分享可被公共缓存
+    public = not payload.get('pw') and not payload.get('lim')
+    return send_stored_file(path, filename, public_max_age=Config.SHARE_CACHE_MAX_AGE if public else None)
+
+# 浏览分享的文件夹
+@share.route('/s/<token>/folder/<int:folder_id>')
+def shared_folder(token, folder_id):
+    payload = _load_or_404(token)
+    if payload['t'] != 'd':
+        abort(404)
+    if not _unlocked(payload):
+        return redirect(url_for('share.open_share', token=token))
+
+    root = resolve_shared_folder(payload)
+    folder = Folder.query.filter_by(id=folder_id, user_id=payload['u']).first()
+    if not root or not folder or not folder_in_share(folder, root) or folder_in_trash(folder):
+        abort(404)
+
+    subfolders = Folder.query.filter_by(parent_id=folder.id, deleted_at=None).order_by(Folder.name).all()
+    files = File.query.filter_by(folder_id=folder.id, deleted_at=None).order_by(File.filename).all()
+    for file in files:
+        file.display_size = convert_size(file.filesize)
+
+    # 分享根目录以内的导航链
+    breadcrumbs = []
+    current = folder
+    while current and current.id != root.id:
+        breadcrumbs.insert(0, current)
+        current = current.parent
+
+    return render_template('share_folder.html', title='文件夹分享', token=token, root=root,
+                           folder=folder, folders=subfolders, files=files, breadcrumbs=breadcrumbs)
+
+# 下载分享文件夹中的文件
+@share.route('/s/<token>/file/<int:file_id>')
+def download_shared_member(token, file_id):
+    payload = _load_or_404(token)
+    if payload['t'] != 'd':
+        abort(404)
+    if not _unlocked(payload):
+        return redirect(url_for('share.open_share', token=token))
+
+    root = resolve_shared_folder(payload)
+    file = File.query.filter_by(id=file_id, user_id=payload['u']).first()
+    if not root or not file or not file.folder or not folder_in_share(file.folder, root) or file_in_trash(file):
+        abort(404)
+    if not _allow_download(payload, file.id, file.filesize):
+        abort(410)
+
+    public = not payload.get('pw') and not payload.get('lim')
+    return send_stored_file(file.filepath, file.filename,
+                            public_max_age=Config.SHARE_CACHE_MAX_AGE if public else None)
@@ -0,0 +1,40 @@
+import calendar
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from app.config import BaseConfig as Config
+from app.journal import changes_since, latest_id, make_cursor, parse_cursor, cursor_expired
+
+# 同步客户端接口蓝图
+sync = Blueprint('sync', __name__)
+
+# 增量变更：返回游标之后的变更记录
+# 无游标或游标已超过保留期时返回 reset=true，客户端需全量重新遍历后再继续轮询
+@sync.route('/changes')
+@login_required
+def changes():
+    limit = max(1, min(request.args.get('limit', Config.JOURNAL_PAGE_SIZE, type=int),
+                       Config.JOURNAL_PAGE_SIZE))
+    last_id, issued_at = parse_cursor(request.args.get('cursor'))
+
+    if last_id is None or cursor_expired(issued_at):
+        return jsonify({
+            'changes': [],
+            'cursor': make_cursor(latest_id(current_user.id)),
+            'has_more': False,
+            'reset': True
+        })
+
+    rows, has_more = changes_since(current_user.id, last_id, limit)
+    issued_at = None
+    if rows:
+        last_id = rows[-1].id
+        # 还有未取完的记录时，以最后一条的时间签发，避免剩余记录在下次拉取前被压缩
+        if has_more:
+            issued_at = calendar.timegm(rows[-1].created_at.utctimetuple())
+
+    return jsonify({
+        'changes': [row.to_dict() for row in rows],
+        'cursor': make_cursor(last_id, issued_at),
+        'has_more': has_more,
+        'reset': False
+    })
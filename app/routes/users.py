@@ -1,10 +1,18 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, current_app
+from flask import (Blueprint, render_template, redirect, url_for, request, flash, current_app, abort, send_from_directory,
+                   Response, stream_with_context)
 from flask_login import login_required, current_user, logout_user
 from app import db
 from app.models import User, File, Folder
 from app.config import BaseConfig as Config
+from app.journal import record_change
+from app.filecache import hot_files, stat_path, read_path, guess_mimetype
+from app.serving import send_cached, resolve_range
+from app.throttle import throttle_response
+from app.export import export_snapshot, measure_export, iter_export
+from app.quotas import usage
 import os
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 import shutil
 
 users = Blueprint('users', __name__)
@@ -18,7 +26,45 @@ def allowed_avatar(filename):
 @users.route('/profile')
 @login_required
 def profile():
-    return render_template('profile.html', title='个人资料')
+    return render_template('profile.html', title='个人资料', usage=usage(current_user))
+
+# 导出全部数据：按目录结构打包为 tar 流式输出，支持 Range 续传，按导出限额单独限速
+@users.route('/profile/export')
+@login_required
+def export_data():
+    user_id = current_user.id
+    snapshot = export_snapshot(user_id)
+    size, etag = measure_export(user_id, snapshot)
+    response = Response(mimetype='application/x-tar', direct_passthrough=True)
+    response.set_etag(etag)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers.set('Content-Disposition', 'attachment', filename=f'{current_user.username}.tar')
+    response.cache_control.private = True
+    if request.if_none_match and request.if_none_match.contains(etag):
+        response.status_code = 304
+        return response
+
+    byte_range = resolve_range(response, size, etag)
+    if byte_range is None:
+        return response
+    start, end = byte_range
+    response.content_length = end - start + 1
+    if request.method != 'HEAD':
+        response.response = stream_with_context(iter_export(user_id, start, end, snapshot))
+    return throttle_response(response, user_id, 'export')
+
+# 头像（访问量大且文件小，经由热点缓存发送）
+@users.route('/avatar/<filename>')
+def avatar(filename):
+    path = safe_join(Config.AVATAR_FOLDER, filename)
+    if path is None:
+        abort(404)
+    if hot_files.enabled:
+        entry = hot_files.fetch(f'avatar:{filename}', lambda: stat_path(path), lambda: read_path(path),
+                                guess_mimetype(filename))
+        if entry is not None:
+            return send_cached(entry)
+    return send_from_directory(Config.AVATAR_FOLDER, filename)
 
 # 上传头像
 @users.route('/profile/upload-avatar', methods=['POST'])
@@ -55,13 +101,18 @@ def upload_avatar():
                 os.remove(current_user.avatar_path)
             except Exception as e:
                 flash(f'删除旧头像失败: {str(e)}', 'warning')
+        if current_user.avatar_filename:
+            hot_files.invalidate(f'avatar:{current_user.avatar_filename}')
         
-        # 保存新头像
+        # 保存新头像（同名时覆盖，缓存随之失效）
         file.save(filepath)
+        hot_files.invalidate(f'avatar:{unique_filename}')
         
         # 更新数据库记录
         current_user.avatar_filename = unique_filename
         current_user.avatar_path = filepath
+        record_change(current_user.id, 'avatar', current_user.id, 'update',
+                      name=unique_filename)
         db.session.commit()
         
         flash('头像上传成功', 'success')
@@ -0,0 +1,111 @@
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.models import File
+from app.config import BaseConfig as Config
+from app.storage import get_storage
+from app.throttle import MemoryStore
+
+# 完整性巡检（scrub）
+#
+# 按最近校验时间从旧到新滚动选取到期的文件，由线程池重新计算 SHA-256 并与记录比较。
+# 所有工作线程共享一个读取速率预算（SCRUB_BYTES_PER_SEC），避免影响前台流量。
+# 没有校验和的旧文件在第一次巡检时建立基准值。
+# 结果以读取时的校验和与存储键为条件写回：巡检期间被增量更新、重命名或移动的文件不记录结果，留待下一轮重新校验。
+
+# 流式计算存储对象的校验和，limiter(nbytes) 用于限速
+def compute_checksum(storage, key, limiter=None):
+    digest = hashlib.sha256()
+    for chunk in storage.iter_range(key):
+        if limiter:
+            limiter(len(chunk))
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+# 读取速率预算，所有巡检线程共享
+class IoBudget:
+    def __init__(self, bytes_per_sec):
+        self.rate = bytes_per_sec
+        self.store = MemoryStore()
+
+    def __call__(self, nbytes):
+        if not self.rate:
+            return
+        wait = self.store.take('scrub', nbytes, self.rate, self.rate)
+        if wait > 0:
+            time.sleep(wait)
+
+
+def due_files(limit):
+    cutoff = datetime.utcnow() - Config.SCRUB_INTERVAL
+    return db.session.query(File.id, File.filepath, File.checksum).filter(
+        db.or_(File.checksum_verified_at.is_(None), File.checksum_verified_at < cutoff)
+    ).order_by(File.checksum_verified_at.asc().nullsfirst(), File.id).limit(limit).all()
+
+
+# 校验单个文件（只做存储读取，不访问数据库，可在工作线程中运行）
+def verify(storage, budget, row):
+    try:
+        actual = compute_checksum(storage, row.filepath, budget)
+    except Exception as e:
+        # 对象丢失或无法读取同样视为完整性问题
+        return row.id, None, f'读取失败: {e}'
+    if row.checksum and row.checksum != actual:
+        return row.id, actual, '校验和不一致'
+    return row.id, actual, None
+
+
+# 执行一轮巡检，返回统计结果
+def run_scrub_pass(max_files=None, job=None):
+    storage = get_storage()
+    budget = IoBudget(Config.SCRUB_BYTES_PER_SEC)
+    stats = {'verified': 0, 'baseline': 0, 'mismatch': 0}
+    started = time.time()
+
+    with ThreadPoolExecutor(max_workers=Config.SCRUB_WORKERS, thread_name_prefix='scrub') as pool:
+        while max_files is None or stats['verified'] < max_files:
+            limit = Config.SCRUB_BATCH_SIZE
+            if max_files is not None:
+                limit = min(limit, max_files - stats['verified'])
+            rows = due_files(limit)
+            if not rows:
+                break
+            known = {row.id: row for row in rows}
+            now = datetime.utcnow()
+            for file_id, actual, problem in pool.map(lambda row: verify(storage, budget, row), rows):
+                row = known[file_id]
+                values = {'checksum_verified_at': now}
+                if problem:
+                    values['checksum_mismatch'] = True
+                elif not row.checksum:
+                    values['checksum'] = actual
+                updated = db.session.query(File).filter(
+                    File.id == file_id, File.checksum == row.checksum, File.filepath == row.filepath
+                ).update(values, synchronize_session=False)
+                if not updated:
+                    continue
+                if problem:
+                    stats['mismatch'] += 1
+                    current_app.logger.warning(f"文件 {file_id} 完整性校验失败: {problem}")
+                elif not row.checksum:
+                    stats['baseline'] += 1
+                stats['verified'] += 1
+            db.session.commit()
+            if job:
+                job.progress = f"已校验 {stats['verified']} 个文件，不一致 {stats['mismatch']} 个"
+
+    stats['seconds'] = round(time.time() - started, 2)
+    return stats
+
+
+# 常驻巡检：每轮结束后休眠，适合作为独立进程运行（flask scrub --loop）
+def run_scrubber_forever():
+    while True:
+        stats = run_scrub_pass()
+        if stats['verified']:
+            current_app.logger.info(f"巡检完成: {stats}")
+        time.sleep(Config.SCRUB_IDLE_SECONDS)
@@ -0,0 +1,279 @@
+import os
+import sys
+import time
+import select
+import signal
+import socket
+import subprocess
+import click
+from app.config import BaseConfig, config
+
+# 生产环境 HTTP 服务（waitress）
+#
+# 单进程：直接在当前进程中预热并服务。
+# 多进程（SERVER_WORKERS > 1）：主进程不处理请求，只管理工作进程。每个工作进程是独立启动的解释器，
+# 各自创建应用、预热，再以 SO_REUSEPORT 绑定同一端口，由内核在进程间分配连接。
+#   SIGHUP          平滑重载：启动一组新工作进程（加载新代码与配置），全部就绪后让旧进程退出
+#   SIGTERM/SIGINT  平滑停止：工作进程停止接受新连接，处理完进行中的请求后退出（最多 SERVER_DRAIN_TIMEOUT 秒）
+# 工作进程意外退出时由主进程补充。
+
+READY = b'1'
+
+
+def load_config(name=None):
+    name = name or os.environ.get('APP_CONFIG')
+    if not name:
+        return BaseConfig
+    if name not in config:
+        raise click.BadParameter(f'未知的配置: {name}（可选: {", ".join(config)}）')
+    return config[name]
+
+
+# 服务参数：命令行未指定的取配置类中的默认值
+def server_options(config_class, **overrides):
+    options = {
+        'host': config_class.HOST,
+        'port': config_class.PORT,
+        'workers': config_class.SERVER_WORKERS,
+        'threads': config_class.SERVER_THREADS,
+        'connection_limit': config_class.SERVER_CONNECTION_LIMIT,
+        'backlog': config_class.SERVER_BACKLOG,
+        'channel_timeout': config_class.SERVER_CHANNEL_TIMEOUT,
+        'drain_timeout': config_class.SERVER_DRAIN_TIMEOUT,
+        'ready_timeout': config_class.SERVER_READY_TIMEOUT,
+    }
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    if options['workers'] > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+        print('当前平台不支持 SO_REUSEPORT，改为单进程运行')
+        options['workers'] = 1
+    return options
+
+
+# 在接受连接之前完成的初始化：建立数据库连接池（最多 threads 个连接）、编译模板、创建存储后端、启动密码哈希进程
+def warm_up(app, threads):
+    from app import db
+    from app.migrations import current_version, latest_version
+    from app.storage import get_storage
+    from app import passwords
+    with app.app_context():
+        pool = db.engine.pool
+        connections = max(1, min(threads, pool.size() if hasattr(pool, 'size') else 1))
+        conns = [db.engine.connect() for _ in range(connections)]
+        for conn in conns:
+            conn.exec_driver_sql('SELECT 1')
+        for conn in conns:
+            conn.close()  # 归还到连接池，保持打开
+        if current_version() < latest_version():
+            app.logger.warning('数据库结构版本过旧，请运行 flask --app run db-upgrade')
+        get_storage()
+    passwords.warm_up(app)
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    app.url_map.bind('localhost').match('/')
+
+
+def _listen_socket(host, port, backlog, reuse_port):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+# 工作进程：预热、监听、服务，收到 SIGTERM/SIGINT 后停止接受连接并等待进行中的请求完成
+def run_worker(config_name, options, ready_fd=None):
+    from waitress.server import create_server
+    from waitress.channel import HTTPChannel
+    from waitress import wasyncore
+    from app import create_app
+
+    app = create_app(load_config(config_name))
+    warm_up(app, options['threads'])
+
+    sock = _listen_socket(options['host'], options['port'], options['backlog'], options['workers'] > 1)
+    server = create_server(
+        app,
+        sockets=[sock],
+        threads=options['threads'],
+        connection_limit=options['connection_limit'],
+        backlog=options['backlog'],
+        channel_timeout=options['channel_timeout'],
+        asyncore_use_poll=True,  # select 只支持 1024 个文件描述符
+        ident='cloud-pan',
+    )
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)  # 重载由主进程处理
+
+    if ready_fd is not None:
+        os.write(ready_fd, READY)
+        os.close(ready_fd)
+    print(f'[{os.getpid()}] 开始服务 http://{options["host"]}:{options["port"]}，线程 {options["threads"]}')
+
+    socket_map = server._map
+    timeout = server.adj.asyncore_loop_timeout
+    while not stopping:
+        wasyncore.loop(timeout=timeout, map=socket_map, use_poll=True, count=1)
+
+    # 停止接受新连接（保留唤醒管道，工作线程完成请求时需要它唤醒事件循环）
+    # SO_REUSEPORT 下关闭监听套接字会重置其队列中尚未 accept 的连接，关闭前先把队列取空；
+    # Linux 5.14+ 可设置 sysctl net.ipv4.tcp_migrate_req=1 让内核把它们转给其他进程
+    while select.select([server.socket], [], [], 0)[0]:
+        server.handle_accept()
+    wasyncore.dispatcher.close(server)
+    deadline = time.monotonic() + options['drain_timeout']
+    while time.monotonic() < deadline:
+        channels = [c for c in socket_map.values() if isinstance(c, HTTPChannel)]
+        if not channels:
+            break
+        now = time.time()
+        for channel in channels:
+            # 空闲超过 1 秒的连接关闭（刚 accept 的连接可能还没读到请求），正在接收或处理的请求完成后再关闭
+            if channel.request is None and not channel.requests and not channel.total_outbufs_len \
+                    and now - channel.last_activity >= 1:
+                channel.will_close = True
+        wasyncore.loop(timeout=0.2, map=socket_map, use_poll=True, count=1)
+    server.task_dispatcher.shutdown(cancel_pending=True, timeout=1)
+    from app import passwords
+    passwords.shutdown()
+    print(f'[{os.getpid()}] 已停止')
+
+
+class Worker:
+    def __init__(self, config_name, options):
+        read_fd, write_fd = os.pipe()
+        args = [sys.executable, '-m', 'app.server', '--ready-fd', str(write_fd)]
+        if config_name:
+            args += ['--config', config_name]
+        for key in ('host', 'port', 'workers', 'threads', 'connection_limit', 'backlog',
+                    'channel_timeout', 'drain_timeout'):
+            args += [f'--{key.replace("_", "-")}', str(options[key])]
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.process = subprocess.Popen(args, pass_fds=(write_fd,), cwd=root)
+        os.close(write_fd)
+        self.ready_pipe = read_fd
+        self.ready = False
+        self.stopping = False
+
+    # 等待工作进程完成预热，超时或进程退出返回 False
+    def wait_ready(self, timeout):
+        readable, _, _ = select.select([self.ready_pipe], [], [], timeout)
+        self.ready = bool(readable) and os.read(self.ready_pipe, 1) == READY
+        os.close(self.ready_pipe)
+        return self.ready
+
+    def stop(self):
+        if not self.stopping and self.process.poll() is None:
+            self.stopping = True
+            self.process.send_signal(signal.SIGTERM)
+
+    def alive(self):
+        return self.process.poll() is None
+
+
+# 主进程：启动并看守工作进程，处理重载与停止信号
+class Master:
+    def __init__(self, config_name, options):
+        self.config_name = config_name
+        self.options = options
+        self.workers = []
+        self.signals = []
+
+    def spawn(self, count):
+        workers = [Worker(self.config_name, self.options) for _ in range(count)]
+        deadline = time.monotonic() + self.options['ready_timeout']
+        ready = [w for w in workers if w.wait_ready(max(0.0, deadline - time.monotonic()))]
+        for worker in workers:
+            if not worker.ready:
+                worker.stop()
+        return ready, workers
+
+    def stop_all(self, workers):
+        for worker in workers:
+            worker.stop()
+        deadline = time.monotonic() + self.options['drain_timeout'] + 5
+        for worker in workers:
+            try:
+                worker.process.wait(max(0.1, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+                worker.process.wait()
+
+    def reload(self):
+        print('收到 SIGHUP，启动新的工作进程')
+        ready, started = self.spawn(self.options['workers'])
+        if len(ready) < self.options['workers']:
+            # 新代码或配置无法启动时保留旧进程继续服务
+            print(f'新工作进程只有 {len(ready)}/{self.options["workers"]} 个就绪，放弃重载')
+            self.stop_all(started)
+            return
+        old, self.workers = self.workers, ready
+        self.stop_all(old)
+        print('重载完成')
+
+    def run(self):
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, lambda signum, frame: self.signals.append(signum))
+        self.workers, started = self.spawn(self.options['workers'])
+        if not self.workers:
+            self.stop_all(started)
+            raise click.ClickException('工作进程启动失败')
+        print(f'主进程 {os.getpid()}，工作进程 {[w.process.pid for w in self.workers]}')
+        while True:
+            if self.signals:
+                signum = self.signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.reload()
+                    continue
+                print('正在停止，等待进行中的请求完成')
+                self.stop_all(self.workers)
+                return
+            dead = [w for w in self.workers if not w.alive()]
+            if dead:
+                self.workers = [w for w in self.workers if w.alive()]
+                print(f'工作进程 {[w.process.pid for w in dead]} 意外退出，重新启动')
+                ready, started = self.spawn(len(dead))
+                self.workers += ready
+                if not ready:
+                    time.sleep(1)  # 避免启动失败时快速循环
+                    self.stop_all(started)
+            time.sleep(0.5)
+
+
+def serve(config_name=None, **overrides):
+    config_class = load_config(config_name)
+    options = server_options(config_class, **overrides)
+    if options['workers'] <= 1:
+        run_worker(config_name, options)
+        return
+    if config_class.SCHEMA_AUTO_UPGRADE:
+        # 自动升级只在主进程中执行一次，避免多个工作进程同时修改数据库结构
+        from app import create_app
+        create_app(config_class)
+    Master(config_name, options).run()
+
+
+# 工作进程入口（由主进程以 python -m app.server 启动）
+@click.command()
+@click.option('--config', 'config_name', default=None)
+@click.option('--ready-fd', type=int, default=None)
+@click.option('--host')
+@click.option('--port', type=int)
+@click.option('--workers', type=int)
+@click.option('--threads', type=int)
+@click.option('--connection-limit', type=int)
+@click.option('--backlog', type=int)
+@click.option('--channel-timeout', type=int)
+@click.option('--drain-timeout', type=int)
+def worker_main(config_name, ready_fd, **overrides):
+    options = server_options(load_config(config_name), **overrides)
+    run_worker(config_name, options, ready_fd)
+
+
+if __name__ == '__main__':
+    worker_main()
@@ -0,0 +1,95 @@
+from flask import send_file, abort, request, Response
+from werkzeug.http import http_date
+from app.storage import get_storage
+from app.throttle import throttle_response
+from app.filecache import hot_files, read_path
+
+# 统一的文件下载出口：支持 ETag / Last-Modified / Range
+# 所有下载（本人下载、分享链接下载）都走这里，便于后续统一优化
+# user_id 用于按用户限速，匿名下载（分享链接）只受全局限制
+def send_stored_file(key, download_name, public_max_age=None, user_id=None):
+    storage = get_storage()
+    try:
+        path = storage.local_path(key)
+    except ValueError:
+        abort(404)
+
+    # 热点小文件直接从内存发送
+    entry = None
+    if hot_files.enabled:
+        entry = hot_files.fetch(key, lambda: storage.stat(key),
+                                lambda: read_path(path) if path else b''.join(storage.iter_range(key)))
+    if entry is not None:
+        response = send_cached(entry, download_name, public_max_age)
+    elif path is not None:
+        # 本地文件交给 Werkzeug 的文件包装器发送（服务器支持时为零拷贝）
+        try:
+            response = send_file(path, as_attachment=True, download_name=download_name,
+                                 conditional=True, max_age=public_max_age)
+        except FileNotFoundError:
+            abort(404)
+    else:
+        response = _stream_object(storage, key, download_name, public_max_age)
+
+    if public_max_age:
+        # 公开分享的热门文件允许浏览器和反向代理缓存
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    return throttle_response(response, user_id)
+
+# 用缓存的内容和预先生成的响应头构造响应，条件请求与范围请求由 Werkzeug 处理
+# download_name 为空时不设置 Content-Disposition（如头像直接在页面中显示）
+def send_cached(entry, download_name=None, max_age=None):
+    response = Response(entry.data, headers=entry.headers)
+    if download_name:
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    if max_age:
+        response.cache_control.max_age = max_age
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(entry.data))
+
+# 远程对象存储：按请求的范围从存储端流式读取，不在内存中缓冲整个对象
+def _stream_object(storage, key, download_name, max_age):
+    obj = storage.stat(key)
+    if obj is None:
+        abort(404)
+
+    response = Response(mimetype='application/octet-stream', direct_passthrough=True)
+    response.set_etag(obj.etag)
+    response.headers['Last-Modified'] = http_date(obj.mtime)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    if max_age:
+        response.cache_control.max_age = max_age
+
+    # 协商缓存命中
+    if request.if_none_match and request.if_none_match.contains(obj.etag):
+        response.status_code = 304
+        return response
+
+    byte_range = resolve_range(response, obj.size, obj.etag)
+    if byte_range is None:
+        return response
+    start, end = byte_range
+    response.content_length = end - start + 1
+    if request.method != 'HEAD' and obj.size:
+        response.response = storage.iter_range(key, start, end)
+    return response
+
+# 按请求的 Range（只支持单个范围）确定要发送的字节区间 (start, end)，包含两端
+# 命中范围时设置 206 和 Content-Range；范围无效时设置 416 并返回 None；If-Range 不匹配时发送完整内容
+def resolve_range(response, size, etag):
+    start, end = 0, size - 1
+    byte_range = request.range
+    if_range = request.if_range
+    range_valid = (if_range.etag is None and if_range.date is None) or if_range.etag == etag
+    if byte_range and range_valid and len(byte_range.ranges) == 1:
+        content_range = byte_range.make_content_range(size)
+        if content_range is None:
+            response.status_code = 416
+            response.headers['Content-Range'] = f'bytes */{size}'
+            return None
+        start, end = content_range.start, content_range.stop - 1
+        response.status_code = 206
+        response.content_range = content_range
+    return start, end
@@ -0,0 +1,131 @@
+import time
+import threading
+import calendar
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+from app import db
+from app.models import ShareLink, File, Folder
+from app.config import BaseConfig as Config
+from app.storage import get_storage
+from app.trash import folder_in_trash, file_in_trash
+
+# 分享令牌
+#
+# 令牌载荷（短键名以缩短链接）:
+#   s: 分享ID  u: 所有者ID  e: 过期时间戳(0为永不过期)
+#   t: 'f' 文件 / 'd' 文件夹  i: 目标ID
+#   文件: p 存储键, n 文件名, tag 创建分享时的存储标识, c 文件上传时间戳（防止ID或路径被新文件复用）
+#   文件夹: c 文件夹创建时间戳（防止ID被复用）
+#   pw: 是否需要密码  lim: 是否限制下载次数
+# 不带密码和次数限制的分享只需校验签名、过期时间和内存中的撤销列表，不查询数据库。
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='share-link')
+
+def _timestamp(dt):
+    return calendar.timegm(dt.utctimetuple()) if dt else 0
+
+def make_token(share):
+    payload = {
+        's': share.id,
+        'u': share.user_id,
+        'e': _timestamp(share.expires_at),
+    }
+    if share.file_id:
+        file = share.file
+        obj = get_storage().stat(file.filepath)
+        if obj is None:
+            raise OSError(f'文件 "{file.filename}" 在存储中不存在')
+        payload.update(t='f', i=file.id, p=file.filepath, n=file.filename, tag=obj.etag,
+                       c=_timestamp(file.upload_time))
+    else:
+        payload.update(t='d', i=share.folder_id, c=_timestamp(share.folder.created_time))
+    if share.password_hash:
+        payload['pw'] = 1
+    if share.max_downloads:
+        payload['lim'] = 1
+    return _serializer().dumps(payload)
+
+# 校验令牌，返回载荷；签名错误、已过期或已撤销时返回 None
+def load_token(token):
+    try:
+        payload = _serializer().loads(token)
+    except BadSignature:
+        return None
+    if payload['e'] and payload['e'] < time.time():
+        return None
+    if revocations.is_revoked(payload['s']):
+        return None
+    return payload
+
+
+# 撤销列表：只缓存未过期的已撤销分享ID，按TTL定期刷新（每个进程每个周期一次查询）
+class RevocationCache:
+    def __init__(self):
+        self._ids = frozenset()
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def is_revoked(self, share_id):
+        if time.time() - self._loaded_at > Config.SHARE_REVOCATION_TTL:
+            self.refresh()
+        return share_id in self._ids
+
+    def refresh(self):
+        with self._lock:
+            if time.time() - self._loaded_at <= Config.SHARE_REVOCATION_TTL:
+                return
+            from datetime import datetime
+            rows = db.session.query(ShareLink.id).filter(
+                ShareLink.revoked.is_(True),
+                db.or_(ShareLink.expires_at.is_(None), ShareLink.expires_at > datetime.utcnow())
+            ).all()
+            self._ids = frozenset(row[0] for row in rows)
+            self._loaded_at = time.time()
+
+    # 本进程撤销后立即生效，其他进程在TTL内生效
+    def add(self, share_id):
+        self._ids = self._ids | {share_id}
+
+revocations = RevocationCache()
+
+
+# 解析文件分享的存储键；快速路径只做一次 stat
+def resolve_shared_file(payload):
+    obj = get_storage().stat(payload['p'])
+    if obj is not None and obj.etag == payload['tag']:
+        return payload['p'], payload['n']
+    # 文件被重命名或内容被更新过：按ID回查数据库，并以上传时间确认仍是同一个文件
+    file = File.query.filter_by(id=payload['i'], user_id=payload['u']).first()
+    if not file or _timestamp(file.upload_time) != payload['c'] or file_in_trash(file):
+        return None, None
+    return file.filepath, file.filename
+
+# 获取文件夹分享的根文件夹
+def resolve_shared_folder(payload):
+    folder = Folder.query.filter_by(id=payload['i'], user_id=payload['u']).first()
+    if not folder or _timestamp(folder.created_time) != payload['c'] or folder_in_trash(folder):
+        return None
+    return folder
+
+# 判断文件夹是否位于分享根文件夹之内
+def folder_in_share(folder, root):
+    current = folder
+    while current:
+        if current.id == root.id:
+            return True
+        current = current.parent
+    return False
+
+# 原子地占用一次下载次数，超出上限返回 False
+def consume_download(share_id):
+    result = db.session.execute(
+        db.update(ShareLink)
+        .where(ShareLink.id == share_id,
+               ShareLink.revoked.is_(False),
+               db.or_(ShareLink.max_downloads.is_(None),
+                      ShareLink.download_count < ShareLink.max_downloads))
+        .values(download_count=ShareLink.download_count + 1)
+    )
+    db.session.commit()
+    return result.rowcount == 1
@@ -0,0 +1,81 @@
+// 文件列表：共用的重命名、分享、删除、移动/复制模态框从按钮所在行读取条目
+(function() {
+    const urls = JSON.parse(document.currentScript.dataset.urls);
+
+    // 打开共用模态框时，从按钮所在行读取条目类型、ID 和名称
+    function rowOf(e) {
+        const tr = e.relatedTarget.closest('tr');
+        return {
+            entity: tr.dataset.entity,
+            id: tr.dataset.id,
+            name: tr.querySelector('.item-name').textContent
+        };
+    }
+
+    document.getElementById('renameModal').addEventListener('show.bs.modal', function(e) {
+        const row = rowOf(e);
+        document.getElementById('renameForm').action = urls['rename_' + row.entity] + row.id;
+        document.getElementById('new_name').value = row.name;
+    });
+
+    document.getElementById('shareModal').addEventListener('show.bs.modal', function(e) {
+        const row = rowOf(e);
+        document.getElementById('shareName').textContent = row.name;
+        document.getElementById('shareFileId').value = row.entity === 'file' ? row.id : '';
+        document.getElementById('shareFolderId').value = row.entity === 'folder' ? row.id : '';
+    });
+
+    document.getElementById('deleteModal').addEventListener('show.bs.modal', function(e) {
+        const row = rowOf(e);
+        document.getElementById('deleteForm').action = urls['delete_' + row.entity] + row.id;
+        document.getElementById('deleteName').textContent = row.name;
+        document.getElementById('deleteKind').textContent = row.entity === 'folder' ? '文件夹' : '文件';
+        document.getElementById('deleteHint').textContent = row.entity === 'folder'
+            ? '该文件夹及其所有内容将移入回收站，' : '文件将移入回收站，';
+    });
+
+    // 目标文件夹选择：每进入一级才读取该文件夹的子文件夹
+    let pickerParent = null;
+
+    function openPicker(folderId) {
+        const query = folderId === null ? '' : '?folder_id=' + folderId;
+        fetch(urls.folder_picker + query, {credentials: 'same-origin'})
+            .then(function(response) { return response.ok ? response.json() : Promise.reject(response.status); })
+            .then(function(data) {
+                document.getElementById('target_folder_id').value = data.id === null ? '' : data.id;
+                document.getElementById('pickerPath').textContent = data.path.length
+                    ? '我的文件 / ' + data.path.map(function(p) { return p.name; }).join(' / ')
+                    : '我的文件（根目录）';
+                pickerParent = data.path.length > 1 ? data.path[data.path.length - 2].id : null;
+                document.getElementById('pickerUp').disabled = data.id === null;
+                const list = document.getElementById('pickerFolders');
+                list.replaceChildren();
+                data.folders.forEach(function(folder) {
+                    const item = document.createElement('button');
+                    item.type = 'button';
+                    item.className = 'list-group-item list-group-item-action';
+                    item.textContent = folder.name;
+                    item.addEventListener('click', function() { openPicker(folder.id); });
+                    list.appendChild(item);
+                });
+            })
+            .catch(function() {
+                // 文件夹已被删除或移走时回到根目录
+                if (folderId !== null) {
+                    openPicker(null);
+                }
+            });
+    }
+
+    document.getElementById('pickerUp').addEventListener('click', function() {
+        openPicker(pickerParent);
+    });
+
+    document.getElementById('moveCopyModal').addEventListener('show.bs.modal', function(e) {
+        const row = rowOf(e);
+        document.getElementById('moveCopyName').textContent = row.name;
+        document.getElementById('moveButton').formAction = urls['move_' + row.entity] + row.id;
+        document.getElementById('copyButton').formAction = urls['copy_' + row.entity] + row.id;
+        openPicker(null);
+    });
+})();
@@ -0,0 +1,58 @@
+// 订阅当前文件夹的变更推送，只增量更新受影响的行
+(function() {
+    const data = document.currentScript.dataset;
+    const currentId = data.folderId ? Number(data.folderId) : null;
+    const source = new EventSource(data.pushUrl + "/push/folders/" + (data.folderId || 'root'), {withCredentials: true});
+    const rows = document.getElementById('contentRows');
+
+    function findRow(entity, id) {
+        return document.querySelector('tr[data-entity="' + entity + '"][data-id="' + id + '"]');
+    }
+
+    function addRow(change) {
+        if (!rows) {
+            location.reload();
+            return;
+        }
+        const tr = document.createElement('tr');
+        tr.dataset.entity = change.entity;
+        tr.dataset.id = change.id;
+        const name = document.createElement(change.entity === 'folder' ? 'a' : 'span');
+        name.className = 'item-name';
+        name.textContent = change.name;
+        if (change.entity === 'folder') {
+            name.href = data.listUrl + "/" + change.id;
+        }
+        const nameCell = document.createElement('td');
+        nameCell.innerHTML = '<i class="bi bi-' + (change.entity === 'folder' ? 'folder' : 'file-earmark') + '"></i> ';
+        nameCell.appendChild(name);
+        tr.appendChild(nameCell);
+        tr.insertAdjacentHTML('beforeend', '<td>' + (change.entity === 'folder' ? '文件夹' : '文件') +
+            '</td><td>-</td><td>刚刚</td><td><a href="" class="btn btn-sm btn-outline-secondary">刷新以操作</a></td>');
+        rows.appendChild(tr);
+    }
+
+    source.addEventListener('change', function(e) {
+        const change = JSON.parse(e.data);
+        // 当前查看的文件夹本身被删除或移走
+        if (change.entity === 'folder' && change.id === currentId) {
+            if (change.action === 'delete' || change.action === 'move') {
+                location.href = data.listUrl;
+            }
+            return;
+        }
+        const row = findRow(change.entity, change.id);
+        const here = change.parent_id === currentId;
+        if (change.action === 'delete' || (change.action === 'move' && !here)) {
+            if (row) row.remove();
+        } else if (row) {
+            row.querySelector('.item-name').textContent = change.name;
+        } else if (here) {
+            addRow(change);
+        }
+    });
+
+    source.addEventListener('reset', function() {
+        location.reload();
+    });
+})();
@@ -0,0 +1,50 @@
+import threading
+from app.config import BaseConfig as Config
+from app.storage.base import StorageBackend, StoredObject, HashingReader
+
+_backend = None
+_lock = threading.Lock()
+
+# 获取当前配置的存储后端（进程内单例）
+def get_storage():
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                backend = create_storage(Config)
+                if Config.HOT_CACHE_MAX_BYTES > 0:
+                    # 启用热点文件缓存时，经由存储后端的修改同时使缓存失效
+                    from app.filecache import CacheInvalidatingStorage, hot_files
+                    backend = CacheInvalidatingStorage(backend, hot_files)
+                _backend = backend
+    return _backend
+
+def create_storage(config):
+    if config.STORAGE_BACKEND == 's3':
+        from app.storage.s3 import S3Storage
+        return S3Storage(
+            bucket=config.STORAGE_S3_BUCKET,
+            endpoint_url=config.STORAGE_S3_ENDPOINT,
+            access_key=config.STORAGE_S3_ACCESS_KEY,
+            secret_key=config.STORAGE_S3_SECRET_KEY,
+            region=config.STORAGE_S3_REGION,
+            prefix=config.STORAGE_S3_PREFIX
+        )
+    from app.storage.local import LocalStorage
+    return LocalStorage(config.UPLOAD_FOLDER, copy_mode=config.STORAGE_LOCAL_COPY_MODE)
+
+# 文件的存储键: <用户ID>/[<文件夹ID>/]<文件名>
+def storage_key(user_id, folder_id, filename):
+    if not filename or '/' in filename or '\\' in filename or filename in ('.', '..'):
+        raise ValueError(f'非法的文件名: {filename}')
+    if folder_id:
+        return f'{user_id}/{folder_id}/{filename}'
+    return f'{user_id}/{filename}'
+
+# 文件夹对应的键前缀
+def folder_prefix(user_id, folder_id):
+    return f'{user_id}/{folder_id}/'
+
+# 回收站中单个文件的键: <用户ID>/.trash/<文件ID>（腾出原文件名，且不会与以数字命名的文件夹前缀冲突）
+def trash_key(user_id, file_id):
+    return f'{user_id}/.trash/{file_id}'
@@ -0,0 +1,99 @@
+import os
+import hashlib
+from collections import namedtuple
+
+# 存储对象的元信息：大小、修改时间（Unix 时间戳）、内容标识
+StoredObject = namedtuple('StoredObject', ['size', 'mtime', 'etag'])
+
+CHUNK_SIZE = 256 * 1024
+
+
+# 包装可读流，在写入存储的同时计算校验和（不额外读取文件）
+class HashingReader:
+    def __init__(self, stream, algorithm='sha256'):
+        self.stream = stream
+        self.hash = hashlib.new(algorithm)
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.hash.update(data)
+        return data
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+# 存储后端接口
+#
+# 键（key）是以 "/" 分隔的相对路径，如 "<用户ID>/<文件夹ID>/<文件名>"。
+# 所有读写都以流的方式进行，不把整个文件读入内存。
+class StorageBackend:
+    # 从可读流写入对象，返回写入的字节数
+    def put(self, key, stream):
+        raise NotImplementedError
+
+    # 把本地临时文件写入为对象（调用后临时文件归存储所有，可能被移走）
+    # 默认实现流式复制；与临时文件位于同一文件系统的后端可覆盖为直接改名
+    def put_file(self, key, path):
+        try:
+            with open(path, 'rb') as f:
+                return self.put(key, f)
+        finally:
+            os.remove(path)
+
+    # 存放上传临时文件的目录，None 表示使用系统临时目录
+    def spool_dir(self):
+        return None
+
+    # 打开对象用于顺序读取
+    def open(self, key):
+        raise NotImplementedError
+
+    # 按块读取 [start, end] 闭区间（end 为 None 表示到结尾）
+    def iter_range(self, key, start=0, end=None, chunk_size=CHUNK_SIZE):
+        raise NotImplementedError
+
+    # 对象不存在时返回 None
+    def stat(self, key):
+        raise NotImplementedError
+
+    def exists(self, key):
+        return self.stat(key) is not None
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    # 删除某个前缀下的所有对象（相当于删除目录）
+    def delete_prefix(self, prefix):
+        raise NotImplementedError
+
+    # 重命名对象；目标已存在时抛出 FileExistsError，不覆盖
+    def rename(self, src, dst):
+        raise NotImplementedError
+
+    # 复制对象；默认实现经由本进程流式读写，后端应尽量覆盖为服务端/内核内复制
+    def copy(self, src, dst):
+        with self.open(src) as f:
+            self.put(dst, f)
+
+    # 列出某个前缀下的所有对象，按键排序，产生 (key, StoredObject)
+    def list(self, prefix=''):
+        raise NotImplementedError
+
+    # 对象在本地磁盘上的路径；不在本地时返回 None（调用方据此选择零拷贝等本地优化）
+    def local_path(self, key):
+        return None
+
+    # 分片上传
+    def create_multipart(self, key):
+        raise NotImplementedError
+
+    def upload_part(self, key, upload_id, part_number, stream):
+        raise NotImplementedError
+
+    # 按分片序号合并，返回对象大小
+    def complete_multipart(self, key, upload_id):
+        raise NotImplementedError
+
+    def abort_multipart(self, key, upload_id):
+        raise NotImplementedError
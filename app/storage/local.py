@@ -0,0 +1,212 @@
+import os
+import shutil
+import uuid
+from app.storage.base import StorageBackend, StoredObject, CHUNK_SIZE
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+MULTIPART_DIR = '.multipart'
+
+# Linux ioctl FICLONE：在 Btrfs / XFS 等文件系统上共享数据块（写时复制）
+FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        return False
+
+# 在内核中复制数据（copy_file_range），不经过 Python 缓冲区；不支持时退回普通复制
+def _copy_range(src, dst):
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while os.copy_file_range(src.fileno(), dst.fileno(), 1 << 30):
+                pass
+            return
+        except OSError:
+            src.seek(0)
+            dst.seek(0)
+            dst.truncate()
+    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+# 本地磁盘存储：键映射为根目录下的相对路径
+class LocalStorage(StorageBackend):
+    def __init__(self, root, copy_mode='clone'):
+        self.root = os.path.abspath(root)
+        self.copy_mode = copy_mode
+
+    # 键转换为绝对路径，拒绝越出根目录的键
+    # 兼容旧数据：File.filepath 曾保存根目录内的绝对路径
+    def _path(self, key):
+        path = os.path.abspath(key if os.path.isabs(key) else os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root or path == self.root:
+            raise ValueError(f'非法的存储键: {key}')
+        return path
+
+    def local_path(self, key):
+        return self._path(key)
+
+    # 先写入同目录下的临时文件再原子替换，避免读到写了一半的文件
+    def put(self, key, stream):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.part'
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return size
+
+    # 临时文件与存储位于同一目录树时直接原子改名，不再复制一遍
+    def put_file(self, key, path):
+        dst = self._path(key)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        try:
+            os.replace(path, dst)
+        except OSError:
+            return super().put_file(key, path)
+        return os.path.getsize(dst)
+
+    # 临时文件放在根目录下的 .multipart/（list / fsck 不会扫描到）
+    def spool_dir(self):
+        path = os.path.join(self.root, MULTIPART_DIR, 'spool')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def open(self, key):
+        return open(self._path(key), 'rb')
+
+    def iter_range(self, key, start=0, end=None, chunk_size=CHUNK_SIZE):
+        with open(self._path(key), 'rb') as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def stat(self, key):
+        try:
+            st = os.stat(self._path(key))
+        except (OSError, ValueError):
+            return None
+        return StoredObject(st.st_size, st.st_mtime, f'{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}')
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_prefix(self, prefix):
+        path = self._path(prefix.rstrip('/'))
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+
+    # os.rename 会静默替换已存在的目标：先建硬链接再删除源文件，目标已存在时建链接失败，检查与占用是一个原子操作；
+    # 文件系统不支持硬链接时退回先检查再重命名
+    def rename(self, src, dst):
+        src_path, dst_path = self._path(src), self._path(dst)
+        if src_path == dst_path:
+            return
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        try:
+            os.link(src_path, dst_path)
+        except FileExistsError:
+            raise FileExistsError(f'目标已存在: {dst}')
+        except OSError:
+            if os.path.lexists(dst_path):
+                raise FileExistsError(f'目标已存在: {dst}')
+            os.rename(src_path, dst_path)
+            return
+        os.remove(src_path)
+
+    # 复制优先使用硬链接（copy_mode='hardlink'）或 reflink，再退回 copy_file_range
+    # 所有写入都是写临时文件后原子替换，从不原地修改，因此硬链接共享的数据不会被改写
+    def copy(self, src, dst):
+        src_path, dst_path = self._path(src), self._path(dst)
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        if self.copy_mode == 'hardlink':
+            try:
+                os.link(src_path, dst_path)
+                return
+            except OSError:
+                pass  # 目标已存在、跨设备或文件系统不支持时退回复制
+        tmp_path = f'{dst_path}.{uuid.uuid4().hex}.part'
+        try:
+            with open(src_path, 'rb') as fsrc, open(tmp_path, 'wb') as fdst:
+                if not _reflink(fsrc, fdst):
+                    _copy_range(fsrc, fdst)
+            os.replace(tmp_path, dst_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def list(self, prefix=''):
+        base = self._path(prefix.rstrip('/')) if prefix else self.root
+        if not os.path.isdir(base):
+            return
+        for dirpath, dirnames, filenames in os.walk(base):
+            dirnames[:] = sorted(d for d in dirnames if d != MULTIPART_DIR)
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                obj = self.stat(key)
+                if obj:
+                    yield key, obj
+
+    # 分片先写入根目录下的 .multipart/<upload_id>/，合并时顺序拼接
+    def _part_dir(self, upload_id):
+        if not upload_id.isalnum():
+            raise ValueError(f'非法的分片上传ID: {upload_id}')
+        return os.path.join(self.root, MULTIPART_DIR, upload_id)
+
+    def create_multipart(self, key):
+        self._path(key)
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._part_dir(upload_id))
+        return upload_id
+
+    def upload_part(self, key, upload_id, part_number, stream):
+        part_path = os.path.join(self._part_dir(upload_id), f'{int(part_number):05d}')
+        with open(part_path, 'wb') as f:
+            shutil.copyfileobj(stream, f, CHUNK_SIZE)
+        return str(part_number)
+
+    def complete_multipart(self, key, upload_id):
+        part_dir = self._part_dir(upload_id)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = os.path.join(part_dir, 'assembled')
+        with open(tmp_path, 'wb') as out:
+            for name in sorted(n for n in os.listdir(part_dir) if n.isdigit()):
+                with open(os.path.join(part_dir, name), 'rb') as part:
+                    shutil.copyfileobj(part, out, CHUNK_SIZE)
+        os.replace(tmp_path, path)
+        shutil.rmtree(part_dir, ignore_errors=True)
+        return os.path.getsize(path)
+
+    def abort_multipart(self, key, upload_id):
+        shutil.rmtree(self._part_dir(upload_id), ignore_errors=True)
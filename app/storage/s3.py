@@ -0,0 +1,123 @@
+from app.storage.base import StorageBackend, StoredObject, CHUNK_SIZE
+
+
+# S3 兼容对象存储（AWS S3、MinIO 等），依赖 boto3
+class S3Storage(StorageBackend):
+    def __init__(self, bucket, endpoint_url=None, access_key=None, secret_key=None,
+                 region=None, prefix=''):
+        try:
+            import boto3
+            from botocore.config import Config as BotoConfig
+        except ImportError:
+            raise RuntimeError('使用 S3 存储需要安装 boto3: pip install boto3')
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region,
+            config=BotoConfig(signature_version='s3v4', s3={'addressing_style': 'path'})
+        )
+
+    def _key(self, key):
+        return self.prefix + key.lstrip('/')
+
+    # upload_fileobj 对大文件自动使用分片上传，内存占用固定
+    def put(self, key, stream):
+        counter = _CountingReader(stream)
+        self.client.upload_fileobj(counter, self.bucket, self._key(key))
+        return counter.count
+
+    def open(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+
+    # 使用 Range 请求只拉取需要的部分，边读边返回
+    def iter_range(self, key, start=0, end=None, chunk_size=CHUNK_SIZE):
+        # 读取整个对象时不带 Range：对空对象发送 bytes=0- 会被 S3 以 InvalidRange 拒绝
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if start or end is not None:
+            params['Range'] = f'bytes={start}-{"" if end is None else end}'
+        body = self.client.get_object(**params)['Body']
+        try:
+            for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def stat(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return StoredObject(head['ContentLength'], head['LastModified'].timestamp(), head['ETag'].strip('"'))
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    # 分页列出并按每批 1000 个删除
+    def delete_prefix(self, prefix):
+        batch = []
+        for key, _ in self.list(prefix.rstrip('/') + '/'):
+            batch.append({'Key': self._key(key)})
+            if len(batch) == 1000:
+                self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': batch, 'Quiet': True})
+                batch = []
+        if batch:
+            self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': batch, 'Quiet': True})
+
+    # 对象存储没有重命名：服务端复制（大对象自动分片复制）后删除源对象；目标已存在时不覆盖
+    def rename(self, src, dst):
+        if self._key(src) == self._key(dst):
+            return
+        if self.stat(dst) is not None:
+            raise FileExistsError(f'目标已存在: {dst}')
+        self.copy(src, dst)
+        self.delete(src)
+
+    # 服务端复制，数据不经过本进程（大对象由 boto3 自动分片复制）
+    def copy(self, src, dst):
+        self.client.copy({'Bucket': self.bucket, 'Key': self._key(src)}, self.bucket, self._key(dst))
+
+    def list(self, prefix=''):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for item in page.get('Contents', []):
+                key = item['Key'][len(self.prefix):]
+                yield key, StoredObject(item['Size'], item['LastModified'].timestamp(), item['ETag'].strip('"'))
+
+    def create_multipart(self, key):
+        return self.client.create_multipart_upload(Bucket=self.bucket, Key=self._key(key))['UploadId']
+
+    def upload_part(self, key, upload_id, part_number, stream):
+        result = self.client.upload_part(Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+                                         PartNumber=int(part_number), Body=stream.read())
+        return result['ETag']
+
+    def complete_multipart(self, key, upload_id):
+        parts = []
+        paginator = self.client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=self.bucket, Key=self._key(key), UploadId=upload_id):
+            parts.extend({'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in page.get('Parts', []))
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+                                              MultipartUpload={'Parts': parts})
+        return self.stat(key).size
+
+    def abort_multipart(self, key, upload_id):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(key), UploadId=upload_id)
+
+
+# 统计经过的字节数
+class _CountingReader:
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.count += len(data)
+        return data
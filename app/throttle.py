@@ -0,0 +1,263 @@
+import os
+import math
+import time
+import uuid
+import sqlite3
+import threading
+from flask import request
+from werkzeug.exceptions import TooManyRequests
+from app.config import BaseConfig as Config
+
+# 传输限速与并发限制
+#
+# 字节速率使用令牌桶（允许透支：先扣减令牌，调用方按返回的等待时间休眠），
+# 并发数使用带持有者标识的槽位。状态保存在存储中：
+#   MemoryStore  单进程内多线程共享
+#   SqliteStore  同一主机上的多个进程共享（THROTTLE_STORE 指定数据库文件路径）
+
+
+class TransferThrottled(TooManyRequests):
+    description = '传输请求过多，请稍后重试'
+
+
+class MemoryStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, updated)
+        self._slots = {}  # key -> set(holder)
+
+    def take(self, key, amount, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate) - amount
+            self._buckets[key] = (tokens, now)
+        return max(0.0, -tokens / rate)
+
+    def acquire(self, key, limit, holder):
+        with self._lock:
+            holders = self._slots.setdefault(key, set())
+            if len(holders) >= limit:
+                return False
+            holders.add(holder)
+            return True
+
+    def release(self, key, holder):
+        with self._lock:
+            self._slots.get(key, set()).discard(holder)
+
+
+class SqliteStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS slot (key TEXT, holder TEXT PRIMARY KEY, pid INTEGER)')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_slot_key ON slot (key)')
+
+    # 每个线程一个连接，自动提交模式下手动控制事务
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, amount, rate, burst):
+        now = time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate) - amount
+            conn.execute('INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return max(0.0, -tokens / rate)
+
+    def acquire(self, key, limit, holder):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            pids = [row[0] for row in conn.execute('SELECT pid FROM slot WHERE key = ?', (key,))]
+            # 清理已退出进程遗留的槽位
+            dead = [pid for pid in set(pids) if not _pid_alive(pid)]
+            if dead:
+                conn.executemany('DELETE FROM slot WHERE pid = ?', [(pid,) for pid in dead])
+                pids = [pid for pid in pids if pid not in dead]
+            if len(pids) >= limit:
+                conn.execute('ROLLBACK')
+                return False
+            conn.execute('INSERT INTO slot (key, holder, pid) VALUES (?, ?, ?)', (key, holder, os.getpid()))
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def release(self, key, holder):
+        self._conn().execute('DELETE FROM slot WHERE holder = ?', (holder,))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SqliteStore(Config.THROTTLE_STORE) if Config.THROTTLE_STORE else MemoryStore()
+    return _store
+
+
+# 各类传输的限额: (每用户速率, 每用户突发, 全局速率, 全局突发, 每用户并发, 全局并发)
+# 数据导出单独计数：不占用普通下载的槽位和令牌，全局限额较低，长时间的导出不会挤占交互请求
+def _limits(direction):
+    if direction == 'export':
+        return (Config.EXPORT_USER_BYTES_PER_SEC, Config.EXPORT_USER_BURST_BYTES,
+                Config.EXPORT_GLOBAL_BYTES_PER_SEC, Config.EXPORT_GLOBAL_BURST_BYTES,
+                Config.EXPORT_USER_CONCURRENCY, Config.EXPORT_GLOBAL_CONCURRENCY)
+    return (Config.THROTTLE_USER_BYTES_PER_SEC, Config.THROTTLE_USER_BURST_BYTES,
+            Config.THROTTLE_GLOBAL_BYTES_PER_SEC, Config.THROTTLE_GLOBAL_BURST_BYTES,
+            Config.THROTTLE_USER_CONCURRENCY, Config.THROTTLE_GLOBAL_CONCURRENCY)
+
+
+# 一次传输（一个下载响应、一个上传请求或一次导出）的限速租约
+class TransferLease:
+    def __init__(self, user_id, direction):
+        self.direction = direction
+        self.holder = uuid.uuid4().hex
+        self.store = get_store()
+        user_rate, user_burst, global_rate, global_burst, user_concurrency, global_concurrency = _limits(direction)
+        self.buckets = []  # (key, rate, burst)
+        self.slots = []  # key
+        if user_id is not None and user_rate:
+            self.buckets.append((f'user:{user_id}:{direction}', user_rate, user_burst))
+        if global_rate:
+            self.buckets.append((f'global:{direction}', global_rate, global_burst))
+        self.limits = []  # (key, limit)
+        if user_id is not None and user_concurrency:
+            self.limits.append((f'user:{user_id}:{direction}', user_concurrency))
+        if global_concurrency:
+            self.limits.append((f'global:{direction}', global_concurrency))
+        self._pending = 0
+
+    # 是否配置了任何限制
+    @property
+    def enabled(self):
+        return bool(self.buckets or self.limits)
+
+    # 占用并发槽位并检查速率透支，超限时抛出 429
+    def acquire(self):
+        for key, limit in self.limits:
+            if not self.store.acquire(key, limit, self.holder + key):
+                self.release()
+                raise TransferThrottled(retry_after=Config.THROTTLE_RETRY_AFTER)
+            self.slots.append(key)
+
+        # 透支过多（等待时间超过上限）时直接拒绝，而不是长时间挂起连接
+        wait = max([self.store.take(key, 0, rate, burst) for key, rate, burst in self.buckets] or [0])
+        if wait > Config.THROTTLE_MAX_WAIT:
+            self.release()
+            raise TransferThrottled(retry_after=math.ceil(wait))
+        return self
+
+    # 记录传输的字节数，返回需要等待的秒数（小块先累积，减少对共享存储的访问）
+    # 异步传输服务用它配合 asyncio.sleep，不阻塞事件循环
+    def charge(self, nbytes):
+        if not self.buckets:
+            return 0
+        self._pending += nbytes
+        if self._pending < Config.THROTTLE_CHUNK_SIZE:
+            return 0
+        amount, self._pending = self._pending, 0
+        return max(self.store.take(key, amount, rate, burst) for key, rate, burst in self.buckets)
+
+    # 记录传输的字节数，按需休眠
+    def consume(self, nbytes):
+        wait = self.charge(nbytes)
+        if wait > 0:
+            time.sleep(wait)
+
+    def release(self):
+        for key in self.slots:
+            self.store.release(key, self.holder + key)
+        self.slots = []
+
+
+# 包装响应体迭代器：每个数据块都经过限速，响应关闭时释放并发槽位
+class ThrottledBody:
+    def __init__(self, iterable, lease):
+        self.iterable = iterable
+        self.lease = lease
+
+    def __iter__(self):
+        for chunk in self.iterable:
+            self.lease.consume(len(chunk))
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.iterable, 'close'):
+                self.iterable.close()
+        finally:
+            self.lease.release()
+
+
+# 包装请求体输入流：按读取的字节数限速
+class ThrottledReader:
+    def __init__(self, stream, lease):
+        self.stream = stream
+        self.lease = lease
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.lease.consume(len(data))
+        return data
+
+    def readline(self, size=-1):
+        data = self.stream.readline(size)
+        self.lease.consume(len(data))
+        return data
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+# 为上传请求的输入流加上限速，必须在读取表单之前调用；返回租约，请求结束时释放
+def throttle_request_body(environ, user_id):
+    lease = TransferLease(user_id, 'upload')
+    if not lease.enabled:
+        return None
+    lease.acquire()
+    environ['wsgi.input'] = ThrottledReader(environ['wsgi.input'], lease)
+    return lease
+
+
+# 为下载响应加上限速（未配置任何限制、或响应没有要发送的内容时原样返回）
+def throttle_response(response, user_id, direction='download'):
+    if request.method == 'HEAD' or response.status_code in (304, 416):
+        return response
+    lease = TransferLease(user_id, direction)
+    if not lease.enabled:
+        return response
+    lease.acquire()
+    response.response = ThrottledBody(response.response, lease)
+    return response
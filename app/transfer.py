@@ -0,0 +1,372 @@
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+import tempfile
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.http import parse_range_header, parse_etags, http_date, quote_etag
+from werkzeug.datastructures import ContentRange, Headers
+from app.asgi import AsgiApp, send_response, wait_disconnect
+from app.config import BaseConfig as Config
+from app.throttle import TransferLease, TransferThrottled
+from app.quotas import QuotaExceeded, reserve, release, claim_part, unclaim_part
+
+# 异步传输服务（上传/下载的字节通道）
+#
+# WSGI 下每个进行中的传输占用一个线程，大量慢速客户端会耗尽线程池。
+# 这里每个传输只是一个协程：
+#   文件读写按块提交到专用线程池（TRANSFER_IO_THREADS），每块完成即归还线程，线程数与连接数无关；
+#   下载时上一块 send 完成（服务器的写缓冲降到水位以下）才读取下一块，慢速客户端不会让数据堆积在内存中；
+#   上传时写完一块才 receive 下一块，服务器在应用读取前会暂停从套接字读取。
+# 登录会话、模型、存储后端和限速与 Flask 应用共用；元数据操作（列表、改名、分片会话的创建与合并）仍由 Flask 处理。
+
+
+def _json(data):
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+async def send_json(send, status, data, headers=None):
+    await send_response(send, status, _json(data), headers, b'application/json')
+
+async def send_throttled(send, exc, headers=None):
+    retry = [(b'retry-after', str(exc.retry_after).encode())] if exc.retry_after else []
+    await send_json(send, 429, {'error': exc.description}, list(headers or []) + retry)
+
+
+# 数据库部分（在 run_sync 中以应用上下文执行）
+
+def load_download(user_id, file_id):
+    from app.models import File
+    from app.trash import file_in_trash
+    file = File.query.get(file_id)
+    if file is None or file.user_id != user_id or file_in_trash(file):
+        return None
+    return file.filepath, file.filename
+
+def load_upload_session(user_id, session_id):
+    from app.models import UploadSession
+    session = UploadSession.query.get(session_id)
+    if session is None or session.user_id != user_id:
+        return None
+    return session.key, session.upload_id
+
+# 检查整文件上传的目标，返回 (错误状态码, 错误信息, 存储键)
+def check_upload_target(user_id, folder_id, filename):
+    from app.models import Folder
+    from app.routes.files import allowed_file
+    from app.storage import get_storage, storage_key
+    if not filename or not allowed_file(filename):
+        return 400, '不支持的文件类型', None
+    if folder_id and Folder.query.filter_by(id=folder_id, user_id=user_id, deleted_at=None).first() is None:
+        return 404, '文件夹不存在或无访问权限', None
+    try:
+        key = storage_key(user_id, folder_id, filename)
+    except ValueError as e:
+        return 400, str(e), None
+    if get_storage().exists(key):
+        return 409, f'文件 "{filename}" 已存在', None
+    return None, None, key
+
+# 创建文件记录，预留的配额转为用量
+def record_upload(user_id, folder_id, filename, key, size, checksum, reserved=0):
+    from app import db
+    from app.models import File
+    from app.journal import record_change
+    from app.quotas import adjust
+    from app.foldersize import propagate
+    new_file = File(
+        filename=filename,
+        filepath=key,
+        filesize=size,
+        checksum=checksum,
+        checksum_verified_at=datetime.utcnow(),
+        user_id=user_id,
+        folder_id=folder_id
+    )
+    db.session.add(new_file)
+    db.session.flush()
+    record_change(user_id, 'file', new_file.id, 'upload', name=filename, parent_id=folder_id, size=size)
+    propagate(folder_id, size, 1)
+    adjust(user_id, used=size, reserved=-reserved)
+    db.session.commit()
+    return new_file.id
+
+
+# 请求体写入的临时文件，哈希计算与写入在 I/O 线程中进行
+class Spool:
+    def __init__(self, directory):
+        self.path = os.path.join(directory, f'{uuid.uuid4().hex}.spool')
+        self.file = open(self.path, 'wb')
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk):
+        self.hash.update(chunk)
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def discard(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class TransferApp(AsgiApp):
+    def __init__(self, flask_app):
+        super().__init__(flask_app)
+        self.io = ThreadPoolExecutor(Config.TRANSFER_IO_THREADS, thread_name_prefix='transfer-io')
+        self.shutdown_hooks.append(self._close)
+
+    async def _close(self):
+        self.io.shutdown(wait=False)
+
+    # 在 I/O 线程池中执行一次短小的文件操作
+    async def run_io(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.io, func, *args)
+
+    # 占用限速租约（获取共享存储时可能短暂阻塞，放到 I/O 线程中）
+    async def lease(self, user_id, direction):
+        lease = TransferLease(user_id, direction)
+        if lease.enabled:
+            await self.run_io(lease.acquire)
+        return lease
+
+    async def throttle(self, lease, nbytes):
+        wait = lease.charge(nbytes)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    # 接收请求体写入临时文件；超过 limit 字节或客户端断开时返回 None
+    async def receive_body(self, receive, lease, limit):
+        from app.storage import get_storage
+        spool = await self.run_io(Spool, get_storage().spool_dir() or tempfile.gettempdir())
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    await self.run_io(spool.discard)
+                    return None
+                chunk = message.get('body', b'')
+                if chunk:
+                    if spool.size + len(chunk) > limit:
+                        await self.run_io(spool.discard)
+                        return None
+                    await self.run_io(spool.write, chunk)
+                    await self.throttle(lease, len(chunk))
+                if not message.get('more_body'):
+                    break
+            await self.run_io(spool.close)
+            return spool
+        except BaseException:
+            await self.run_io(spool.discard)
+            raise
+
+
+# 解析单一范围请求，返回 (状态码, 起始, 结束) ；结束为闭区间
+def resolve_range(headers, obj):
+    start, end = 0, obj.size - 1
+    byte_range = parse_range_header(headers.get('range'))
+    if_range = headers.get('if-range')
+    # If-Range 只支持 ETag，不匹配时返回完整内容
+    if byte_range and len(byte_range.ranges) == 1 and (not if_range or if_range.strip('"') == obj.etag):
+        content_range = byte_range.make_content_range(obj.size)
+        if content_range is None:
+            return 416, None, None
+        return 206, content_range.start, content_range.stop - 1
+    return 200, start, end
+
+
+def create_transfer_app(flask_app):
+    transfer = TransferApp(flask_app)
+
+    # 下载: GET/HEAD /transfer/download/<文件ID>，支持 ETag / Range
+    @transfer.route(r'/transfer/download/(?P<file_id>\d+)', methods=('GET', 'HEAD'))
+    async def download(request, send, file_id):
+        from app.storage import get_storage
+        cors = request.cors_headers()
+        user_id = await request.user_id()
+        if user_id is None:
+            await send_json(send, 401, {'error': '请先登录'}, cors)
+            return
+        found = await transfer.run_sync(load_download, user_id, int(file_id))
+        if found is None:
+            await send_json(send, 404, {'error': '文件不存在'}, cors)
+            return
+        key, filename = found
+        storage = get_storage()
+        obj = await transfer.run_io(storage.stat, key)
+        if obj is None:
+            await send_json(send, 404, {'error': '文件不存在'}, cors)
+            return
+
+        disposition = Headers()
+        disposition.set('Content-Disposition', 'attachment', filename=filename)
+        headers = cors + [
+            (b'content-type', b'application/octet-stream'),
+            (b'etag', quote_etag(obj.etag).encode()),
+            (b'last-modified', http_date(obj.mtime).encode()),
+            (b'accept-ranges', b'bytes'),
+            (b'cache-control', b'private'),
+            (b'content-disposition', disposition['Content-Disposition'].encode('latin-1')),
+        ]
+        if parse_etags(request.headers.get('if-none-match')).contains(obj.etag):
+            await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        status, start, end = resolve_range(request.headers, obj)
+        if status == 416:
+            await send_response(send, 416, b'', cors + [(b'content-range', f'bytes */{obj.size}'.encode())])
+            return
+        if status == 206:
+            headers.append((b'content-range', ContentRange('bytes', start, end + 1, obj.size).to_header().encode()))
+        length = end - start + 1 if obj.size else 0
+
+        try:
+            lease = await transfer.lease(user_id, 'download')
+        except TransferThrottled as e:
+            await send_throttled(send, e, cors)
+            return
+        try:
+            await send({'type': 'http.response.start', 'status': status,
+                        'headers': headers + [(b'content-length', str(length).encode())]})
+            if request.scope['method'] == 'HEAD' or not length:
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            chunks = storage.iter_range(key, start, end, Config.TRANSFER_CHUNK_SIZE)
+            # ASGI 服务器在客户端断开后忽略 send，需要监听断开并停止读取
+            disconnect = asyncio.ensure_future(wait_disconnect(request.receive))
+            try:
+                while True:
+                    chunk = await transfer.run_io(next, chunks, None)
+                    if disconnect.done():
+                        return
+                    if chunk is None:
+                        break
+                    # send 在服务器写缓冲满时挂起，实现背压
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                    await transfer.throttle(lease, len(chunk))
+                await send({'type': 'http.response.body', 'body': b''})
+            finally:
+                disconnect.cancel()
+                await transfer.run_io(chunks.close)
+        finally:
+            lease.release()
+
+    # 整文件上传: PUT /transfer/upload?filename=<文件名>&folder_id=<文件夹ID>，请求体即文件内容
+    @transfer.route(r'/transfer/upload', methods=('PUT',))
+    async def upload(request, send):
+        from app.storage import get_storage
+        user_id = await request.user_id()
+        if user_id is None:
+            await send_json(send, 401, {'error': '请先登录'})
+            return
+        filename = (request.args.get('filename') or '').strip()
+        folder_id = request.args.get('folder_id') or None
+        if folder_id is not None and not folder_id.isdigit():
+            await send_json(send, 400, {'error': '文件夹ID无效'})
+            return
+        folder_id = int(folder_id) if folder_id else None
+        # 配额按 Content-Length 预留，必须在读取请求体之前声明大小
+        declared = request.headers.get('content-length')
+        if not declared or not declared.isdigit():
+            await send_json(send, 411, {'error': '需要 Content-Length'})
+            return
+        declared = int(declared)
+        if declared > Config.MAX_CONTENT_LENGTH:
+            await send_json(send, 413, {'error': '文件过大'})
+            return
+        status, error, key = await transfer.run_sync(check_upload_target, user_id, folder_id, filename)
+        if status:
+            await send_json(send, status, {'error': error})
+            return
+        if not await transfer.run_sync(reserve, user_id, declared):
+            await send_json(send, 413, {'error': QuotaExceeded.description})
+            return
+
+        recorded = False
+        try:
+            try:
+                lease = await transfer.lease(user_id, 'upload')
+            except TransferThrottled as e:
+                await send_throttled(send, e)
+                return
+            try:
+                spool = await transfer.receive_body(request.receive, lease, declared)
+            finally:
+                lease.release()
+            if spool is None:
+                await send_json(send, 413, {'error': '文件过大'})
+                return
+            size = await transfer.run_io(get_storage().put_file, key, spool.path)
+            file_id = await transfer.run_sync(record_upload, user_id, folder_id, filename, key, size,
+                                              spool.hash.hexdigest(), declared)
+            recorded = True
+        finally:
+            if not recorded:
+                await transfer.run_sync(release, user_id, declared)
+        await send_json(send, 201, {'file_id': file_id, 'size': size})
+
+    # 分片上传: PUT /transfer/upload-sessions/<会话ID>/parts/<序号>（会话的创建与合并仍走 Flask）
+    @transfer.route(r'/transfer/upload-sessions/(?P<session_id>\w+)/parts/(?P<part_number>\d+)', methods=('PUT',))
+    async def upload_part(request, send, session_id, part_number):
+        from app.storage import get_storage
+        user_id = await request.user_id()
+        if user_id is None:
+            await send_json(send, 401, {'error': '请先登录'})
+            return
+        part_number = int(part_number)
+        if not 1 <= part_number <= 10000:
+            await send_json(send, 400, {'error': '分片序号无效'})
+            return
+        declared = request.headers.get('content-length')
+        if not declared or not declared.isdigit() or int(declared) > Config.UPLOAD_PART_SIZE:
+            await send_json(send, 413, {'error': '分片大小无效'})
+            return
+        session = await transfer.run_sync(load_upload_session, user_id, session_id)
+        if session is None:
+            await send_json(send, 404, {'error': '上传会话不存在'})
+            return
+        key, upload_id = session
+        # 超出会话预留的分片在读取请求体之前拒绝
+        declared = int(declared)
+        if not await transfer.run_sync(claim_part, session_id, user_id, declared):
+            await send_json(send, 413, {'error': QuotaExceeded.description})
+            return
+
+        stored = False
+        try:
+            try:
+                lease = await transfer.lease(user_id, 'upload')
+            except TransferThrottled as e:
+                await send_throttled(send, e)
+                return
+            try:
+                spool = await transfer.receive_body(request.receive, lease, declared)
+            finally:
+                lease.release()
+            if spool is None:
+                await send_json(send, 413, {'error': '分片大小无效'})
+                return
+            etag = await transfer.run_io(_store_part, get_storage(), key, upload_id, part_number, spool)
+            stored = True
+        finally:
+            if not stored:
+                await transfer.run_sync(unclaim_part, session_id, declared)
+        await send_json(send, 200, {'part': part_number, 'etag': etag})
+
+    return transfer
+
+
+def _store_part(storage, key, upload_id, part_number, spool):
+    try:
+        with open(spool.path, 'rb') as f:
+            return storage.upload_part(key, upload_id, part_number, f)
+    finally:
+        spool.discard()
@@ -0,0 +1,209 @@
+import os
+from datetime import datetime
+from app import db
+from app.models import File, Folder, ShareLink, UploadSession, ArchiveIndex, LineIndex
+from app.config import BaseConfig as Config
+from app.journal import record_change
+from app.quotas import adjust
+from app.foldersize import propagate, move_totals
+from app.storage import get_storage, storage_key, folder_prefix, trash_key
+
+# 回收站
+#
+# 删除只在顶层条目上设置 deleted_at，与文件夹内容多少无关；
+# 子树中的条目保持原样，列表查询只列出未删除的直接子项，因此整个子树随之隐藏。
+# 单个文件移入回收站时存储对象改名为 <用户ID>/.trash/<文件ID>，腾出原文件名。
+# 超过 TRASH_RETENTION 的条目由 purge_trash 分批彻底删除。
+
+
+# 文件夹本身或任一祖先位于回收站中
+def folder_in_trash(folder):
+    current = folder
+    while current:
+        if current.deleted_at is not None:
+            return True
+        current = current.parent
+    return False
+
+def file_in_trash(file):
+    return file.deleted_at is not None or (file.folder is not None and folder_in_trash(file.folder))
+
+
+# 移入回收站后撤销指向该条目的分享链接。子孙文件夹上的分享在解析时由 folder_in_trash 拦截，
+# 不必逐个撤销；文件分享的下载按签名中的存储键直接发送、不查数据库，子树中文件上的分享需要一并撤销
+# （用户没有有效的文件分享时不遍历子树）。返回被撤销的分享ID，调用方提交后加入撤销缓存
+def _revoke_shares(user_id, file=None, folder=None):
+    active = ShareLink.query.filter(ShareLink.user_id == user_id, ShareLink.revoked.is_(False))
+    if file is not None:
+        links = active.filter(ShareLink.file_id == file.id).all()
+    else:
+        links = active.filter(ShareLink.folder_id == folder.id).all()
+        if active.filter(ShareLink.file_id.isnot(None)).first() is not None:
+            for chunk in _chunks(descendant_folder_ids(folder.id), 500):
+                links += active.join(File, ShareLink.file_id == File.id).filter(File.folder_id.in_(chunk)).all()
+    for link in links:
+        link.revoked = True
+    return [link.id for link in links]
+
+def trash_file(file):
+    get_storage().rename(file.filepath, trash_key(file.user_id, file.id))
+    file.filepath = trash_key(file.user_id, file.id)
+    file.deleted_at = datetime.utcnow()
+    propagate(file.folder_id, -(file.filesize or 0), -1)
+    revoked = _revoke_shares(file.user_id, file=file)
+    record_change(file.user_id, 'file', file.id, 'delete', name=file.filename, parent_id=file.folder_id)
+    return revoked
+
+def trash_folder(folder):
+    folder.deleted_at = datetime.utcnow()
+    # 子树的统计保留在文件夹上，只从祖先中扣除
+    move_totals(folder.id, folder.parent_id, None)
+    revoked = _revoke_shares(folder.user_id, folder=folder)
+    record_change(folder.user_id, 'folder', folder.id, 'delete', name=folder.name, parent_id=folder.parent_id)
+    return revoked
+
+
+# 目标位置有同名条目时追加序号: "a.txt" -> "a (1).txt"
+def free_name(name, exists):
+    if not exists(name):
+        return name
+    stem, ext = os.path.splitext(name)
+    n = 1
+    while exists(f'{stem} ({n}){ext}'):
+        n += 1
+    return f'{stem} ({n}){ext}'
+
+# 原所在文件夹已不存在或也在回收站中时，恢复到根目录
+def _restore_parent(user_id, folder_id):
+    if not folder_id:
+        return None
+    parent = Folder.query.filter_by(id=folder_id, user_id=user_id).first()
+    if parent is None or folder_in_trash(parent):
+        return None
+    return parent.id
+
+def restore_file(file):
+    folder_id = _restore_parent(file.user_id, file.folder_id)
+    name = free_name(file.filename, lambda n: File.query.filter_by(
+        user_id=file.user_id, folder_id=folder_id, filename=n, deleted_at=None).first() is not None)
+    key = storage_key(file.user_id, folder_id, name)
+    get_storage().rename(file.filepath, key)
+    old_parent_id = file.folder_id
+    file.folder_id, file.filename, file.filepath = folder_id, name, key
+    file.deleted_at = None
+    propagate(folder_id, file.filesize or 0, 1)
+    record_change(file.user_id, 'file', file.id, 'restore', name=name, parent_id=folder_id,
+                  old_parent_id=old_parent_id, size=file.filesize)
+
+# 文件夹的存储键按文件夹ID划分，恢复时无需移动任何对象
+def restore_folder(folder):
+    parent_id = _restore_parent(folder.user_id, folder.parent_id)
+    name = free_name(folder.name, lambda n: Folder.query.filter_by(
+        user_id=folder.user_id, parent_id=parent_id, name=n, deleted_at=None).first() is not None)
+    old_parent_id = folder.parent_id
+    folder.parent_id, folder.name = parent_id, name
+    folder.deleted_at = None
+    move_totals(folder.id, None, parent_id)
+    record_change(folder.user_id, 'folder', folder.id, 'restore', name=name, parent_id=parent_id,
+                  old_parent_id=old_parent_id)
+
+
+def _chunks(ids, size):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+# 获取文件夹及其所有子孙文件夹的ID（逐层查询，结果按层序排列）
+def descendant_folder_ids(folder_id):
+    ids = [folder_id]
+    level = [folder_id]
+    while level:
+        level = [row[0] for row in db.session.query(Folder.id).filter(Folder.parent_id.in_(level))]
+        ids.extend(level)
+    return ids
+
+# 按用户汇总文件大小，从用量中扣除（与删除文件记录在同一事务中）
+def _credit_files(file_filter):
+    rows = db.session.query(File.user_id, db.func.sum(File.filesize)).filter(file_filter).group_by(File.user_id)
+    for user_id, size in rows.all():
+        adjust(user_id, used=-(size or 0))
+
+# 彻底删除单个文件
+def purge_file(file_id, filepath):
+    get_storage().delete(filepath)
+    _credit_files(File.id == file_id)
+    ShareLink.query.filter_by(file_id=file_id).delete(synchronize_session=False)
+    ArchiveIndex.query.filter_by(file_id=file_id).delete(synchronize_session=False)
+    LineIndex.query.filter_by(file_id=file_id).delete(synchronize_session=False)
+    File.query.filter_by(id=file_id).delete(synchronize_session=False)
+    db.session.commit()
+
+# 彻底删除一个文件夹子树：先删存储，再按批删除数据库行（子文件夹先于父文件夹）
+def purge_folder(user_id, folder_id, batch_size=None):
+    batch_size = batch_size or Config.TRASH_PURGE_BATCH
+    storage = get_storage()
+    ids = descendant_folder_ids(folder_id)
+    for chunk in _chunks(ids, batch_size):
+        # 子树中单独移入回收站的文件不在文件夹前缀下
+        for row in db.session.query(File.filepath).filter(File.folder_id.in_(chunk), File.deleted_at.isnot(None)):
+            storage.delete(row.filepath)
+        for session in UploadSession.query.filter(UploadSession.folder_id.in_(chunk)).all():
+            try:
+                storage.abort_multipart(session.key, session.upload_id)
+            except Exception as e:
+                print(f"放弃分片上传失败 {session.id}: {str(e)}")
+            adjust(session.user_id, reserved=-session.reserved_bytes)
+            db.session.delete(session)
+    for sub_id in ids:
+        storage.delete_prefix(folder_prefix(user_id, sub_id))
+
+    for chunk in _chunks(ids, batch_size):
+        file_ids = db.session.query(File.id).filter(File.folder_id.in_(chunk))
+        ShareLink.query.filter(ShareLink.file_id.in_(file_ids)).delete(synchronize_session=False)
+        ArchiveIndex.query.filter(ArchiveIndex.file_id.in_(file_ids)).delete(synchronize_session=False)
+        LineIndex.query.filter(LineIndex.file_id.in_(file_ids)).delete(synchronize_session=False)
+        ShareLink.query.filter(ShareLink.folder_id.in_(chunk)).delete(synchronize_session=False)
+        _credit_files(File.folder_id.in_(chunk))
+        File.query.filter(File.folder_id.in_(chunk)).delete(synchronize_session=False)
+        db.session.commit()
+    for chunk in _chunks(ids[::-1], batch_size):
+        Folder.query.filter(Folder.id.in_(chunk)).delete(synchronize_session=False)
+    db.session.commit()
+
+# 清理超过保留期的回收站条目，返回 (文件数, 文件夹数)
+def purge_trash(retention=None, batch_size=None, job=None):
+    retention = retention or Config.TRASH_RETENTION
+    batch_size = batch_size or Config.TRASH_PURGE_BATCH
+    cutoff = datetime.utcnow() - retention
+    storage = get_storage()
+    purged_files = purged_folders = 0
+
+    while True:
+        rows = db.session.query(File.id, File.filepath).filter(
+            File.deleted_at.isnot(None), File.deleted_at < cutoff).limit(batch_size).all()
+        if not rows:
+            break
+        for row in rows:
+            storage.delete(row.filepath)
+        ids = [row.id for row in rows]
+        ShareLink.query.filter(ShareLink.file_id.in_(ids)).delete(synchronize_session=False)
+        ArchiveIndex.query.filter(ArchiveIndex.file_id.in_(ids)).delete(synchronize_session=False)
+        LineIndex.query.filter(LineIndex.file_id.in_(ids)).delete(synchronize_session=False)
+        _credit_files(File.id.in_(ids))
+        File.query.filter(File.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        purged_files += len(ids)
+        if job:
+            job.progress = f'已清理 {purged_files} 个文件'
+
+    while True:
+        rows = db.session.query(Folder.id, Folder.user_id).filter(
+            Folder.deleted_at.isnot(None), Folder.deleted_at < cutoff).limit(batch_size).all()
+        if not rows:
+            break
+        for row in rows:
+            purge_folder(row.user_id, row.id, batch_size)
+            purged_folders += 1
+            if job:
+                job.progress = f'已清理 {purged_files} 个文件，{purged_folders} 个文件夹'
+
+    return purged_files, purged_folders
@@ -0,0 +1,235 @@
+from datetime import datetime
+from app import db
+from app.models import File, Folder, ChangeJournal
+from app.config import BaseConfig as Config
+from app.journal import record_change
+from app.storage import get_storage, storage_key, folder_prefix
+from app.trash import free_name
+from app.quotas import QuotaExceeded, charge
+from app.foldersize import propagate, move_totals
+
+# 文件树操作：移动与复制
+#
+# 存储键按文件夹ID划分（<用户ID>/<文件夹ID>/<文件名>），因此：
+#   移动文件夹只改 parent_id，子树中的对象一个都不用动；
+#   移动文件只改名一个对象（本地磁盘上是 rename，对象存储上是服务端复制）。
+# 复制子树时文件夹按层批量插入，文件和变更日志用 INSERT ... SELECT 一次写入一批，
+# 不为每一行创建 ORM 对象；对象内容由存储后端在服务端/内核内复制。
+
+
+class TreeError(ValueError):
+    pass
+
+
+# 复制产生的数据计入配额（与复制的数据库修改在同一事务中）
+def _charge_copy(user_id, nbytes):
+    try:
+        charge(user_id, nbytes)
+    except QuotaExceeded as e:
+        raise TreeError(f'{e.description}，无法复制')
+
+
+def _chunks(ids, size):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+def _file_name_taken(user_id, folder_id, name):
+    return File.query.filter_by(user_id=user_id, folder_id=folder_id, filename=name,
+                                deleted_at=None).first() is not None
+
+def _folder_name_taken(user_id, parent_id, name):
+    return Folder.query.filter_by(user_id=user_id, parent_id=parent_id, name=name,
+                                  deleted_at=None).first() is not None
+
+# target 是否为 folder 本身或其子孙
+def _inside(target, folder):
+    current = target
+    while current:
+        if current.id == folder.id:
+            return True
+        current = current.parent
+    return False
+
+
+# 移动文件到 target（Folder 或 None 表示根目录）
+def move_file(file, target):
+    folder_id = target.id if target else None
+    if file.folder_id == folder_id:
+        return
+    if _file_name_taken(file.user_id, folder_id, file.filename):
+        raise TreeError(f'目标文件夹中已存在文件 "{file.filename}"')
+    key = storage_key(file.user_id, folder_id, file.filename)
+    get_storage().rename(file.filepath, key)
+    old_parent_id = file.folder_id
+    file.folder_id, file.filepath = folder_id, key
+    propagate(old_parent_id, -(file.filesize or 0), -1)
+    propagate(folder_id, file.filesize or 0, 1)
+    record_change(file.user_id, 'file', file.id, 'move', name=file.filename, parent_id=folder_id,
+                  old_parent_id=old_parent_id, size=file.filesize)
+
+# 移动文件夹：只修改 parent_id
+def move_folder(folder, target):
+    parent_id = target.id if target else None
+    if folder.parent_id == parent_id:
+        return
+    if target and _inside(target, folder):
+        raise TreeError('不能把文件夹移动到它自身或其子文件夹中')
+    if _folder_name_taken(folder.user_id, parent_id, folder.name):
+        raise TreeError(f'目标文件夹中已存在文件夹 "{folder.name}"')
+    old_parent_id = folder.parent_id
+    folder.parent_id = parent_id
+    move_totals(folder.id, old_parent_id, parent_id)
+    record_change(folder.user_id, 'folder', folder.id, 'move', name=folder.name, parent_id=parent_id,
+                  old_parent_id=old_parent_id)
+
+
+# 复制文件，重名时自动追加序号，返回新文件
+def copy_file(file, target):
+    folder_id = target.id if target else None
+    name = free_name(file.filename, lambda n: _file_name_taken(file.user_id, folder_id, n))
+    key = storage_key(file.user_id, folder_id, name)
+    _charge_copy(file.user_id, file.filesize or 0)
+    get_storage().copy(file.filepath, key)
+    new_file = File(
+        filename=name,
+        filepath=key,
+        filesize=file.filesize,
+        checksum=file.checksum,
+        checksum_verified_at=file.checksum_verified_at,
+        user_id=file.user_id,
+        folder_id=folder_id
+    )
+    db.session.add(new_file)
+    db.session.flush()
+    propagate(folder_id, new_file.filesize or 0, 1)
+    record_change(file.user_id, 'file', new_file.id, 'copy', name=name, parent_id=folder_id,
+                  size=new_file.filesize)
+    return new_file
+
+
+# 未删除的子树，按层返回文件夹ID列表（复制前先取完整快照，复制到自身子文件夹中时不会重复遍历新建的文件夹）
+def _subtree_levels(folder_id):
+    levels = [[folder_id]]
+    while True:
+        level = [row[0] for row in db.session.query(Folder.id).filter(
+            Folder.parent_id.in_(levels[-1]), Folder.deleted_at.is_(None))]
+        if not level:
+            return levels
+        levels.append(level)
+
+# 批量插入文件夹，返回与 params 顺序一致的新ID
+def _insert_folders(params):
+    dialect = db.engine.dialect
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        result = db.session.execute(
+            db.insert(Folder).returning(Folder.id, sort_by_parameter_order=True), params)
+        return list(result.scalars())
+    # 不支持批量 RETURNING 的数据库（如 MySQL）逐行插入
+    return [db.session.execute(db.insert(Folder).values(**p)).inserted_primary_key[0] for p in params]
+
+def _copy_objects(storage, user_id, mapping, old_ids):
+    rows = db.session.query(File.filepath, File.folder_id, File.filename).filter(
+        File.folder_id.in_(old_ids), File.deleted_at.is_(None))
+    for row in rows:
+        storage.copy(row.filepath, storage_key(user_id, mapping[row.folder_id], row.filename))
+
+def _insert_files(user_id, mapping, old_ids, now):
+    new_folder_id = db.case({old: mapping[old] for old in old_ids}, value=File.folder_id)
+    new_key = db.literal(f'{user_id}/') + db.cast(new_folder_id, db.String) + '/' + File.filename
+    db.session.execute(db.insert(File).from_select(
+        ['filename', 'filepath', 'filesize', 'upload_time', 'checksum', 'checksum_verified_at',
+         'checksum_mismatch', 'user_id', 'folder_id'],
+        db.select(File.filename, new_key, File.filesize, db.literal(now), File.checksum,
+                  File.checksum_verified_at, File.checksum_mismatch, db.literal(user_id), new_folder_id)
+        .where(File.folder_id.in_(old_ids), File.deleted_at.is_(None))
+    ))
+
+# 为新建的文件夹和文件批量写入变更日志
+def _journal_copies(user_id, new_ids, now):
+    columns = ['user_id', 'entity', 'entity_id', 'action', 'name', 'parent_id', 'size', 'created_at']
+    db.session.execute(db.insert(ChangeJournal).from_select(columns, db.select(
+        db.literal(user_id), db.literal('folder'), Folder.id, db.literal('copy'), Folder.name,
+        Folder.parent_id, db.literal(None, db.Integer), db.literal(now)
+    ).where(Folder.id.in_(new_ids)).order_by(Folder.id)))
+    db.session.execute(db.insert(ChangeJournal).from_select(columns, db.select(
+        db.literal(user_id), db.literal('file'), File.id, db.literal('copy'), File.filename,
+        File.folder_id, File.filesize, db.literal(now)
+    ).where(File.folder_id.in_(new_ids)).order_by(File.id)))
+
+# 复制文件夹子树到 target，返回新的顶层文件夹
+# 失败时回滚数据库并删除已复制的对象
+def copy_folder(folder, target):
+    user_id = folder.user_id
+    parent_id = target.id if target else None
+    batch_size = Config.TREE_COPY_BATCH
+    storage = get_storage()
+    now = datetime.utcnow()
+    levels = _subtree_levels(folder.id)
+    mapping = {}
+    old_ids = [old for level in levels for old in level]
+    total = 0
+    for chunk in _chunks(old_ids, batch_size):
+        total += db.session.query(db.func.coalesce(db.func.sum(File.filesize), 0)).filter(
+            File.folder_id.in_(chunk), File.deleted_at.is_(None)).scalar()
+    _charge_copy(user_id, total)
+
+    try:
+        for depth, level in enumerate(levels):
+            for chunk in _chunks(level, batch_size):
+                # 复制的正是不在回收站中的内容，副本的递归统计与原文件夹相同
+                rows = db.session.query(Folder.id, Folder.name, Folder.parent_id, Folder.total_bytes,
+                                        Folder.file_count).filter(Folder.id.in_(chunk)).order_by(Folder.id).all()
+                if depth == 0:
+                    name = free_name(folder.name, lambda n: _folder_name_taken(user_id, parent_id, n))
+                    params = [{'name': name, 'parent_id': parent_id, 'user_id': user_id, 'created_time': now,
+                               'total_bytes': rows[0].total_bytes, 'file_count': rows[0].file_count}]
+                else:
+                    params = [{'name': row.name, 'parent_id': mapping[row.parent_id], 'user_id': user_id,
+                               'created_time': now, 'total_bytes': row.total_bytes, 'file_count': row.file_count}
+                              for row in rows]
+                for row, new_id in zip(rows, _insert_folders(params)):
+                    mapping[row.id] = new_id
+
+        for chunk in _chunks(old_ids, batch_size):
+            _copy_objects(storage, user_id, mapping, chunk)
+            _insert_files(user_id, mapping, chunk, now)
+
+        new_ids = list(mapping.values())
+        for chunk in _chunks(new_ids, batch_size):
+            _journal_copies(user_id, chunk, now)
+        move_totals(mapping[folder.id], None, parent_id)
+        db.session.commit()
+    except Exception:
+        for new_id in mapping.values():
+            try:
+                storage.delete_prefix(folder_prefix(user_id, new_id))
+            except Exception as e:
+                print(f"清理复制失败的文件夹 {new_id} 失败: {str(e)}")
+        db.session.rollback()
+        raise
+
+    return db.session.get(Folder, mapping[folder.id])
+
+
+# 由文件夹行 (id, name, parent_id, deleted_at) 算出完整路径: {文件夹ID: 路径}，回收站中的子树为 None
+# 沿 parent_id 向上找到第一个已算出的祖先，再逐级向下拼接；不递归，层级很深时也不会栈溢出
+def folder_paths(rows, name=lambda n: n):
+    by_id = {row.id: row for row in rows}
+    paths = {}
+    for folder_id in by_id:
+        chain, seen = [], set()
+        current = folder_id
+        while current is not None and current not in paths:
+            row = by_id.get(current)
+            if row is None or row.deleted_at is not None or current in seen:
+                paths[current] = None  # 父文件夹不存在、位于回收站中或数据中有环
+                break
+            seen.add(current)
+            chain.append(row)
+            current = row.parent_id
+        parent = paths[current] if current is not None else ''
+        for row in reversed(chain):
+            if parent is not None:
+                parent = f'{parent}/{name(row.name)}' if parent else name(row.name)
+            paths[row.id] = parent
+    return {folder_id: paths[folder_id] for folder_id in by_id}
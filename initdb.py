@@ -1,17 +1,16 @@
-from app import create_app, db
-from app.models import User, File  # 导入新添加的File模型
+from app import create_app
+from app.migrations import upgrade, current_version
 import os
 
 # 创建应用实例
 app = create_app()
 
-# 在应用上下文中创建数据库表和上传目录
+# 在应用上下文中升级数据库结构并创建所需目录
 with app.app_context():
-    # 创建所有模型对应的表
-    db.create_all()
+    # 应用所有未执行的迁移（新数据库从头建表，旧数据库补齐缺少的表、列和索引）
+    upgrade()
     
-    # 创建文件上传目录
-    upload_dir = app.config['UPLOAD_FOLDER']
-    os.makedirs(upload_dir, exist_ok=True)
-    print("数据库表和上传目录创建成功！")
-    
\ No newline at end of file
+    # 创建文件上传、头像和管理员密钥目录
+    for key in ('UPLOAD_FOLDER', 'AVATAR_FOLDER', 'ADMIN_KEY_FOLDER'):
+        os.makedirs(app.config[key], exist_ok=True)
+    print(f"数据库结构已是版本 {current_version()}，上传目录创建成功！")
@@ -1,4 +1,6 @@
-from waitress import serve
-from run import app
+from app.server import serve
 
-serve(app, host='127.0.0.1', port=8080)
\ No newline at end of file
+# 生产环境入口：配置由 APP_CONFIG 选择，进程数、线程数等见 BaseConfig 中的 SERVER_* 配置
+# 等同于 flask --app run serve
+if __name__ == '__main__':
+    serve()
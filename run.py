@@ -1,6 +1,9 @@
+import os
 from app import create_app
+from app.config import BaseConfig, config
 
-app = create_app()
+# APP_CONFIG 可选 development / testing / production，未设置时使用 BaseConfig
+app = create_app(config.get(os.environ.get('APP_CONFIG'), BaseConfig))
 
 if __name__ == '__main__':
     # 打印所有注册的路由
@@ -0,0 +1,9 @@
+import uvicorn
+from run import app
+from app.push import create_push_app
+
+# 文件夹变更推送服务（与 Web 服务分开运行，可启动多个进程）
+push_app = create_push_app(app)
+
+if __name__ == '__main__':
+    uvicorn.run(push_app, host=app.config['PUSH_HOST'], port=app.config['PUSH_PORT'])
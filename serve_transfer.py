@@ -0,0 +1,9 @@
+import uvicorn
+from run import app
+from app.transfer import create_transfer_app
+
+# 异步传输服务：上传/下载的字节传输（与 Web 服务分开运行，可启动多个进程）
+transfer_app = create_transfer_app(app)
+
+if __name__ == '__main__':
+    uvicorn.run(transfer_app, host=app.config['TRANSFER_HOST'], port=app.config['TRANSFER_PORT'])
@@ -0,0 +1,19 @@
+import io
+import pytest
+from app.storage.local import LocalStorage
+
+
+def test_local_rename_does_not_overwrite(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    storage.put('1/a.txt', io.BytesIO(b'aaa'))
+    storage.put('1/b.txt', io.BytesIO(b'bbb'))
+    with pytest.raises(FileExistsError):
+        storage.rename('1/a.txt', '1/b.txt')
+    assert b''.join(storage.iter_range('1/b.txt')) == b'bbb'
+    assert storage.exists('1/a.txt')
+
+    storage.rename('1/a.txt', '1/sub/c.txt')
+    assert not storage.exists('1/a.txt')
+    assert b''.join(storage.iter_range('1/sub/c.txt')) == b'aaa'
+    storage.rename('1/sub/c.txt', '1/sub/c.txt')
+    assert storage.exists('1/sub/c.txt')
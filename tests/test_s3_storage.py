@@ -0,0 +1,170 @@
+import io
+import uuid
+import hashlib
+from datetime import datetime, timezone
+import pytest
+
+# S3 驱动：用内存中的替身代替 boto3 客户端（行为与 MinIO 一致的最小子集），不需要网络
+pytest.importorskip('boto3')
+from botocore.exceptions import ClientError  # noqa: E402
+from app.storage.s3 import S3Storage  # noqa: E402
+
+
+class _Body:
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+        self.closed = False
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+    def iter_chunks(self, chunk_size):
+        for chunk in iter(lambda: self.stream.read(chunk_size), b''):
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class _Paginator:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return self.pages(**kwargs)
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}   # (bucket, key) -> bytes
+        self.uploads = {}   # upload_id -> {part_number: bytes}
+        self.ranges = []
+
+    def _get(self, bucket, key, operation):
+        try:
+            return self.objects[(bucket, key)]
+        except KeyError:
+            raise ClientError({'Error': {'Code': '404' if operation == 'HeadObject' else 'NoSuchKey'}}, operation)
+
+    def upload_fileobj(self, fileobj, bucket, key):
+        data = b''.join(iter(lambda: fileobj.read(8192), b''))
+        self.objects[(bucket, key)] = data
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self._get(Bucket, Key, 'GetObject')
+        if Range:
+            self.ranges.append(Range)
+            if not data:
+                raise ClientError({'Error': {'Code': 'InvalidRange'}}, 'GetObject')
+            start, end = Range[len('bytes='):].split('-')
+            data = data[int(start):int(end) + 1 if end else None]
+        return {'Body': _Body(data)}
+
+    def head_object(self, Bucket, Key):
+        data = self._get(Bucket, Key, 'HeadObject')
+        return {'ContentLength': len(data), 'LastModified': datetime.now(timezone.utc),
+                'ETag': f'"{hashlib.md5(data).hexdigest()}"'}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete['Objects']:
+            self.objects.pop((Bucket, item['Key']), None)
+
+    def copy(self, source, bucket, key):
+        self.objects[(bucket, key)] = self._get(source['Bucket'], source['Key'], 'CopyObject')
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        numbers = [p['PartNumber'] for p in MultipartUpload['Parts']]
+        assert numbers == sorted(numbers)
+        self.objects[(Bucket, Key)] = b''.join(parts[n] for n in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+    def get_paginator(self, name):
+        if name == 'list_parts':
+            def pages(Bucket, Key, UploadId):
+                parts = self.uploads[UploadId]
+                yield {'Parts': [{'PartNumber': n, 'ETag': f'"{hashlib.md5(parts[n]).hexdigest()}"'}
+                                 for n in sorted(parts)]}
+            return _Paginator(pages)
+        if name == 'list_objects_v2':
+            def pages(Bucket, Prefix):
+                now = datetime.now(timezone.utc)
+                keys = sorted(k for b, k in self.objects if b == Bucket and k.startswith(Prefix))
+                for i in range(0, len(keys), 2):  # 每页两个，覆盖分页
+                    yield {'Contents': [{'Key': k, 'Size': len(self.objects[(Bucket, k)]), 'LastModified': now,
+                                         'ETag': '"x"'} for k in keys[i:i + 2]]}
+            return _Paginator(pages)
+        raise NotImplementedError(name)
+
+
+@pytest.fixture
+def s3():
+    storage = S3Storage('bucket', endpoint_url='http://127.0.0.1:9000', access_key='k', secret_key='s',
+                        region='us-east-1', prefix='files')
+    storage.client = FakeS3Client()
+    return storage
+
+
+def test_s3_put_and_stat(s3):
+    assert s3.put('1/a.txt', io.BytesIO(b'hello world')) == 11
+    assert ('bucket', 'files/1/a.txt') in s3.client.objects
+    assert s3.stat('1/a.txt').size == 11
+    assert s3.stat('1/missing.txt') is None
+    assert not s3.exists('1/missing.txt')
+
+
+def test_s3_iter_range(s3):
+    data = bytes(range(256)) * 40
+    s3.put('1/r.bin', io.BytesIO(data))
+    assert b''.join(s3.iter_range('1/r.bin')) == data
+    assert b''.join(s3.iter_range('1/r.bin', 100, 199, chunk_size=7)) == data[100:200]
+    assert b''.join(s3.iter_range('1/r.bin', 10000)) == data[10000:]
+    assert s3.client.ranges == ['bytes=100-199', 'bytes=10000-']
+
+
+def test_s3_iter_range_empty_object(s3):
+    s3.put('1/empty', io.BytesIO(b''))
+    assert b''.join(s3.iter_range('1/empty')) == b''
+    assert s3.client.ranges == []
+
+
+def test_s3_multipart_round_trip(s3):
+    upload_id = s3.create_multipart('1/big.bin')
+    # 分片乱序到达，合并时按序号拼接
+    s3.upload_part('1/big.bin', upload_id, 2, io.BytesIO(b'B' * 5))
+    s3.upload_part('1/big.bin', upload_id, 1, io.BytesIO(b'A' * 10))
+    s3.upload_part('1/big.bin', upload_id, 3, io.BytesIO(b'C'))
+    assert s3.complete_multipart('1/big.bin', upload_id) == 16
+    assert b''.join(s3.iter_range('1/big.bin')) == b'A' * 10 + b'B' * 5 + b'C'
+    assert not s3.client.uploads
+
+    upload_id = s3.create_multipart('1/gone.bin')
+    s3.upload_part('1/gone.bin', upload_id, 1, io.BytesIO(b'x'))
+    s3.abort_multipart('1/gone.bin', upload_id)
+    assert not s3.client.uploads and s3.stat('1/gone.bin') is None
+
+
+def test_s3_list_rename_delete_prefix(s3):
+    for name in ('1/d/a', '1/d/b', '1/d/c', '2/x'):
+        s3.put(name, io.BytesIO(name.encode()))
+    assert [key for key, _ in s3.list('1/')] == ['1/d/a', '1/d/b', '1/d/c']
+    with pytest.raises(FileExistsError):
+        s3.rename('1/d/a', '1/d/b')
+    s3.rename('1/d/a', '1/e/a')
+    assert s3.stat('1/d/a') is None and b''.join(s3.iter_range('1/e/a')) == b'1/d/a'
+    s3.delete_prefix('1/d')
+    assert [key for key, _ in s3.list('')] == ['1/e/a', '2/x']